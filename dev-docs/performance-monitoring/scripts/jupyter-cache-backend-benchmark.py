@@ -0,0 +1,143 @@
+# Benchmark the Jupyter execution cache backends: the time to import each
+# backend and open its cache, and the time to satisfy a notebook from a warm
+# cache.
+#
+# Usage: python jupyter-cache-backend-benchmark.py [--cells 200] [--runs 5]
+#
+# Must be run with a python that has the Quarto Jupyter dependencies
+# (nbformat, nbclient, jupyter_client, pyyaml) installed. The jupyter-cache
+# backend is skipped if jupyter-cache isn't installed.
+
+import argparse
+import copy
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import nbformat
+
+JUPYTER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "..",
+    "src",
+    "resources",
+    "jupyter",
+)
+sys.path.insert(0, JUPYTER_DIR)
+
+# the execution options that are part of the cache keys
+OPTIONS = dict(eval=True, allow_errors=False, params=None)
+
+
+# time to import a backend and open its cache in a fresh interpreter (that
+# has already imported notebook.py, as the execute process has)
+def open_time(open_code, dir):
+    code = "\n".join(
+        [
+            "import sys, time",
+            "import notebook",
+            "start = time.perf_counter()",
+            open_code,
+            "print(time.perf_counter() - start)",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code, dir],
+        cwd=JUPYTER_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip())
+
+
+# an executed notebook (w/ a setup cell) and the same notebook w/o outputs
+def make_notebooks(cells):
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = {
+        "name": "python3",
+        "language": "python",
+        "display_name": "Python 3",
+    }
+    nb.metadata.language_info = {"name": "python"}
+    nb.cells = [nbformat.v4.new_code_cell("# setup", execution_count=1)]
+    for i in range(cells):
+        cell = nbformat.v4.new_code_cell(f"print({i})", execution_count=i + 2)
+        cell.outputs = [nbformat.v4.new_output("stream", name="stdout", text=f"{i}\n")]
+        nb.cells.append(cell)
+    source = copy.deepcopy(nb)
+    for cell in source.cells:
+        cell.outputs = []
+        cell.execution_count = None
+    return nb, source
+
+
+def lookup_native(dir, executed, source, runs):
+    from cache import CellCache
+    from notebook import nb_from_cell_cache, nb_to_cell_cache
+
+    nb_to_cell_cache(executed, CellCache(dir), OPTIONS)
+    times = []
+    for _ in range(runs):
+        nb = copy.deepcopy(source)
+        start = time.perf_counter()
+        assert nb_from_cell_cache(nb, CellCache(dir), OPTIONS)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def lookup_jupyter_cache(dir, executed, source, runs):
+    from jupyter_cache import get_cache
+    from notebook import nb_from_cache
+
+    path = os.path.join(dir, "executed.ipynb")
+    nbformat.write(executed, path)
+    get_cache(dir).cache_notebook_file(path=path, overwrite=True)
+    times = []
+    for _ in range(runs):
+        nb = copy.deepcopy(source)
+        start = time.perf_counter()
+        assert nb_from_cache(nb, get_cache(dir))
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    executed, source = make_notebooks(args.cells)
+    backends = [
+        (
+            "native",
+            "from cache import CellCache; CellCache(sys.argv[1]).get_notebook('')",
+            lookup_native,
+        ),
+        (
+            "jupyter-cache",
+            "from jupyter_cache import get_cache; get_cache(sys.argv[1]).list_cache_records()",
+            lookup_jupyter_cache,
+        ),
+    ]
+    print(f"{args.cells} code cells")
+    for name, open_code, lookup in backends:
+        with tempfile.TemporaryDirectory() as dir:
+            opened = open_time(open_code, dir)
+            if opened is None:
+                print(f"{name:>14}: not installed")
+                continue
+            elapsed = lookup(dir, executed, source, args.runs)
+        print(
+            f"{name:>14}: import/open {opened * 1000:.1f}ms, lookup {elapsed * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
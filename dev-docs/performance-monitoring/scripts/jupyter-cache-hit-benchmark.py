@@ -0,0 +1,139 @@
+# Benchmark the Jupyter cache hit path: merging the cached outputs into the
+# notebook and writing it, before (deep copy, pop(0) per code cell, and a
+# validating nbformat.write) and after (nb_merge_cached and nb_write).
+# Each variant runs in its own process so that peak memory can be compared,
+# and the two files are read back with nbformat to check that they match.
+#
+# Usage: python jupyter-cache-hit-benchmark.py [--cells 1000] [--output-mb 500]
+#
+# Must be run with a python that has the Quarto Jupyter dependencies
+# (nbformat, nbclient, jupyter_client, pyyaml) installed.
+
+import argparse
+import base64
+import copy
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import nbformat
+
+JUPYTER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "..",
+    "src",
+    "resources",
+    "jupyter",
+)
+sys.path.insert(0, JUPYTER_DIR)
+
+NB_META = ("kernelspec", "language_info", "widgets")
+
+
+# the source notebook (w/ a setup cell) and the cached notebook (w/ outputs)
+def make_notebooks(cells, output_mb):
+    image = base64.b64encode(os.urandom(int(output_mb * 1024 * 1024 * 3 / 4 / cells)))
+    image = image.decode("ascii")
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = {
+        "name": "python3",
+        "language": "python",
+        "display_name": "Python 3",
+    }
+    nb.cells = [nbformat.v4.new_code_cell("# setup")]
+    for i in range(cells):
+        if i % 4 == 0:
+            nb.cells.append(nbformat.v4.new_markdown_cell(f"## Section {i}"))
+        nb.cells.append(nbformat.v4.new_code_cell(f"plot({i})"))
+    # jupyter-cache stores only the code cells
+    cache_nb = copy.deepcopy(nb)
+    cache_nb.metadata.language_info = {"name": "python"}
+    cache_nb.cells = [cell for cell in cache_nb.cells if cell.cell_type == "code"]
+    for cell in cache_nb.cells[1:]:
+        cell.outputs = [
+            nbformat.v4.new_output("display_data", data={"image/png": image})
+        ]
+    return nb, cache_nb
+
+
+def hit_before(nb, cache_nb, path):
+    nb = copy.deepcopy(nb)
+    for key in NB_META:
+        if key in cache_nb.metadata:
+            nb.metadata[key] = cache_nb.metadata[key]
+    for idx in range(len(nb.cells)):
+        if nb.cells[idx].cell_type == "code":
+            nb.cells[idx] = cache_nb.cells.pop(0)
+    nb.cells.pop(0)
+    nbformat.write(nb, path, version=4)
+
+
+def hit_after(nb, cache_nb, path):
+    from notebook import nb_merge_cached, nb_write
+
+    nb = nb_merge_cached(nb, cache_nb, NB_META)
+    nb.cells.pop(0)
+    nb_write(nb, path)
+
+
+def run_variant(variant, input, output):
+    nb = nbformat.read(input, as_version=4)
+    cache_nb = nbformat.read(input + ".cache", as_version=4)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    (hit_before if variant == "before" else hit_after)(nb, cache_nb, output)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on linux (bytes on macOS)
+    scale = 1024 if sys.platform.startswith("linux") else 1
+    print(f"{elapsed} {(peak - before) * scale}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=1000)
+    parser.add_argument("--output-mb", type=float, default=500)
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.input, args.input + "." + args.variant)
+        return
+
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "bench.ipynb")
+        nb, cache_nb = make_notebooks(args.cells, args.output_mb)
+        nbformat.write(nb, input)
+        nbformat.write(cache_nb, input + ".cache")
+        del nb, cache_nb
+
+        results = dict()
+        for variant in ["before", "after"]:
+            output = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--input", input],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.split()
+            results[variant] = (float(output[0]), int(output[1]))
+
+        same = nbformat.read(input + ".before", as_version=4) == nbformat.read(
+            input + ".after", as_version=4
+        )
+
+    print(f"{args.cells} code cells, {args.output_mb:.0f} MB of outputs")
+    for variant, (elapsed, memory) in results.items():
+        print(
+            f"{variant:>8}: {elapsed:.2f}s, {memory / 1024 / 1024:.0f} MB additional peak memory"
+        )
+    print(f"{'notebook':>8}: {'same' if same else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Benchmark reading a notebook w/ large stale outputs for execution, before
+# (nbformat.read, w/ the outputs cleared afterwards as execution does) and
+# after (read_notebook, which drops them while parsing). Each variant runs in
+# its own process so that peak memory can be compared.
+#
+# Usage: python jupyter-read-benchmark.py [--cells 1000] [--output-mb 500]
+#
+# Must be run with a python that has the Quarto Jupyter dependencies
+# (nbformat, nbclient, jupyter_client, pyyaml) installed.
+
+import argparse
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import nbformat
+
+JUPYTER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "..",
+    "src",
+    "resources",
+    "jupyter",
+)
+sys.path.insert(0, JUPYTER_DIR)
+
+
+# a notebook w/ an image output per code cell
+def make_notebook(cells, output_mb):
+    image = base64.b64encode(os.urandom(int(output_mb * 1024 * 1024 * 3 / 4 / cells)))
+    image = image.decode("ascii")
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = {
+        "name": "python3",
+        "language": "python",
+        "display_name": "Python 3",
+    }
+    for i in range(cells):
+        if i % 4 == 0:
+            nb.cells.append(nbformat.v4.new_markdown_cell(f"## Section {i}"))
+        cell = nbformat.v4.new_code_cell(f"plot({i})", execution_count=i + 1)
+        cell.outputs = [
+            nbformat.v4.new_output("display_data", data={"image/png": image})
+        ]
+        nb.cells.append(cell)
+    return nb
+
+
+def read_before(path):
+    from notebook import cell_clear_output
+
+    nb = nbformat.read(path, as_version=4)
+    for cell in nb.cells:
+        cell_clear_output(cell)
+    return nb
+
+
+def read_after(path):
+    from notebook import cell_clear_output
+    from nbreader import read_notebook
+
+    nb = read_notebook(path, 4)
+    for cell in nb.cells:
+        cell_clear_output(cell)
+    return nb
+
+
+def run_variant(variant, input):
+    # (import before measuring)
+    import notebook  # noqa: F401
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    nb = (read_before if variant == "before" else read_after)(input)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    nbformat.write(nb, input + "." + variant)
+    # ru_maxrss is KB on linux (bytes on macOS)
+    scale = 1024 if sys.platform.startswith("linux") else 1
+    print(f"{elapsed} {(peak - before) * scale}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=1000)
+    parser.add_argument("--output-mb", type=float, default=500)
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant == "make":
+        nbformat.write(make_notebook(args.cells, args.output_mb), args.input)
+        return
+    elif args.variant:
+        run_variant(args.variant, args.input)
+        return
+
+    with tempfile.TemporaryDirectory() as dir:
+        # (the notebook is made in another process as the variants would
+        # otherwise inherit the peak memory this process reached doing it)
+        input = os.path.join(dir, "bench.ipynb")
+        subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--variant",
+                "make",
+                "--input",
+                input,
+                "--cells",
+                str(args.cells),
+                "--output-mb",
+                str(args.output_mb),
+            ],
+            check=True,
+        )
+
+        results = dict()
+        for variant in ["before", "after"]:
+            output = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--input", input],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.split()
+            results[variant] = (float(output[0]), int(output[1]))
+
+        with (
+            open(input + ".before", "rb") as before,
+            open(input + ".after", "rb") as after,
+        ):
+            identical = before.read() == after.read()
+
+    print(f"{args.cells} code cells, {args.output_mb:.0f} MB of outputs")
+    for variant, (elapsed, memory) in results.items():
+        print(
+            f"{variant:>8}: {elapsed:.2f}s, {memory / 1024 / 1024:.0f} MB additional peak memory"
+        )
+    print(f"{'notebook':>8}: {'identical' if identical else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Benchmark the Python setup cell: the time to execute it in a fresh kernel
+# and then the time of a cell that imports a library it configures. Compares
+# the setup cell at a git revision ("before") with the working tree
+# ("after"). Each run uses a new kernel.
+#
+# Usage: python jupyter-setup-import-benchmark.py --rev <git-rev> [--runs 5]
+#          [--import "import matplotlib.pyplot"]
+#
+# Must be run with a python that has jupyter_client and ipykernel installed
+# (the kernel is started w/ the same python) along w/ the libraries the
+# setup cell configures (matplotlib, plotly, pandas) for the numbers to be
+# meaningful.
+
+import argparse
+import base64
+import os
+import statistics
+import subprocess
+import time
+
+from jupyter_client.manager import start_new_kernel
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+SETUP_PATH = "src/resources/jupyter/lang/python/setup.py"
+
+OPTIONS = dict(
+    fig_width=7,
+    fig_height=5,
+    fig_format="png",
+    fig_dpi=96,
+    interactivity="",
+    is_shiny=False,
+    is_dashboard=False,
+    plotly_connected=True,
+    reset_strategy="full",
+    run_path=base64.b64encode(b"").decode("utf-8"),
+)
+
+
+def setup_source(rev):
+    if rev:
+        source = subprocess.run(
+            ["git", "show", f"{rev}:{SETUP_PATH}"],
+            cwd=REPO_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    else:
+        with open(os.path.join(REPO_DIR, SETUP_PATH), "r") as file:
+            source = file.read()
+    return source.format(**OPTIONS)
+
+
+def execute(kc, code):
+    start = time.perf_counter()
+    msg_id = kc.execute(code, store_history=False, allow_stdin=False)
+    reply = kc.get_shell_msg(timeout=120)
+    while reply["parent_header"].get("msg_id") != msg_id:
+        reply = kc.get_shell_msg(timeout=120)
+    if reply["content"]["status"] != "ok":
+        raise RuntimeError(reply["content"].get("evalue", "execution failed"))
+    return time.perf_counter() - start
+
+
+def measure(source, import_code, runs):
+    setup = []
+    imports = []
+    for _ in range(runs):
+        km, kc = start_new_kernel(kernel_name="python3")
+        try:
+            setup.append(execute(kc, source))
+            imports.append(execute(kc, import_code))
+        finally:
+            kc.stop_channels()
+            km.shutdown_kernel(now=True)
+    return statistics.median(setup), statistics.median(imports)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rev", required=True)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import", dest="import_code", default="import sys")
+    args = parser.parse_args()
+
+    print(f"{args.runs} runs, then: {args.import_code}")
+    for name, rev in [("before", args.rev), ("after", None)]:
+        setup, imports = measure(setup_source(rev), args.import_code, args.runs)
+        print(f"{name:>8}: setup {setup * 1000:.0f}ms, import {imports * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Benchmark writing an intermediate notebook with large outputs, before
+# (a validating nbformat.write) and after (nb_write). Each variant runs in
+# its own process so that peak memory can be compared, and the two files
+# are read back with nbformat to check that they hold the same notebook.
+#
+# Usage: python jupyter-write-benchmark.py [--cells 1000] [--output-mb 500]
+#
+# Must be run with a python that has the Quarto Jupyter dependencies
+# (nbformat, nbclient, jupyter_client, pyyaml) installed.
+
+import argparse
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import nbformat
+
+JUPYTER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "..",
+    "src",
+    "resources",
+    "jupyter",
+)
+sys.path.insert(0, JUPYTER_DIR)
+
+
+# an executed notebook w/ an image and some text output per code cell
+def make_notebook(cells, output_mb):
+    image = base64.b64encode(os.urandom(int(output_mb * 1024 * 1024 * 3 / 4 / cells)))
+    image = image.decode("ascii")
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = {
+        "name": "python3",
+        "language": "python",
+        "display_name": "Python 3",
+    }
+    for i in range(cells):
+        if i % 4 == 0:
+            nb.cells.append(
+                nbformat.v4.new_markdown_cell(f"## Section {i}\n\nSome text.")
+            )
+        cell = nbformat.v4.new_code_cell(f"x = {i}\nplot(x)", execution_count=i + 1)
+        cell.outputs = [
+            nbformat.v4.new_output(
+                "stream", name="stdout", text=f"plotting {i}\ndone\n"
+            ),
+            nbformat.v4.new_output(
+                "display_data",
+                data={"image/png": image, "text/plain": "<Figure size 640x480>"},
+            ),
+        ]
+        nb.cells.append(cell)
+    return nb
+
+
+def write_before(nb, path):
+    nbformat.write(nb, path, version=4)
+
+
+def write_after(nb, path):
+    from notebook import nb_write
+
+    nb_write(nb, path)
+
+
+def run_variant(variant, input, output):
+    nb = nbformat.read(input, as_version=4)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    (write_before if variant == "before" else write_after)(nb, output)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on linux (bytes on macOS)
+    scale = 1024 if sys.platform.startswith("linux") else 1
+    print(f"{elapsed} {(peak - before) * scale} {os.path.getsize(output)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=1000)
+    parser.add_argument("--output-mb", type=float, default=500)
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.input, args.input + "." + args.variant)
+        return
+
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "bench.ipynb")
+        nbformat.write(make_notebook(args.cells, args.output_mb), input)
+
+        results = dict()
+        for variant in ["before", "after"]:
+            output = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--input", input],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.split()
+            results[variant] = (float(output[0]), int(output[1]), int(output[2]))
+
+        same = nbformat.read(input + ".before", as_version=4) == nbformat.read(
+            input + ".after", as_version=4
+        )
+
+    print(f"{args.cells} code cells, {args.output_mb:.0f} MB of outputs")
+    for variant, (elapsed, memory, size) in results.items():
+        print(
+            f"{variant:>8}: {elapsed:.2f}s, {memory / 1024 / 1024:.0f} MB additional peak memory, "
+            f"{size / 1024 / 1024:.0f} MB file"
+        )
+    print(f"{'notebook':>8}: {'same' if same else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
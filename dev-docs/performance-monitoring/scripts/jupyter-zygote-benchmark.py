@@ -0,0 +1,122 @@
+# Benchmark oneshot Jupyter execution (`jupyter.py` with the `execute` command)
+# with and without the zygote process (QUARTO_JUPYTER_ZYGOTE).
+#
+# Usage: python jupyter-zygote-benchmark.py [--runs N] [--kernel python3]
+#
+# Must be run with a python that has the Quarto Jupyter dependencies
+# (nbformat, nbclient, jupyter_client, pyyaml) and the given kernel installed.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import nbformat
+
+JUPYTER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "..",
+    "src",
+    "resources",
+    "jupyter",
+)
+RESOURCE_DIR = os.path.dirname(os.path.normpath(JUPYTER_DIR))
+
+
+def write_notebook(path, kernel):
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = {
+        "name": kernel,
+        "language": "python",
+        "display_name": kernel,
+    }
+    nb.cells = [nbformat.v4.new_code_cell("x = 1\nx")]
+    nbformat.write(nb, path)
+
+
+def execute_request(input, log):
+    execute = {
+        "eval": True,
+        "error": False,
+        "fig-width": 7,
+        "fig-height": 5,
+        "fig-format": "png",
+        "fig-dpi": 96,
+        "ipynb-shell-interactivity": None,
+        "plotly-connected": True,
+        "cache": "user",
+    }
+    options = {
+        "target": {"input": input},
+        "resourceDir": RESOURCE_DIR,
+        "log": log,
+        "debug": False,
+        "quiet": True,
+        "format": {
+            "execute": execute,
+            "metadata": {},
+            "identifier": {"base-format": "html"},
+        },
+    }
+    return json.dumps({"command": "execute", "options": options})
+
+
+def run(input, log, env):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(JUPYTER_DIR, "jupyter.py")],
+        input=execute_request(input, log).encode("utf-8"),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--kernel", default="python3")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "bench.ipynb")
+        log = os.path.join(dir, "jupyter.log")
+        write_notebook(input, args.kernel)
+
+        env = dict(os.environ)
+        env.pop("QUARTO_JUPYTER_ZYGOTE", None)
+        direct = [run(input, log, env) for _ in range(args.runs)]
+
+        # the first execute starts the zygote, wait for its socket
+        zygote = os.path.join(dir, "zygote.sock")
+        env["QUARTO_JUPYTER_ZYGOTE"] = zygote
+        run(input, log, env)
+        for _ in range(100):
+            if os.path.exists(zygote):
+                break
+            time.sleep(0.1)
+        forked = [run(input, log, env) for _ in range(args.runs)]
+
+        # ask the zygote to exit by removing its socket
+        os.remove(zygote)
+
+    def report(label, times):
+        print(
+            f"{label:>10}: mean {sum(times) / len(times):.3f}s, min {min(times):.3f}s"
+        )
+
+    report("direct", direct)
+    report("zygote", forked)
+    saved = (sum(direct) - sum(forked)) / len(direct)
+    print(f"{'saved':>10}: {saved:.3f}s per execution")
+
+
+if __name__ == "__main__":
+    main()
@@ -122,7 +122,7 @@ export async function executeKernelKeepalive(
             } else if (msg.type == "restart") {
               trace(options, "Restart request received");
               return executeKernelKeepalive(options);
-            } else {
+            } else if (msg.type === "status") {
               info(msg.data, { newline: false });
             }
           } catch {
@@ -435,6 +435,7 @@ async function connectToKernel(
     timeout,
     type,
     debug,
+    kernelspec: options.kernelspec,
   }, options.kernelspec);
   if (!result.success) {
     return Promise.reject();
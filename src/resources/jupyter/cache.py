@@ -0,0 +1,590 @@
+# pyright: reportMissingImports=false
+
+import os
+import re
+import json
+import mmap
+import sqlite3
+import hashlib
+import tempfile
+import time
+
+# file locking (fcntl on posix, msvcrt on windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# bumped when the database schema changes (older databases are discarded)
+SCHEMA_VERSION = 4
+
+
+# native (per-cell) execution cache. the outputs of each executed cell are
+# stored under a key that chains the hash of the cell with the key of the
+# cell that executed before it, so a cell's key changes whenever it or
+# anything executed before it changes. notebook entries record the notebook
+# level metadata (language_info, widgets) for a complete chain of cells along
+# w/ a fingerprint of the kernel environment that executed it. cells and
+# kernel namespace checkpoints also refer to the fingerprint of the
+# environment they were produced in (fingerprints are stored once each).
+#
+# keys and notebook metadata are kept in a sqlite database (cells.db) and
+# cell entries (outputs) in content-addressed blob files (so identical
+# outputs are stored once) that are read through mmap. the database also
+# records when each entry was last used (for least recently used eviction)
+# along with hit/miss statistics.
+#
+# several processes can share a cache: blobs are published atomically and
+# never modified, sqlite serializes database updates, and writers (which
+# may be evicting blobs that another writer is about to reference) hold an
+# exclusive lock on cells.lock
+class CellCache:
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+
+    @property
+    def db(self):
+        return self.open()
+
+    # connect to the database (once per cache)
+    def open(self):
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            with CacheLock(os.path.join(self.path, "cells.lock")):
+                self.connection = self.connect()
+        return self.connection
+
+    def connect(self):
+        connection = sqlite3.connect(os.path.join(self.path, "cells.db"), timeout=60)
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                for table in [
+                    "cells",
+                    "blobs",
+                    "notebooks",
+                    "checkpoints",
+                    "environments",
+                    "stats",
+                ]:
+                    connection.execute("DROP TABLE IF EXISTS " + table)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cells "
+                "(key TEXT PRIMARY KEY, blob TEXT NOT NULL, environment TEXT, "
+                "accessed REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs "
+                "(blob TEXT PRIMARY KEY, size INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS notebooks "
+                "(key TEXT PRIMARY KEY, metadata TEXT NOT NULL, environment TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints "
+                "(key TEXT PRIMARY KEY, size INTEGER NOT NULL, environment TEXT, "
+                "accessed REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS environments "
+                "(id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS stats "
+                "(name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+        return connection
+
+    # (connect before locking, connecting takes the lock too)
+    def lock(self):
+        self.open()
+        return CacheLock(os.path.join(self.path, "cells.lock"))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get_cell(self, key):
+        return self.get_cells([key]).get(key, None)
+
+    # entries for the given keys (keys w/o an entry are omitted). each entry
+    # has the fingerprint of the environment it was cached from (if any)
+    def get_cells(self, keys):
+        rows = dict()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            rows.update(
+                (key, (blob, environment))
+                for key, blob, environment in self.db.execute(
+                    "SELECT key, blob, environment FROM cells "
+                    "WHERE key IN ({0})".format(",".join("?" * len(batch))),
+                    batch,
+                )
+            )
+        environments = self.get_environments(
+            environment for _, environment in rows.values()
+        )
+        entries = dict()
+        for key, (blob, environment) in rows.items():
+            entry = self.read_blob(blob)
+            if entry is not None:
+                entry["environment"] = environments.get(environment)
+                entries[key] = entry
+        if entries:
+            now = time.time()
+            with self.db:
+                self.db.executemany(
+                    "UPDATE cells SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in entries.keys()],
+                )
+        return entries
+
+    def put_cell(self, key, entry, environment=None):
+        self.put_cells([(key, entry)], environment)
+
+    # cache cell entries produced in the environment w/ the given fingerprint
+    def put_cells(self, entries, environment=None):
+        with self.lock():
+            self.insert_cells(entries, environment)
+
+    def insert_cells(self, entries, environment=None):
+        cells = [(key, self.write_blob(entry)) for key, entry in entries]
+        now = time.time()
+        with self.db:
+            id = self.insert_environment(environment)
+            self.db.executemany(
+                "INSERT OR IGNORE INTO blobs (blob, size) VALUES (?, ?)",
+                [blob for _, blob in cells],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO cells (key, blob, environment, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                [(key, blob, id, now) for key, (blob, _) in cells],
+            )
+
+    # environment fingerprints by id (ids w/o a fingerprint are omitted)
+    def get_environments(self, ids):
+        ids = list(set(id for id in ids if id is not None))
+        environments = dict()
+        for start in range(0, len(ids), 500):
+            batch = ids[start : start + 500]
+            rows = self.db.execute(
+                "SELECT id, fingerprint FROM environments WHERE id IN ({0})".format(
+                    ",".join("?" * len(batch))
+                ),
+                batch,
+            )
+            environments.update(
+                (id, json.loads(fingerprint)) for id, fingerprint in rows
+            )
+        return environments
+
+    # store a fingerprint (call in a transaction). returns its id
+    def insert_environment(self, environment):
+        if not environment:
+            return None
+        fingerprint = json.dumps(environment, sort_keys=True)
+        id = hash_text(fingerprint)
+        self.db.execute(
+            "INSERT OR IGNORE INTO environments (id, fingerprint) VALUES (?, ?)",
+            (id, fingerprint),
+        )
+        return id
+
+    def get_notebook(self, key):
+        row = self.db.execute(
+            "SELECT metadata, environment FROM notebooks WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        return {"metadata": json.loads(row[0]), "environment": json.loads(row[1])}
+
+    def put_notebook(self, key, entry):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO notebooks (key, metadata, environment) "
+                "VALUES (?, ?, ?)",
+                (
+                    key,
+                    json.dumps(entry["metadata"]),
+                    json.dumps(entry.get("environment")),
+                ),
+            )
+
+    # kernel namespace checkpoints are written by the kernel itself
+    def checkpoint_path(self, key):
+        return self.entry_path("checkpoints", key, ".pickle")
+
+    def has_checkpoint(self, key):
+        return os.path.exists(self.checkpoint_path(key))
+
+    # record a checkpoint written by the kernel in the environment w/ the
+    # given fingerprint
+    def put_checkpoint(self, key, environment=None):
+        try:
+            size = os.path.getsize(self.checkpoint_path(key))
+        except OSError:
+            return
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, size, environment, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, size, self.insert_environment(environment), time.time()),
+            )
+
+    # record that a checkpoint was used
+    def touch_checkpoint(self, key):
+        with self.db:
+            self.db.execute(
+                "UPDATE checkpoints SET accessed = ? WHERE key = ?",
+                (time.time(), key),
+            )
+
+    # the fingerprint of the environment a checkpoint was written in (None if
+    # it has none or isn't recorded)
+    def checkpoint_environment(self, key):
+        row = self.db.execute(
+            "SELECT environment FROM checkpoints WHERE key = ?", (key,)
+        ).fetchone()
+        return self.get_environments([row[0]]).get(row[0]) if row else None
+
+    # forget a checkpoint that couldn't be restored
+    def remove_checkpoint(self, key):
+        with self.db:
+            self.db.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+        remove_file(self.checkpoint_path(key))
+
+    # record whether a notebook was satisfied from the cache
+    def record_lookup(self, hit):
+        with self.db:
+            self.db.execute(
+                "INSERT INTO stats (name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                ("hits" if hit else "misses",),
+            )
+
+    # total bytes stored (blobs and checkpoints)
+    def size(self):
+        return self.db.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM blobs) + "
+            "(SELECT COALESCE(SUM(size), 0) FROM checkpoints)"
+        ).fetchone()[0]
+
+    # remove the least recently used cells and checkpoints until no more than
+    # max_bytes are stored (0 for no limit). returns the number of bytes freed
+    def evict(self, max_bytes):
+        if max_bytes <= 0:
+            return 0
+        with self.lock():
+            return self.evict_entries(max_bytes)
+
+    def evict_entries(self, max_bytes):
+        excess = self.size() - max_bytes
+        if excess <= 0:
+            return 0
+
+        blob_sizes = dict(self.db.execute("SELECT blob, size FROM blobs"))
+        blob_refs = dict(
+            self.db.execute("SELECT blob, COUNT(*) FROM cells GROUP BY blob")
+        )
+        entries = self.db.execute(
+            "SELECT 'cell', key, blob, accessed FROM cells UNION ALL "
+            "SELECT 'checkpoint', key, size, accessed FROM checkpoints ORDER BY accessed"
+        ).fetchall()
+        cells = []
+        checkpoints = []
+        blobs = []
+        freed = 0
+        for kind, key, value, _ in entries:
+            if freed >= excess:
+                break
+            if kind == "cell":
+                cells.append(key)
+                blob_refs[value] -= 1
+                if blob_refs[value] == 0:
+                    blobs.append(value)
+                    freed += blob_sizes.get(value, 0)
+            else:
+                checkpoints.append(key)
+                freed += value
+
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM cells WHERE key = ?", [(k,) for k in cells]
+            )
+            self.db.executemany(
+                "DELETE FROM blobs WHERE blob = ?", [(b,) for b in blobs]
+            )
+            self.db.executemany(
+                "DELETE FROM checkpoints WHERE key = ?", [(k,) for k in checkpoints]
+            )
+            self.db.execute(
+                "DELETE FROM notebooks WHERE key NOT IN (SELECT key FROM cells)"
+            )
+            self.db.execute(
+                "DELETE FROM environments WHERE id NOT IN "
+                "(SELECT environment FROM cells WHERE environment IS NOT NULL) "
+                "AND id NOT IN "
+                "(SELECT environment FROM checkpoints WHERE environment IS NOT NULL)"
+            )
+            self.db.execute(
+                "INSERT INTO stats (name, value) VALUES ('evictions', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (len(cells) + len(checkpoints),),
+            )
+        for blob in blobs:
+            remove_file(self.entry_path("blobs", blob))
+        for key in checkpoints:
+            remove_file(self.checkpoint_path(key))
+        return freed
+
+    def stats(self):
+        counters = dict(self.db.execute("SELECT name, value FROM stats"))
+        cells, oldest, newest = self.db.execute(
+            "SELECT COUNT(*), MIN(accessed), MAX(accessed) FROM cells"
+        ).fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return dict(
+            hits=hits,
+            misses=misses,
+            hit_rate=hits / (hits + misses) if hits + misses > 0 else None,
+            evictions=counters.get("evictions", 0),
+            cells=cells,
+            notebooks=self.db.execute("SELECT COUNT(*) FROM notebooks").fetchone()[0],
+            checkpoints=self.db.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[
+                0
+            ],
+            bytes=self.size(),
+            oldest_access=oldest,
+            last_access=newest,
+        )
+
+    def entry_path(self, kind, key, ext=".json"):
+        return os.path.join(self.path, kind, key[:2], key + ext)
+
+    def read_blob(self, blob):
+        try:
+            with open(self.entry_path("blobs", blob), "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return json.loads(data[:])
+        except (OSError, ValueError):
+            return None
+
+    # blobs are named by the hash of their content so they are only written
+    # once. they are written to a temporary file then renamed so that readers
+    # never see a partially written blob
+    # returns the blob name and its size
+    def write_blob(self, entry):
+        data = json.dumps(entry).encode("utf-8")
+        blob = hashlib.sha256(data).hexdigest()
+        path = self.entry_path("blobs", blob)
+        if not os.path.exists(path):
+            dir = os.path.dirname(path)
+            os.makedirs(dir, exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                os.replace(temp, path)
+            except:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+        return (blob, len(data))
+
+
+# the key that starts the chain of cell keys for a notebook
+def notebook_cache_key(kernelspec_name, options):
+    return hash_text(
+        "kernelspec:"
+        + str(kernelspec_name)
+        + "\n"
+        + json.dumps(options, sort_keys=True, default=str)
+    )
+
+
+# the key of a cell given the key of the cell executed before it
+def cell_cache_key(previous, source, options):
+    return hash_text(
+        previous
+        + "\n"
+        + json.dumps(options, sort_keys=True, default=str)
+        + "\n"
+        + source
+    )
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# the directory of the installed package (or standard library) that a module
+# path belongs to, or None for modules that aren't installed (local modules
+# and packages)
+INSTALLED_PACKAGE = re.compile(r"^(.*?[\\/](?:site|dist)-packages[\\/][^\\/]+)")
+STANDARD_LIBRARY = re.compile(r"^(.*[\\/](?:python\d+(?:\.\d+)?t?|Lib))[\\/]")
+
+
+def installed_package(path):
+    match = INSTALLED_PACKAGE.match(path) or STANDARD_LIBRARY.match(path)
+    return match.group(1) if match else None
+
+
+# a compact fingerprint of a kernel's environment from its dependencies (the
+# module path => mtime map reported by the kernel). it covers every module
+# that isn't installed and one module of each installed package and of the
+# standard library (installing another version replaces all of their
+# files), and is validated by comparing the hash of the mtimes of those
+# modules
+def environment_fingerprint(kernel_deps):
+    packages = dict()
+    paths = []
+    for path in sorted(kernel_deps.keys()):
+        package = installed_package(path)
+        if package is None:
+            paths.append(path)
+        elif package not in packages:
+            packages[package] = path
+            paths.append(path)
+    return {
+        "paths": paths,
+        "hash": environment_hash(kernel_deps.get(path) for path in paths),
+    }
+
+
+# has the environment changed since its fingerprint was taken?
+def environment_changed(fingerprint):
+    if not fingerprint:
+        return False
+    mtimes = []
+    for path in fingerprint["paths"]:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            return True
+    return environment_hash(mtimes) != fingerprint["hash"]
+
+
+# environment_changed for the fingerprints of many cache entries (which
+# mostly share an environment, so each distinct one is only checked once)
+def environment_checker():
+    checked = dict()
+
+    def changed(fingerprint):
+        if not fingerprint:
+            return False
+        id = (fingerprint["hash"], tuple(fingerprint["paths"]))
+        if id not in checked:
+            checked[id] = environment_changed(fingerprint)
+        return checked[id]
+
+    return changed
+
+
+def environment_hash(mtimes):
+    return hash_text(json.dumps(list(mtimes)))
+
+
+# maximum cache size in bytes (QUARTO_JUPYTER_CACHE_SIZE, in MB, 0 for no limit)
+def cache_max_bytes():
+    try:
+        return int(float(os.getenv("QUARTO_JUPYTER_CACHE_SIZE", "0")) * 1024 * 1024)
+    except ValueError:
+        return 0
+
+
+# exclusive lock on a file that is shared by processes (and threads, as
+# each lock opens the file anew)
+class CacheLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "a+b")
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            else:
+                # msvcrt.locking gives up after 10 attempts (a second apart)
+                while True:
+                    try:
+                        self.file.seek(0)
+                        msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+        except:
+            self.file.close()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def format_stats(stats, max_bytes=0):
+    def when(timestamp):
+        return (
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+            if timestamp
+            else "-"
+        )
+
+    hit_rate = stats["hit_rate"]
+    limit = f" (limit {max_bytes / 1024 / 1024:.1f} MB)" if max_bytes > 0 else ""
+    return "\n".join(
+        [
+            f"hits:          {stats['hits']}",
+            f"misses:        {stats['misses']}",
+            f"hit rate:      {'-' if hit_rate is None else f'{hit_rate:.0%}'}",
+            f"evictions:     {stats['evictions']}",
+            f"cells:         {stats['cells']}",
+            f"notebooks:     {stats['notebooks']}",
+            f"checkpoints:   {stats['checkpoints']}",
+            f"size:          {stats['bytes'] / 1024 / 1024:.1f} MB{limit}",
+            f"oldest access: {when(stats['oldest_access'])}",
+            f"last access:   {when(stats['last_access'])}",
+        ]
+    )
+
+
+# print a cache's statistics: python cache.py [--json] <cache-dir>
+if __name__ == "__main__":
+    import sys
+
+    args = sys.argv[1:]
+    as_json = "--json" in args
+    args = [arg for arg in args if arg != "--json"]
+    if len(args) != 1 or not os.path.isfile(os.path.join(args[0], "cells.db")):
+        sys.stderr.write("usage: python cache.py [--json] <cache-dir>\n")
+        sys.exit(1)
+    stats = CellCache(args[0]).stats()
+    if as_json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print(format_stats(stats, cache_max_bytes()))
@@ -0,0 +1,185 @@
+# pyright: reportMissingImports=false
+
+import ast
+
+# names whose use means we can't tell what a cell reads or writes
+OPAQUE_NAMES = set(["exec", "eval", "globals", "locals", "vars", "__import__"])
+
+
+# the names a python cell reads (uses), writes (defs, including attribute and
+# subscript assignment and augmented assignment), imports, and calls methods
+# on (which may mutate them). returns None if the cell can't be analysed
+# (ipython magics, star imports, exec/eval, etc.)
+def cell_names(source):
+    for line in source.splitlines():
+        line = line.strip()
+        if line.startswith("%") or line.startswith("!") or line.endswith("?"):
+            return None
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    visitor = CellNamesVisitor()
+    try:
+        visitor.visit(tree)
+    except OpaqueCell:
+        return None
+    return (visitor.uses, visitor.defs, visitor.imports, visitor.calls)
+
+
+class OpaqueCell(Exception):
+    pass
+
+
+class CellNamesVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.uses = set()
+        self.defs = set()
+        self.imports = set()
+        self.calls = set()
+        # depth of function bodies we are in (where stores are local)
+        self.scope = 0
+
+    def visit_Name(self, node):
+        if node.id in OPAQUE_NAMES:
+            raise OpaqueCell()
+        if isinstance(node.ctx, ast.Load):
+            self.uses.add(node.id)
+        elif self.scope == 0:
+            self.defs.add(node.id)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.define_import(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == "*":
+                raise OpaqueCell()
+            self.define_import(alias.asname or alias.name)
+
+    def visit_Global(self, node):
+        for name in node.names:
+            self.uses.add(name)
+            self.defs.add(name)
+
+    def visit_FunctionDef(self, node):
+        self.visit_function(node)
+
+    def visit_AsyncFunctionDef(self, node):
+        self.visit_function(node)
+
+    def visit_Lambda(self, node):
+        self.visit_function(node)
+
+    def visit_ClassDef(self, node):
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        self.scope += 1
+        for child in node.body:
+            self.visit(child)
+        self.scope -= 1
+        self.define(node.name)
+
+    def visit_AugAssign(self, node):
+        name = base_name(node.target)
+        if name:
+            self.uses.add(name)
+            self.define(name)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        self.visit_target(node)
+
+    def visit_Subscript(self, node):
+        self.visit_target(node)
+
+    def visit_Call(self, node):
+        # method calls may mutate the object they are called on
+        if isinstance(node.func, ast.Attribute):
+            name = base_name(node.func)
+            if name:
+                self.uses.add(name)
+                if self.scope == 0:
+                    self.calls.add(name)
+        self.generic_visit(node)
+
+    # attribute and subscript stores mutate their base object
+    def visit_target(self, node):
+        if not isinstance(node.ctx, ast.Load):
+            name = base_name(node)
+            if name:
+                self.uses.add(name)
+                self.define(name)
+        self.generic_visit(node)
+
+    # names stored in function bodies are local, but everything they read
+    # (including the names of other functions they call) is a use
+    def visit_function(self, node):
+        decorators = getattr(node, "decorator_list", [])
+        for child in decorators:
+            self.visit(child)
+        self.visit(node.args)
+        self.scope += 1
+        if isinstance(node.body, list):
+            for child in node.body:
+                self.visit(child)
+        else:
+            self.visit(node.body)
+        self.scope -= 1
+        if hasattr(node, "name"):
+            self.define(node.name)
+
+    def define(self, name):
+        if self.scope == 0:
+            self.defs.add(name)
+
+    def define_import(self, name):
+        if self.scope == 0:
+            self.imports.add(name)
+
+
+# the name an attribute/subscript expression ultimately refers to
+def base_name(node):
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+# given the names of each cell (see cell_names) and the indexes of the cells
+# that changed, find the cells that need to execute. that's the changed
+# cells, every later cell that reads or writes what they write, and every
+# earlier cell that writes what they read or write (so that cells execute
+# against freshly built values rather than ones a previous execution may
+# have mutated), repeated until nothing more is added. method calls on names
+# that are only ever bound to modules aren't treated as writes
+def dataflow_cells(cells, dirty):
+    imported = set()
+    assigned = set()
+    for _, defs, imports, _ in cells:
+        imported |= imports
+        assigned |= defs
+    modules = imported - assigned
+    cells = [
+        (uses, defs | imports | (calls - modules))
+        for uses, defs, imports, calls in cells
+    ]
+
+    execute = set(dirty)
+    pending = list(dirty)
+    while pending:
+        index = pending.pop()
+        uses, defs = cells[index]
+        for other, (other_uses, other_defs) in enumerate(cells):
+            if other in execute:
+                continue
+            if other > index:
+                affected = defs & (other_uses | other_defs)
+            else:
+                affected = (uses | defs) & other_defs
+            if affected:
+                execute.add(other)
+                pending.append(other)
+    return execute
@@ -0,0 +1,180 @@
+# pyright: reportMissingImports=false
+
+import os
+import json
+import time
+import queue
+import atexit
+import hashlib
+import threading
+
+import nbformat
+from nbformat.v4.nbjson import BytesEncoder
+from nbformat.v4.rwbase import rejoin_lines, split_lines, strip_transient
+
+from log import trace
+
+
+# journals older than this are removed when a new journal is opened
+JOURNAL_MAX_AGE = 24 * 60 * 60
+
+
+# journals are kept in the (per-user) jupyter runtime dir rather than next
+# to the input, keyed by the input's absolute path
+def journal_dir():
+    from jupyter_core.paths import jupyter_runtime_dir
+
+    return os.path.join(jupyter_runtime_dir(), "quarto-journals")
+
+
+def journal_path(input):
+    name = hashlib.sha256(os.path.abspath(input).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(journal_dir(), name + ".journal")
+
+
+# remove the journals left by renders that were never resumed
+def prune_journals(dir):
+    now = time.time()
+    try:
+        entries = list(os.scandir(dir))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > JOURNAL_MAX_AGE:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# appends the cells of a notebook to a journal as they finish executing. the
+# cells are encoded and written by a background thread (which releases the
+# GIL while writing) so that execution doesn't wait on it. each line is
+# '<index>\t<cache key>\t<cell json>' w/ the cell as it is written to the
+# notebook (w/o the setup cell), and a complete journal ends w/ an
+# 'environment\t\t<fingerprint json>' line (the kernel environment the cells
+# were executed in) and a 'metadata\t\t<notebook metadata json>' line
+class NotebookJournal:
+    def __init__(self, input):
+        self.path = journal_path(input)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        prune_journals(os.path.dirname(self.path))
+        self.file = open(self.path, "w", encoding="utf-8", newline="\n")
+        self.finished = False
+        self.error = None
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        # (a complete journal is kept for the next render, see abandon)
+        atexit.register(self.abandon)
+
+    # cells must not be modified after they are appended
+    def append(self, index, key, cell):
+        self.queue.put((str(index), key or "", cell))
+
+    # record the environment and the notebook metadata (completing the
+    # journal) and close it
+    def finish(self, metadata, environment=None):
+        self.queue.put(("environment", "", environment))
+        self.queue.put(("metadata", "", metadata))
+        self.finished = True
+        self.close()
+
+    def close(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.file.close()
+
+    def run(self):
+        encoder = BytesEncoder(ensure_ascii=False, separators=(",", ":"))
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            if self.error:
+                continue
+            index, key, value = entry
+            try:
+                if index not in ("environment", "metadata"):
+                    value = journal_cell(value)
+                self.file.write(
+                    index + "\t" + key + "\t" + encoder.encode(value) + "\n"
+                )
+                self.file.flush()
+            except Exception as e:
+                trace("error writing notebook journal: " + str(e))
+                self.error = e
+
+    # the json of the journaled cells (in the order they were appended)
+    def cells_json(self):
+        with open(self.path, "r", encoding="utf-8", newline="\n") as file:
+            for line in file:
+                index, _, value = line.rstrip("\n").split("\t", 2)
+                if index not in ("environment", "metadata"):
+                    yield value
+
+    def remove(self):
+        self.close()
+        atexit.unregister(self.abandon)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    # the kernel is going away: a partial journal can't be resumed w/o its
+    # state so it is removed (a complete journal is kept for the next render)
+    def abandon(self):
+        if self.finished:
+            self.close()
+            atexit.unregister(self.abandon)
+        else:
+            self.remove()
+
+
+# a cell as written to the notebook (a copy, as the executed notebook is
+# still used after execution)
+def journal_cell(cell):
+    nb = strip_transient(
+        split_lines(nbformat.from_dict(dict(metadata={}, cells=[cell])))
+    )
+    cell = nb.cells[0]
+    if cell.cell_type == "code" and cell.execution_count is not None:
+        cell.execution_count -= 1
+    return cell
+
+
+# read the journal left by a failed render. returns the cache keys and cells
+# (index => (key, cell)), the notebook metadata (None if the journal isn't
+# complete) and the environment fingerprint (if any), or None if there's no
+# journal
+def read_journal(input):
+    entries = dict()
+    metadata = None
+    environment = None
+    try:
+        with open(journal_path(input), "r", encoding="utf-8", newline="\n") as file:
+            for line in file:
+                index, key, value = line.rstrip("\n").split("\t", 2)
+                if index == "metadata":
+                    metadata = json.loads(value)
+                elif index == "environment":
+                    environment = json.loads(value)
+                else:
+                    entries[int(index)] = (key, json.loads(value))
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        trace("unable to read notebook journal: " + str(e))
+        return None
+    nb = rejoin_lines(
+        nbformat.from_dict(
+            dict(metadata={}, cells=[cell for _, cell in entries.values()])
+        )
+    )
+    for position, index in enumerate(entries):
+        entries[index] = (entries[index][0], nb.cells[position])
+    if metadata is not None:
+        metadata = nbformat.from_dict(metadata)
+    return entries, metadata, environment
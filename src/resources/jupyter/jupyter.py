@@ -3,26 +3,25 @@ import sys
 import re
 import json
 import stat
-import pprint
-import uuid
-import signal
-import subprocess
+import threading
+import time
 
 from socketserver import TCPServer, StreamRequestHandler
 
 try:
-    from socketserver import UnixStreamServer
+    from socketserver import UnixStreamServer, ForkingMixIn
 except:
     pass
 
 
 from log import log_init, log, log_error, trace
-from notebook import notebook_execute, RestartKernel
-from nbclient.exceptions import CellExecutionError
 
-import asyncio
+# note that the notebook execution modules (which import nbformat, nbclient,
+# etc.) are imported only by the commands that need them so that forwarding
+# an execute request to a zygote doesn't pay for their import
 
 if sys.platform == "win32":
+    import asyncio
     from asyncio.windows_events import *
 
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -30,6 +29,8 @@ if sys.platform == "win32":
 
 class ExecuteHandler(StreamRequestHandler):
     def handle(self):
+        from notebook import notebook_execute, check_for_kernel_restart, RestartKernel
+
         try:
             trace("handling server request")
 
@@ -57,26 +58,115 @@ class ExecuteHandler(StreamRequestHandler):
             # options
             options = input["options"]
 
+            # the server's kernels all run w/ one python for one supervisor
+            # (the client starts a new server when either changes)
+            if check_for_kernel_restart(options):
+                trace("python or supervisor changed (exiting server)")
+                self.message("restart")
+                self.server.request_exit()
+                return
+
             # stream status back to client
             def status(msg):
                 self.message("status", msg)
 
+            # stream cells back to the client as they complete (if requested)
+            stream = self.message if options.get("stream-cells", False) else None
+
+            # execute a list of notebooks
+            if command == "batch":
+                self.execute_batch(options, status, stream)
+                return
+
             # execute the notebook
             trace("executing notebook")
-            persist = notebook_execute(options, status)
-            if not persist:
-                trace("notebook not persistable (exiting server)")
-                self.server.request_exit()
-            else:
-                self.server.record_success()
-        except RestartKernel:
-            trace("notebook restart request recived (exiting server)")
-            self.message("restart")
-            self.server.request_exit()
+            session = self.server.acquire_session(options)
+            try:
+                persist = session.run(
+                    notebook_execute, options, status, session, stream
+                )
+                if not persist:
+                    trace("notebook not persistable (exiting server)")
+                    self.server.discard_session(session)
+                    self.server.request_exit()
+                else:
+                    self.server.record_success()
+            except RestartKernel:
+                trace("notebook restart request recived")
+                self.message("restart")
+                self.server.request_restart(session, options)
+            finally:
+                self.server.release_session(session)
         except Exception as e:
             self.message("error", "\n\n" + str(e))
             self.server.record_error(e)
 
+    # execute the notebooks in options["targets"] in order (all other options
+    # are shared). the kernel of the previous notebook is re-used when its
+    # kernelspec matches and a 'document' message is sent as each completes
+    def execute_batch(self, options, status, stream):
+        from notebook import notebook_execute, RestartKernel
+
+        targets = options["targets"]
+        trace("executing batch of " + str(len(targets)) + " notebooks")
+        session = None
+        try:
+            for index, target in enumerate(targets):
+                doc_options = dict(options)
+                del doc_options["targets"]
+                doc_options["target"] = target
+                if stream:
+
+                    def doc_stream(type, data):
+                        stream(type, dict(data, document=index))
+
+                else:
+                    doc_stream = None
+
+                if not (session and self.server.rebind_session(session, doc_options)):
+                    if session:
+                        self.server.release_session(session)
+                    session = self.server.acquire_session(doc_options)
+
+                try:
+                    # we can't ask the client to retry so restart here (once)
+                    try:
+                        persist = session.run(
+                            notebook_execute, doc_options, status, session, doc_stream
+                        )
+                    except RestartKernel:
+                        trace("notebook restart request recived")
+                        self.server.request_restart(session, doc_options)
+                        session = self.server.acquire_session(doc_options)
+                        persist = session.run(
+                            notebook_execute, doc_options, status, session, doc_stream
+                        )
+                    if not persist:
+                        # (the server exits once the batch completes)
+                        trace("notebook not persistable (exiting server)")
+                        self.server.discard_session(session)
+                        self.server.request_exit()
+                        session = None
+                    self.server.record_success()
+                    self.message(
+                        "document",
+                        {"index": index, "input": target["input"], "status": "ok"},
+                    )
+                except Exception as e:
+                    self.message(
+                        "document",
+                        {
+                            "index": index,
+                            "input": target["input"],
+                            "status": "error",
+                            "error": "\n\n" + str(e),
+                        },
+                    )
+                    self.server.record_error(e)
+        finally:
+            if session:
+                self.server.release_session(session)
+
     # write a message back to the client
     def message(self, type, data=""):
         message = {"type": type, "data": data}
@@ -85,6 +175,10 @@ class ExecuteHandler(StreamRequestHandler):
 
 
 def execute_server(options):
+    from concurrent.futures import ThreadPoolExecutor
+    from notebook import check_for_kernel_restart
+    from sessions import KernelSessionCache, KernelStandbyPool
+
     # determine server type
     is_tcp = options["type"] == "tcp"
     if is_tcp:
@@ -108,6 +202,8 @@ def execute_server(options):
 
             # set secret for tcp
             if is_tcp:
+                import uuid
+
                 self.secret = str(uuid.uuid4())
             else:
                 self.secret = ""
@@ -116,6 +212,37 @@ def execute_server(options):
             self.transport = options["transport"]
             self.timeout = options["timeout"]
 
+            # kernels started ahead of requests
+            standby_count = server_option(options, "kernel-standby", 0)
+            if standby_count > 0:
+                resource_dir = os.path.dirname(
+                    os.path.dirname(os.path.abspath(__file__))
+                )
+                standby = KernelStandbyPool(standby_count, resource_dir)
+                standby.prepare(options.get("kernelspec", None))
+            else:
+                standby = None
+
+            # kernels kept alive between requests (restarted in the
+            # background when their dependencies change if requested). the
+            # client uses a server per input, so by default only one kernel
+            # is kept unless requests are concurrent (in which case sessions
+            # are isolated from process-wide state)
+            concurrency = server_option(options, "concurrency", 1)
+            if server_option(options, "kernel-watch", 0) > 0:
+                watch_resource_dir = os.path.dirname(
+                    os.path.dirname(os.path.abspath(__file__))
+                )
+            else:
+                watch_resource_dir = None
+            self.sessions = KernelSessionCache(
+                max(server_option(options, "kernel-cache-size", 1), concurrency),
+                server_option(options, "kernel-cache-rss", 0) * 1024 * 1024,
+                standby,
+                watch_resource_dir,
+                concurrency > 1,
+            )
+
             # initialize with address (based on server type) and handler
             if is_tcp:
                 server_address = ("localhost", 0)
@@ -149,6 +276,26 @@ def execute_server(options):
         def validate_secret(self, secret):
             return self.secret == secret
 
+        def acquire_session(self, options):
+            return self.sessions.acquire(options)
+
+        def release_session(self, session):
+            self.sessions.release(session)
+
+        def discard_session(self, session):
+            trace("discarding kernel session")
+            self.sessions.discard(session)
+
+        def rebind_session(self, session, options):
+            return self.sessions.rebind(session, options)
+
+        def request_restart(self, session, options):
+            # a changed python or supervisor can't be handled w/ a new kernel
+            if check_for_kernel_restart(options):
+                trace("python or supervisor changed (exiting server)")
+                self.request_exit()
+            self.discard_session(session)
+
         def record_success(self):
             self.consecutive_errors = 0
 
@@ -178,7 +325,93 @@ def execute_server(options):
             except:
                 pass
 
-    return ExecuteServer(options)
+    # server which handles several requests at once (each with its own kernel
+    # session). requests are handled by a fixed pool of worker threads (and
+    # each session does its kernel i/o on a thread of its own) so that the
+    # threads and event loops used don't grow w/ the number of requests
+    class ConcurrentExecuteServer(ExecuteServer):
+        def __init__(self, options, concurrency):
+            super().__init__(options)
+            trace("notebook server concurrency: " + str(concurrency))
+
+            # the socket timeout becomes a polling interval so we can
+            # track idle time across request threads
+            self.idle_timeout = self.timeout
+            self.timeout = min(self.idle_timeout, 1)
+            self.last_activity = time.monotonic()
+
+            self.workers = ThreadPoolExecutor(
+                max_workers=concurrency, thread_name_prefix="quarto-request"
+            )
+            self.slots = threading.BoundedSemaphore(concurrency)
+            self.lock = threading.Lock()
+            self.active_requests = 0
+
+        def process_request(self, request, client_address):
+            # wait for a free worker before accepting more requests
+            self.slots.acquire()
+            with self.lock:
+                self.active_requests += 1
+            try:
+                self.workers.submit(
+                    self.process_request_thread, request, client_address
+                )
+            except:
+                self.request_complete()
+                self.shutdown_request(request)
+                raise
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self.request_complete()
+
+        # wait for requests in progress (as ThreadingMixIn does)
+        def server_close(self):
+            super().server_close()
+            self.workers.shutdown(wait=True)
+
+        def request_complete(self):
+            with self.lock:
+                self.active_requests -= 1
+                self.last_activity = time.monotonic()
+            self.slots.release()
+
+        def handle_timeout(self):
+            with self.lock:
+                idle = self.active_requests == 0 and (
+                    time.monotonic() - self.last_activity >= self.idle_timeout
+                )
+            if idle:
+                trace("request timeout (exiting server)")
+                self.exit()
+
+        def record_error(self, e):
+            # exit for 5 consecutive errors (once pending requests complete)
+            with self.lock:
+                self.consecutive_errors += 1
+                if self.consecutive_errors >= 5:
+                    self.exit_pending = True
+
+    concurrency = server_option(options, "concurrency", 1)
+    if concurrency > 1:
+        return ConcurrentExecuteServer(options, concurrency)
+    else:
+        return ExecuteServer(options)
+
+
+# read an integer server option, falling back to an environment variable
+# (e.g. 'kernel-cache-size' => QUARTO_JUPYTER_KERNEL_CACHE_SIZE)
+def server_option(options, name, default):
+    value = options.get(name, None)
+    if value is None:
+        env_var = "QUARTO_JUPYTER_" + name.upper().replace("-", "_")
+        value = os.getenv(env_var, default)
+    return max(int(value), 0)
 
 
 def run_server(options):
@@ -191,7 +424,9 @@ def run_server(options):
 
 
 # run a server as a detached subprocess
-def run_server_subprocess(options, status):
+def run_server_subprocess(options, status, command="serve"):
+    import subprocess
+
     # python executable
     python_exe = sys.executable
 
@@ -205,11 +440,13 @@ def run_server_subprocess(options, status):
         flags |= 0x01000000  # CREATE_BREAKAWAY_FROM_JOB
 
     # forward options via env vars
-    os.environ["QUARTO_JUPYTER_OPTIONS"] = json.dumps(options)
+    env = dict(os.environ)
+    env["QUARTO_JUPYTER_OPTIONS"] = json.dumps(options)
 
     # create subprocess
     subprocess.Popen(
-        [python_exe] + sys.argv + ["serve"],
+        [python_exe] + sys.argv[:1] + [command],
+        env=env,
         stdin=subprocess.DEVNULL,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
@@ -221,6 +458,8 @@ def run_server_subprocess(options, status):
 
 # run a notebook directly (not a server)
 def run_notebook(options, status):
+    from notebook import notebook_execute
+
     # run notebook w/ some special exception handling. note that we don't
     # log exceptions here b/c they are considered normal course of execution
     # for errors that occur in notebook cells
@@ -240,6 +479,125 @@ def run_notebook(options, status):
         sys.exit(1)
 
 
+# the zygote is a process that has already imported the modules required for
+# execution and forks a child to execute each notebook, saving the interpreter
+# startup and import time of a oneshot execute. it is enabled by setting
+# QUARTO_JUPYTER_ZYGOTE to the path of its (unix domain) socket
+class ZygoteHandler(StreamRequestHandler):
+    def handle(self):
+        from notebook import default_session
+
+        code = 0
+        try:
+            # adopt the working directory and environment of the requester
+            input = json.loads(str(self.rfile.readline().strip(), "utf-8"))
+            os.chdir(input["cwd"])
+            os.environ.clear()
+            os.environ.update(input["env"])
+
+            def status(msg):
+                self.message("status", msg)
+
+            trace("zygote executing notebook")
+            run_notebook(input["options"], status)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            log_error("Unable to run notebook", exc_info=e)
+            code = 1
+        finally:
+            # the forked child exits w/o running atexit handlers
+            default_session.close()
+        self.message("exit", code)
+
+    def message(self, type, data=""):
+        message = {"type": type, "data": data}
+        self.wfile.write(bytearray(json.dumps(message) + "\n", "utf-8"))
+        self.wfile.flush()
+
+
+def zygote_transport():
+    if hasattr(os, "fork"):
+        return os.getenv("QUARTO_JUPYTER_ZYGOTE", None)
+    else:
+        return None
+
+
+def run_zygote(options):
+    # import everything that notebook execution will need (including the
+    # optional subsystems that are otherwise imported on demand)
+    import notebook
+
+    notebook.papermill_translators()
+    notebook.jupyter_cache_module()
+
+    # exit when idle for the timeout or when our socket has been removed
+    class ZygoteServer(ForkingMixIn, UnixStreamServer):
+        last_request = time.monotonic()
+
+        def process_request(self, request, client_address):
+            self.last_request = time.monotonic()
+            super().process_request(request, client_address)
+
+        def handle_timeout(self):
+            idle = time.monotonic() - self.last_request
+            if idle >= options["timeout"] or not os.path.exists(transport):
+                trace("zygote timeout (exiting)")
+                raise SystemExit(0)
+
+    transport = options["transport"]
+    try:
+        with ZygoteServer(transport, ZygoteHandler) as server:
+            os.chmod(transport, stat.S_IRUSR | stat.S_IWUSR)
+            server.timeout = 1
+            trace("zygote listening at " + transport)
+            try:
+                while True:
+                    server.handle_request()
+            finally:
+                if os.path.exists(transport):
+                    os.remove(transport)
+    except Exception as e:
+        log_error("Unable to run zygote", exc_info=e)
+
+
+# forward an execute request to the zygote (if there is one). returns False
+# if the request could not be forwarded (in which case a zygote is started
+# for subsequent requests)
+def run_notebook_zygote(options, status):
+    import socket
+
+    transport = zygote_transport()
+    if not transport:
+        return False
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(transport)
+    except OSError:
+        trace("starting zygote subprocess")
+        if os.path.exists(transport):
+            os.remove(transport)
+        zygote_options = dict(options)
+        zygote_options.update({"transport": transport, "timeout": 300})
+        run_server_subprocess(zygote_options, status, "zygote")
+        return False
+
+    trace("forwarding notebook execution to zygote")
+    with conn:
+        request = {"cwd": os.getcwd(), "env": dict(os.environ), "options": options}
+        conn.sendall(bytearray(json.dumps(request) + "\n", "utf-8"))
+        for line in conn.makefile("rb"):
+            message = json.loads(str(line, "utf-8"))
+            if message["type"] == "status":
+                status(message["data"])
+            elif message["type"] == "exit":
+                if message["data"] != 0:
+                    sys.exit(message["data"])
+                return True
+    # the zygote went away w/o completing the request
+    raise Exception("Zygote process exited unexpectedly")
+
+
 if __name__ == "__main__":
     # stream status to stderr
     def status(msg):
@@ -255,7 +613,7 @@ if __name__ == "__main__":
             del os.environ["QUARTO_JUPYTER_OPTIONS"]
         # otherwise read from stdin
         else:
-            sys.stdin.reconfigure(encoding='utf-8')
+            sys.stdin.reconfigure(encoding="utf-8")
             input = json.load(sys.stdin)
             command = input["command"]
             options = input["options"]
@@ -274,10 +632,16 @@ if __name__ == "__main__":
             trace("running notebook server subprocess")
             run_server(options)
 
+        # run a zygote (invoked by run_notebook_zygote)
+        elif command == "zygote":
+            trace("running zygote subprocess")
+            run_zygote(options)
+
         # execute a notebook and then quit
         elif command == "execute":
             trace("running notebook without keepalive")
-            run_notebook(options, status)
+            if not run_notebook_zygote(options, status):
+                run_notebook(options, status)
 
     except Exception as e:
         log_error("Unable to run notebook", exc_info=e)
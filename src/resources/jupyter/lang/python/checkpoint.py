@@ -0,0 +1,77 @@
+# save the user namespace to a checkpoint file. modules are recorded by name
+# and everything else is pickled together (so that shared references are
+# preserved). dill is used when available as it can also save functions and
+# classes defined in the notebook. if anything can't be saved then no
+# checkpoint is written. prints the names that couldn't be saved
+def __quarto_checkpoint():
+    import os
+    import json
+    import types
+    import base64
+    import pickle
+    import tempfile
+    from IPython import get_ipython
+
+    try:
+        import dill as pickler
+    except ImportError:
+        pickler = pickle
+
+    # names defined by the setup cell (which executes again before a restore)
+    setup_names = ["ojs_define"]
+
+    path = base64.b64decode("{path}").decode("utf-8")
+    shell = get_ipython()
+    modules = dict()
+    values = dict()
+    for name, value in list(shell.user_ns.items()):
+        if name.startswith("_") or name in shell.user_ns_hidden or name in setup_names:
+            continue
+        if isinstance(value, types.ModuleType):
+            modules[name] = value.__name__
+        else:
+            values[name] = value
+
+    # pickle saves functions and classes by reference, which can't be restored
+    # for the ones that were defined in the notebook
+    def by_reference(value):
+        return (
+            pickler is pickle
+            and getattr(value, "__module__", None) == "__main__"
+            and isinstance(value, (types.FunctionType, type))
+        )
+
+    unsaved = [name for name, value in values.items() if by_reference(value)]
+    if unsaved:
+        print(json.dumps(unsaved))
+        return
+
+    try:
+        data = pickler.dumps(values)
+    except Exception:
+        unsaved = []
+        for name, value in values.items():
+            try:
+                pickler.dumps(value)
+            except Exception:
+                unsaved.append(name)
+        print(json.dumps(unsaved or list(values.keys())))
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(
+                dict(pickler=pickler.__name__, modules=modules, values=data), file
+            )
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    print(json.dumps([]))
+
+
+__quarto_checkpoint()
+del __quarto_checkpoint
@@ -1,30 +1,86 @@
 
-# reset state
-%reset
+# reset state (w/ the setup cell's reset strategy)
+def __quarto_reset():
+  import sys
+  for finder in sys.meta_path:
+    if getattr(finder, "quarto_import_hooks", False) and hasattr(finder, "reset"):
+      return finder.reset()
+  get_ipython().run_line_magic("reset", "-f")
 
-import sys
-import types
-import os
-import json
+__quarto_reset()
 
-# NOTE: the kernel_deps code is repeated in the setup.py file
+# NOTE: the kernel_deps code is repeated in the setup.py and dependencies.py files
 # (we can't easily share this code b/c of the way it is run).
-# If you edit this code also edit the same code in setup.py!
-
-kernel_deps = dict()
-for module in list(sys.modules.values()):
-  # Some modules play games with sys.modules (e.g. email/__init__.py
-  # in the standard library), and occasionally this can cause strange
-  # failures in getattr.  Just ignore anything that's not an ordinary
-  # module.
-  if not isinstance(module, types.ModuleType):
-    continue
-  path = getattr(module, "__file__", None)
-  if not path:
-    continue
-  if path.endswith(".pyc") or path.endswith(".pyo"):
-    path = path[:-1]
-  if not os.path.exists(path):
-    continue
-  kernel_deps[path] = os.stat(path).st_mtime
-print(json.dumps(kernel_deps))
+# If you edit this code also edit the same code in setup.py and dependencies.py!
+
+def __quarto_kernel_deps():
+  import sys
+  import types
+  import os
+  import json
+
+  # modules are recorded by an import hook as they are first imported (the
+  # hook and the modules reported so far live in sys.meta_path, so they
+  # survive %reset). the first report covers everything in sys.modules
+  tracker = None
+  for finder in sys.meta_path:
+    if getattr(finder, "quarto_kernel_deps", False):
+      tracker = finder
+  if tracker is None:
+    class ImportTracker:
+      quarto_kernel_deps = True
+
+      def __init__(self):
+        self.imported = None
+        self.reported = dict()
+
+      def find_spec(self, fullname, path=None, target=None):
+        if self.imported is not None:
+          self.imported.append(fullname)
+        return None
+
+    tracker = ImportTracker()
+    sys.meta_path.insert(0, tracker)
+
+  # revalidate the modules reported so far in a single stat pass (changed
+  # modules are reported w/ their new mtime, or None if they were removed)
+  changed = dict()
+  for path, mtime in list(tracker.reported.items()):
+    try:
+      current = os.stat(path).st_mtime
+    except OSError:
+      current = None
+    if current != mtime:
+      changed[path] = current
+      tracker.reported[path] = current
+
+  # report the modules imported since the last report
+  if tracker.imported is None:
+    modules = list(sys.modules.values())
+  else:
+    modules = [sys.modules.get(name) for name in tracker.imported]
+  tracker.imported = []
+  deps = dict()
+  for module in modules:
+    # Some modules play games with sys.modules (e.g. email/__init__.py
+    # in the standard library), and occasionally this can cause strange
+    # failures in getattr.  Just ignore anything that's not an ordinary
+    # module.
+    if not isinstance(module, types.ModuleType):
+      continue
+    path = getattr(module, "__file__", None)
+    if not path:
+      continue
+    if path.endswith(".pyc") or path.endswith(".pyo"):
+      path = path[:-1]
+    if path in tracker.reported:
+      continue
+    try:
+      deps[path] = os.stat(path).st_mtime
+    except OSError:
+      continue
+  tracker.reported.update(deps)
+  print(json.dumps(dict(deps=deps, changed=changed)))
+
+__quarto_kernel_deps()
+del __quarto_kernel_deps
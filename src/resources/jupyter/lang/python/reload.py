@@ -0,0 +1,111 @@
+# reload the modules of changed files in place (rather than restarting the
+# kernel), along w/ the modules under the given directories that refer to a
+# reloaded module (each after the modules it refers to). prints the names
+# of the reloaded modules or the error that stopped the reload
+def __quarto_reload():
+    import os
+    import sys
+    import json
+    import types
+    import ast
+    import base64
+    import importlib
+    import importlib.util
+
+    def decode(value):
+        return json.loads(base64.b64decode(value).decode("utf-8"))
+
+    def normalize(path):
+        if path.endswith(".pyc") or path.endswith(".pyo"):
+            path = path[:-1]
+        return os.path.normcase(os.path.abspath(path))
+
+    def in_dirs(path):
+        if "site-packages" in path or "dist-packages" in path:
+            return False
+        return any(path.startswith(dir + os.sep) for dir in dirs)
+
+    # the modules a module imports (from its source) or holds values from
+    def references(module):
+        names = set()
+        try:
+            with open(module.__file__, "rb") as file:
+                tree = ast.parse(file.read())
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    names.update(alias.name for alias in node.names)
+                elif isinstance(node, ast.ImportFrom):
+                    base = (
+                        importlib.util.resolve_name(
+                            "." * node.level + (node.module or ""),
+                            module.__package__ or "",
+                        )
+                        if node.level
+                        else node.module
+                    )
+                    names.add(base)
+                    names.update(base + "." + alias.name for alias in node.names)
+        except Exception:
+            pass
+        for value in list(vars(module).values()):
+            try:
+                if isinstance(value, types.ModuleType):
+                    names.add(value.__name__)
+                else:
+                    names.add(getattr(value, "__module__", None))
+            except Exception:
+                pass
+        return names
+
+    changed = set(normalize(path) for path in decode("{paths}"))
+    dirs = [normalize(dir).rstrip(os.sep) for dir in decode("{dirs}")]
+
+    # the changed modules and (repeatedly) the local modules that refer to them
+    modules = dict()
+    local = dict()
+    for name, module in list(sys.modules.items()):
+        if not isinstance(module, types.ModuleType):
+            continue
+        path = getattr(module, "__file__", None)
+        if not path:
+            continue
+        path = normalize(path)
+        if path in changed:
+            modules[name] = module
+        elif in_dirs(path):
+            local[name] = module
+    refs = dict((name, references(module)) for name, module in local.items())
+    for name in modules:
+        refs[name] = references(modules[name])
+    added = True
+    while added:
+        added = False
+        for name in list(local.keys()):
+            if refs[name] & set(modules.keys()):
+                modules[name] = local.pop(name)
+                added = True
+
+    # reload them after the modules they refer to
+    reloaded = []
+
+    def reload(name, visiting):
+        if name in reloaded or name in visiting:
+            return
+        visiting.add(name)
+        for other in modules:
+            if other != name and other in refs[name]:
+                reload(other, visiting)
+        importlib.reload(modules[name])
+        reloaded.append(name)
+
+    for name in modules:
+        try:
+            reload(name, set())
+        except BaseException as e:
+            print(json.dumps(dict(error=name + ": " + str(e))))
+            return
+    print(json.dumps(dict(reloaded=reloaded)))
+
+
+__quarto_reload()
+del __quarto_reload
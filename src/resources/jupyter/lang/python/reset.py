@@ -0,0 +1,32 @@
+# reset the kernel w/o re-running the setup cell, when the same setup cell
+# has already run in it: re-run the library configuration hooks, set the
+# working directory and reset the user namespace (w/ the reset function the
+# setup cell keeps w/ the hook finder)
+def __quarto_reset():
+    import os
+    import sys
+    import base64
+    from IPython import get_ipython
+
+    finder = None
+    for existing in sys.meta_path:
+        if getattr(existing, "quarto_import_hooks", False):
+            finder = existing
+    if finder is not None:
+        finder.configure()
+
+    # set run_path if requested
+    run_path = "{run_path}"
+    if run_path:
+        # hex-decode the path
+        run_path = base64.b64decode(run_path.encode("utf-8")).decode("utf-8")
+        os.chdir(run_path)
+
+    # reset state
+    if hasattr(finder, "reset"):
+        finder.reset()
+    else:
+        get_ipython().run_line_magic("reset", "-f")
+
+
+__quarto_reset()
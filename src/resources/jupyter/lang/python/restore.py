@@ -0,0 +1,23 @@
+# restore the user namespace from a checkpoint file (written by
+# checkpoint.py). nothing is restored unless everything can be
+def __quarto_restore():
+    import json
+    import base64
+    import pickle
+    import importlib
+    from IPython import get_ipython
+
+    path = base64.b64decode("{path}").decode("utf-8")
+    with open(path, "rb") as file:
+        checkpoint = pickle.load(file)
+    pickler = importlib.import_module(checkpoint["pickler"])
+    namespace = dict()
+    for name, module in checkpoint["modules"].items():
+        namespace[name] = importlib.import_module(module)
+    namespace.update(pickler.loads(checkpoint["values"]))
+    get_ipython().user_ns.update(namespace)
+    print(json.dumps([]))
+
+
+__quarto_restore()
+del __quarto_restore
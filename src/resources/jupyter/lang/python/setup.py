@@ -15,40 +15,45 @@ interactivity = '{interactivity}'
 is_shiny = {is_shiny}
 is_dashboard = {is_dashboard}
 plotly_connected = {plotly_connected}
+reset_strategy = '{reset_strategy}'
+
+# library configuration. each library is configured by a post-import hook
+# when it is first imported (or right away if it already has been) so that
+# documents that don't use a library don't pay for importing it. the hooks
+# are closures over the options (the names here are cleared by %reset)
+def __quarto_library_hooks(fig_width, fig_height, fig_format, fig_dpi, is_dashboard, plotly_connected):
+  hooks = dict()
+
+  # matplotlib defaults / format
+  def matplotlib_hook():
+    import matplotlib.pyplot as plt
+    plt.rcParams['figure.figsize'] = (fig_width, fig_height)
+    plt.rcParams['figure.dpi'] = fig_dpi
+    plt.rcParams['savefig.dpi'] = "figure"
+
+    # IPython 7.14 deprecated set_matplotlib_formats from IPython
+    try:
+      from matplotlib_inline.backend_inline import set_matplotlib_formats
+    except ImportError:
+      # Fall back to deprecated location for older IPython versions
+      from IPython.display import set_matplotlib_formats
+
+    set_matplotlib_formats(fig_format)
+  hooks["matplotlib"] = matplotlib_hook
+
+  # plotly use connected mode
+  def plotly_hook():
+    import plotly.io as pio
+    if plotly_connected:
+      pio.renderers.default = "notebook_connected"
+    else:
+      pio.renderers.default = "notebook"
+    for template in pio.templates.keys():
+      pio.templates[template].layout.margin = dict(t=30,r=0,b=0,l=0)
+  hooks["plotly"] = plotly_hook
 
-# matplotlib defaults / format
-try:
-  import matplotlib.pyplot as plt
-  plt.rcParams['figure.figsize'] = (fig_width, fig_height)
-  plt.rcParams['figure.dpi'] = fig_dpi
-  plt.rcParams['savefig.dpi'] = "figure"
-
-  # IPython 7.14 deprecated set_matplotlib_formats from IPython
-  try:
-    from matplotlib_inline.backend_inline import set_matplotlib_formats
-  except ImportError:
-    # Fall back to deprecated location for older IPython versions
-    from IPython.display import set_matplotlib_formats
-    
-  set_matplotlib_formats(fig_format)
-except Exception:
-  pass
-
-# plotly use connected mode
-try:
-  import plotly.io as pio
-  if plotly_connected:
-    pio.renderers.default = "notebook_connected"
-  else:
-    pio.renderers.default = "notebook"
-  for template in pio.templates.keys():
-    pio.templates[template].layout.margin = dict(t=30,r=0,b=0,l=0)
-except Exception:
-  pass
-
-# disable itables paging for dashboards
-if is_dashboard:
-  try:
+  # disable itables paging for dashboards
+  def itables_hook():
     from itables import options
     options.dom = 'fiBrtlp'
     options.maxBytes = 1024 * 1024
@@ -63,10 +68,11 @@ if is_dashboard:
     options.responsive = True
     options.keys = True
     options.buttons = []
-  except Exception:
-    pass
-  
-  try:
+  if is_dashboard:
+    hooks["itables"] = itables_hook
+
+  # dashboards use container sized vega visualizations
+  def altair_hook():
     import altair as alt
     # By default, dashboards will have container sized
     # vega visualizations which allows them to flow reasonably
@@ -82,7 +88,7 @@ if is_dashboard:
 
             if 'config' not in existingTheme:
               existingTheme['config'] = dict()
-            
+
             # Configure the default font sizes
             title_font_size = 15
             header_font_size = 13
@@ -139,56 +145,235 @@ if is_dashboard:
               mark['tooltip'] = dict(content="encoding")
 
             return existingTheme
-            
+
         return patch_theme
 
     # We can only do this once per session
     if theme_sentinel not in alt.themes.names():
       for name in alt.themes.names():
         alt.themes.register(name, make_theme(name))
-      
+
       # register a sentinel theme so we only do this once
       alt.themes.register(theme_sentinel, make_theme('default'))
       alt.themes.enable('default')
+  if is_dashboard:
+    hooks["altair"] = altair_hook
 
-  except Exception:
-    pass
-
-# enable pandas latex repr when targeting pdfs
-try:
-  import pandas as pd
-  if fig_format == 'pdf':
+  # enable pandas latex repr when targeting pdfs
+  def pandas_hook():
+    import pandas as pd
     pd.set_option('display.latex.repr', True)
-except Exception:
-  pass
+  if fig_format == 'pdf':
+    hooks["pandas"] = pandas_hook
+
+  return hooks
+
+# run hooks after the modules they are registered for are imported. the hook
+# finder lives in sys.meta_path (so it survives %reset) and its hooks are
+# replaced by each setup cell (and re-run for imported modules by each setup
+# cell or reset.py). hooks that fail are ignored (as they were when the
+# setup cell configured libraries directly)
+def __quarto_import_hooks(hooks):
+  import sys
+  import importlib.util
+
+  finder = None
+  for existing in sys.meta_path:
+    if getattr(existing, "quarto_import_hooks", False):
+      finder = existing
+  if finder is None:
+    class PostImportFinder:
+      quarto_import_hooks = True
+
+      def __init__(self):
+        self.hooks = dict()
+        self.finding = set()
+
+      def find_spec(self, fullname, path=None, target=None):
+        if fullname not in self.hooks or fullname in self.finding:
+          return None
+        # find the module w/ the other finders and run the hook after the
+        # module's own loader has executed it
+        self.finding.add(fullname)
+        try:
+          spec = importlib.util.find_spec(fullname)
+        finally:
+          self.finding.discard(fullname)
+        if spec is None or not hasattr(spec.loader, "exec_module"):
+          return None
+        loader = spec.loader
+        finder = self
+
+        class PostImportLoader:
+          def create_module(self, spec):
+            return loader.create_module(spec)
+
+          def exec_module(self, module):
+            module.__loader__ = loader
+            module.__spec__.loader = loader
+            loader.exec_module(module)
+            finder.run(fullname)
+
+        spec.loader = PostImportLoader()
+        return spec
+
+      def run(self, name):
+        hook = self.hooks.get(name)
+        if hook is not None:
+          try:
+            hook()
+          except Exception:
+            pass
+
+      def configure(self):
+        for name in list(self.hooks.keys()):
+          if name in sys.modules:
+            self.run(name)
+
+    finder = PostImportFinder()
+    sys.meta_path.insert(0, finder)
+
+  finder.hooks = hooks
+  finder.configure()
+
+__quarto_import_hooks(
+  __quarto_library_hooks(fig_width, fig_height, fig_format, fig_dpi, is_dashboard, plotly_connected)
+)
+del __quarto_import_hooks
+del __quarto_library_hooks
+
+# reset the user namespace to its state at the end of the setup cell. the
+# "full" strategy runs %reset and restores the setup cell's definitions.
+# "selective" drops only the names created since the last reset (and
+# restores rebound ones), which frees their values w/o the rest of %reset,
+# then collects garbage. "background" collects garbage on the kernel's event
+# loop after the cell has replied. the reset function and what it restores
+# are kept w/ the hook finder (so that cleanup.py and reset.py can use them)
+def __quarto_reset_strategy(strategy):
+  import gc
+  import sys
+
+  for existing in sys.meta_path:
+    if getattr(existing, "quarto_import_hooks", False):
+      finder = existing
+
+  def reset():
+    ip = get_ipython()
+    baseline = getattr(finder, "baseline", None)
+    if strategy == "full" or baseline is None:
+      ip.run_line_magic("reset", "-f")
+      ip.user_ns.update(getattr(finder, "definitions", dict()))
+      return
+
+    ns = ip.user_ns
+    dropped = [name for name in ns.keys() if name not in baseline]
+    for name in dropped:
+      del ns[name]
+    ns.update(baseline)
+
+    # release the other references IPython holds to values (the output
+    # cache and the last result)
+    ip.history_manager.reset(new_session=False)
+    ip.displayhook._ = ip.displayhook.__ = ip.displayhook.___ = ""
+    ip.last_execution_result = None
+    ip.clear_main_mod_cache()
+
+    if not dropped:
+      return
+    # (a collection in a thread would hold the GIL and delay the reply)
+    io_loop = getattr(getattr(ip, "kernel", None), "io_loop", None)
+    if strategy == "background" and io_loop is not None:
+      io_loop.add_callback(gc.collect)
+    else:
+      gc.collect()
+
+  finder.reset = reset
+
+__quarto_reset_strategy(reset_strategy)
+del __quarto_reset_strategy
 
 # interactivity
 if interactivity:
   from IPython.core.interactiveshell import InteractiveShell
   InteractiveShell.ast_node_interactivity = interactivity
 
-# NOTE: the kernel_deps code is repeated in the cleanup.py file
+# NOTE: the kernel_deps code is repeated in the cleanup.py and dependencies.py files
 # (we can't easily share this code b/c of the way it is run).
-# If you edit this code also edit the same code in cleanup.py!
-
-# output kernel dependencies
-kernel_deps = dict()
-for module in list(sys.modules.values()):
-  # Some modules play games with sys.modules (e.g. email/__init__.py
-  # in the standard library), and occasionally this can cause strange
-  # failures in getattr.  Just ignore anything that's not an ordinary
-  # module.
-  if not isinstance(module, types.ModuleType):
-    continue
-  path = getattr(module, "__file__", None)
-  if not path:
-    continue
-  if path.endswith(".pyc") or path.endswith(".pyo"):
-    path = path[:-1]
-  if not os.path.exists(path):
-    continue
-  kernel_deps[path] = os.stat(path).st_mtime
-print(json.dumps(kernel_deps))
+# If you edit this code also edit the same code in cleanup.py and dependencies.py!
+
+# output kernel dependencies (the modules imported since the last report and
+# the previously reported modules that have changed)
+def __quarto_kernel_deps():
+  import sys
+  import types
+  import os
+  import json
+
+  # modules are recorded by an import hook as they are first imported (the
+  # hook and the modules reported so far live in sys.meta_path, so they
+  # survive %reset). the first report covers everything in sys.modules
+  tracker = None
+  for finder in sys.meta_path:
+    if getattr(finder, "quarto_kernel_deps", False):
+      tracker = finder
+  if tracker is None:
+    class ImportTracker:
+      quarto_kernel_deps = True
+
+      def __init__(self):
+        self.imported = None
+        self.reported = dict()
+
+      def find_spec(self, fullname, path=None, target=None):
+        if self.imported is not None:
+          self.imported.append(fullname)
+        return None
+
+    tracker = ImportTracker()
+    sys.meta_path.insert(0, tracker)
+
+  # revalidate the modules reported so far in a single stat pass (changed
+  # modules are reported w/ their new mtime, or None if they were removed)
+  changed = dict()
+  for path, mtime in list(tracker.reported.items()):
+    try:
+      current = os.stat(path).st_mtime
+    except OSError:
+      current = None
+    if current != mtime:
+      changed[path] = current
+      tracker.reported[path] = current
+
+  # report the modules imported since the last report
+  if tracker.imported is None:
+    modules = list(sys.modules.values())
+  else:
+    modules = [sys.modules.get(name) for name in tracker.imported]
+  tracker.imported = []
+  deps = dict()
+  for module in modules:
+    # Some modules play games with sys.modules (e.g. email/__init__.py
+    # in the standard library), and occasionally this can cause strange
+    # failures in getattr.  Just ignore anything that's not an ordinary
+    # module.
+    if not isinstance(module, types.ModuleType):
+      continue
+    path = getattr(module, "__file__", None)
+    if not path:
+      continue
+    if path.endswith(".pyc") or path.endswith(".pyo"):
+      path = path[:-1]
+    if path in tracker.reported:
+      continue
+    try:
+      deps[path] = os.stat(path).st_mtime
+    except OSError:
+      continue
+  tracker.reported.update(deps)
+  print(json.dumps(dict(deps=deps, changed=changed)))
+
+__quarto_kernel_deps()
+del __quarto_kernel_deps
 
 # set run_path if requested
 run_path = '{run_path}'
@@ -198,10 +383,10 @@ if run_path:
   os.chdir(run_path)
 
 # reset state
-%reset
+[finder for finder in sys.meta_path if getattr(finder, "quarto_import_hooks", False)][0].reset()
 
 # shiny
-# Checking for shiny by using {is_shiny} directly because we're after the %reset. We don't want
+# Checking for shiny by using {is_shiny} directly because we're after the reset. We don't want
 # to set a variable that stays in global scope.
 if {is_shiny}:
   try:
@@ -277,4 +462,18 @@ def ojs_define(**kwargs):
   v = dict(contents=list(dict(name=key, value=convert(value)) for (key, value) in kwargs.items()))
   display(HTML('<script type="ojs-define">' + json.dumps(v) + '</script>'), metadata=dict(ojs_define = True))
 globals()["ojs_define"] = ojs_define
-globals()["__spec__"] = None
\ No newline at end of file
+globals()["__spec__"] = None
+
+# keep the setup cell's definitions (restored after a full reset) and the
+# namespace as it is at the end of the setup cell (which a selective reset
+# returns to) w/ the hook finder
+def __quarto_keep_definitions(**definitions):
+  import sys
+  for finder in sys.meta_path:
+    if getattr(finder, "quarto_import_hooks", False):
+      finder.definitions = definitions
+      finder.baseline = dict(get_ipython().user_ns)
+      finder.baseline.pop("__quarto_keep_definitions", None)
+
+__quarto_keep_definitions(ojs_define=ojs_define, __spec__=None)
+del __quarto_keep_definitions
\ No newline at end of file
@@ -0,0 +1,27 @@
+# import the modules configured by the setup cell ahead of time so that
+# kernels started on standby are ready to execute (the setup cell's reset
+# clears names but the modules stay loaded)
+def __quarto_warmup():
+    import importlib
+
+    modules = [
+        "os",
+        "sys",
+        "types",
+        "json",
+        "base64",
+        "matplotlib.pyplot",
+        "matplotlib_inline.backend_inline",
+        "plotly.io",
+        "pandas",
+        "IPython.core.interactiveshell",
+    ]
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+
+
+__quarto_warmup()
+del __quarto_warmup
@@ -0,0 +1,204 @@
+# pyright: reportMissingImports=false
+
+import re
+import json
+
+import nbformat
+
+# how much of the notebook file is read at a time
+CHUNK_SIZE = 1024 * 1024
+
+# the next character that matters inside of a container, and the end of a
+# number, true, false or null
+CONTAINER_SPECIAL = re.compile(r'["\[\]{}]')
+PRIMITIVE_END = re.compile(r"[\s,\]}]")
+WHITESPACE = re.compile(r"\s*")
+
+
+# read a notebook to execute it. the outputs and execution counts of its
+# code cells are discarded while it is parsed (execution replaces them), so
+# memory use is proportional to the notebook's sources rather than to its
+# outputs (which are skipped w/o being decoded). otherwise the same as
+# nbformat.read (conversion to as_version, then logged validation)
+def read_notebook(input, as_version):
+    with open(input, "r", encoding="utf-8") as file:
+        nb_dict = read_notebook_json(file)
+    major, minor = nbformat.reader.get_version(nb_dict)
+    if major not in nbformat.versions:
+        raise nbformat.NBFormatError("Unsupported nbformat version {0}".format(major))
+    nb = nbformat.versions[major].to_notebook_json(nb_dict, minor=minor)
+    nb = nbformat.convert(nb, as_version)
+    try:
+        nbformat.validate(nb)
+    except nbformat.ValidationError as e:
+        nbformat.get_logger().error("Notebook JSON is invalid: %s", e)
+    return nb
+
+
+# parse notebook json w/o the outputs and execution counts of its cells
+def read_notebook_json(file):
+    scanner = JsonScanner(file)
+    nb = dict()
+    for key in scanner.members():
+        if key == "cells":
+            nb["cells"] = [read_cell_json(scanner) for _ in scanner.elements()]
+        else:
+            nb[key] = scanner.load()
+    scanner.end()
+    return nb
+
+
+def read_cell_json(scanner):
+    cell = dict()
+    for key in scanner.members():
+        if key == "outputs":
+            scanner.skip()
+            cell["outputs"] = []
+        elif key == "execution_count":
+            scanner.skip()
+            cell["execution_count"] = None
+        else:
+            cell[key] = scanner.load()
+    return cell
+
+
+# reads json from a file a chunk at a time. objects and arrays can be walked
+# w/ members() and elements(), and values either loaded or skipped. only the
+# current chunk (and the text of a value being loaded) is held in memory
+class JsonScanner:
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ""
+        self.pos = 0
+
+    # iterate the keys of an object (the caller consumes each value)
+    def members(self):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = json.loads(self.scan(keep=True))
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    # iterate the elements of an array (the caller consumes each one)
+    def elements(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.expect(",]") == "]":
+                return
+
+    def load(self):
+        return json.loads(self.scan(keep=True))
+
+    def skip(self):
+        self.scan(keep=False)
+
+    # confirm that nothing but whitespace follows
+    def end(self):
+        if self.peek(required=False) is not None:
+            raise ValueError("Unexpected data after notebook JSON")
+
+    # the next non-whitespace character (None at the end of the file)
+    def peek(self, required=True):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_chunk(self.pos, None, required):
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(
+                "Expected '{0}' in notebook JSON but found '{1}'".format(chars, char)
+            )
+        self.pos += 1
+        return char
+
+    # move past the next value, returning its text if keep is set
+    def scan(self, keep):
+        self.peek()
+        start = self.pos
+        pieces = [] if keep else None
+        depth = 0
+        in_string = False
+        quote = -1
+        while True:
+            if in_string:
+                # (str.find is much faster than a regex over long strings.
+                # the next quote is kept so that escapes don't search again)
+                if quote < self.pos:
+                    quote = self.buffer.find('"', self.pos)
+                    if quote == -1:
+                        quote = len(self.buffer)
+                escape = self.buffer.find("\\", self.pos, quote)
+                if escape != -1:
+                    if escape + 1 < len(self.buffer):
+                        self.pos = escape + 2
+                        continue
+                    # the escaped character is in the next chunk
+                    self.pos = escape
+                elif quote < len(self.buffer):
+                    self.pos = quote + 1
+                    in_string = False
+                    if depth == 0:
+                        break
+                    continue
+                else:
+                    self.pos = len(self.buffer)
+            elif depth == 0 and self.buffer[self.pos] not in '"[{':
+                match = PRIMITIVE_END.search(self.buffer, self.pos)
+                if match:
+                    self.pos = match.start()
+                    break
+                # (the end of the file also ends a top level primitive)
+                self.pos = len(self.buffer)
+                if not self.read_chunk(start, pieces, False):
+                    break
+                start = 0
+                continue
+            else:
+                match = CONTAINER_SPECIAL.search(self.buffer, self.pos)
+                if match:
+                    self.pos = match.end()
+                    char = match.group()
+                    if char == '"':
+                        in_string = True
+                    elif char in "[{":
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    continue
+                self.pos = len(self.buffer)
+            self.read_chunk(start, pieces, True)
+            start = 0
+            quote = -1
+        if keep:
+            pieces.append(self.buffer[start : self.pos])
+            return "".join(pieces)
+
+    # read the next chunk of the file, dropping what has been consumed (the
+    # text of a value being kept is first added to pieces). returns False at
+    # the end of the file (or raises if more is required)
+    def read_chunk(self, start, pieces, required):
+        chunk = self.file.read(CHUNK_SIZE)
+        if not chunk:
+            if required:
+                raise ValueError("Unexpected end of notebook JSON")
+            return False
+        if pieces is not None:
+            pieces.append(self.buffer[start : self.pos])
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
@@ -6,33 +6,45 @@ import atexit
 import glob
 import sys
 import json
-import pprint
-import copy
+import queue
 import base64
+import threading
 
 from pathlib import Path
+from concurrent.futures import Future
 
 from yaml import safe_load as parse_string
 from yaml import safe_dump
 
 from log import trace
 import nbformat
+from nbreader import read_notebook
 from nbclient import NotebookClient
-from jupyter_client import KernelManager
 from jupyter_core_utils_vendor import run_sync
 import asyncio
 
-# optional import of papermill for params support
-try:
-    from papermill import translators as papermill_translate
-except ImportError:
-    papermill_translate = None
 
-# optional import of jupyter-cache
-try:
-    from jupyter_cache import get_cache
-except ImportError:
-    get_cache = None
+# optional import of papermill for params support (imported on demand as
+# most renders don't use parameters)
+def papermill_translators():
+    try:
+        from papermill import translators
+
+        return translators
+    except ImportError:
+        return None
+
+
+# optional import of jupyter-cache (imported on demand as most renders
+# don't use the cache)
+def jupyter_cache_module():
+    try:
+        import jupyter_cache
+
+        return jupyter_cache
+    except ImportError:
+        return None
+
 
 NB_FORMAT_VERSION = 4
 
@@ -100,6 +112,11 @@ def build_kernel_options(options):
     else:
         cache = "user"
 
+    # how the kernel namespace is reset between renders
+    reset_strategy = os.getenv("QUARTO_JUPYTER_RESET", "full")
+    if reset_strategy not in ("full", "selective", "background"):
+        reset_strategy = "full"
+
     return {
         "format": format,
         "resource_dir": resource_dir,
@@ -117,39 +134,65 @@ def build_kernel_options(options):
         "is_shiny": is_shiny,
         "is_dashboard": is_dashboard,
         "cache": cache,
+        "reset_strategy": reset_strategy,
     }
 
 
-def set_env_vars(options):
-    os.environ["QUARTO_FIG_WIDTH"] = str(options["fig_width"])
-    os.environ["QUARTO_FIG_HEIGHT"] = str(options["fig_height"])
+def kernel_env_vars(options):
+    env = dict()
+    env["QUARTO_FIG_WIDTH"] = str(options["fig_width"])
+    env["QUARTO_FIG_HEIGHT"] = str(options["fig_height"])
     if options["fig_format"] == "retina":
-        os.environ["QUARTO_FIG_DPI"] = str(options["fig_dpi"] * 2)
-        os.environ["QUARTO_FIG_FORMAT"] = "png"
+        env["QUARTO_FIG_DPI"] = str(options["fig_dpi"] * 2)
+        env["QUARTO_FIG_FORMAT"] = "png"
     else:
-        os.environ["QUARTO_FIG_DPI"] = str(options["fig_dpi"])
-        os.environ["QUARTO_FIG_FORMAT"] = options["fig_format"]
+        env["QUARTO_FIG_DPI"] = str(options["fig_dpi"])
+        env["QUARTO_FIG_FORMAT"] = options["fig_format"]
+    return env
+
+
+def set_env_vars(options):
+    os.environ.update(kernel_env_vars(options))
 
 
-def retrieve_nb_from_cache(nb, status, input, **kwargs):
+def retrieve_nb_from_cache(nb, status, input_path, stream=None, **kwargs):
     cache = kwargs["cache"]
     # are we using the cache, if so connect to the cache, and then if we aren't in 'refresh'
     # (forced re-execution) mode then try to satisfy the execution request from the cache
     if cache == True or cache == "refresh":
         trace("using cache")
-        if not get_cache:
-            raise ImportError(
-                "The jupyter-cache package is required for cached execution"
-            )
-        trace("getting cache")
         # Respect env var used to modify default cache dir
         # https://jupyter-cache.readthedocs.io/en/latest/using/cli.html
-        nb_cache = get_cache(os.getenv("JUPYTERCACHE", ".jupyter_cache"))
+        cache_dir = os.path.join(
+            os.path.dirname(input_path),
+            os.getenv("JUPYTERCACHE", ".jupyter_cache"),
+        )
+        if nb_cache_backend() == "native":
+            from cache import CellCache
+
+            trace("getting native cache")
+            nb_cache = CellCache(cache_dir)
+        else:
+            cache_module = jupyter_cache_module()
+            if not cache_module:
+                raise ImportError(
+                    "The jupyter-cache package is required for cached execution"
+                )
+            trace("getting cache")
+            nb_cache = cache_module.get_cache(cache_dir)
         if not cache == "refresh":
-            cached_nb = nb_from_cache(nb, nb_cache)
+            if nb_cache_backend() == "native":
+                cached_nb = nb_from_cell_cache(nb, nb_cache, kwargs)
+                nb_cache.record_lookup(bool(cached_nb))
+            else:
+                with nb_cache_lock(nb_cache):
+                    cached_nb = nb_from_cache(nb, nb_cache)
             if cached_nb:
                 cached_nb.cells.pop(0)
-                nb_write(cached_nb, input)
+                if stream:
+                    nb_stream(cached_nb, stream)
+                else:
+                    nb_write(cached_nb, input_path)
                 status("(Notebook read from cache)\n\n")
                 trace("(Notebook read from cache)")
                 return True  # can persist kernel
@@ -159,54 +202,204 @@ def retrieve_nb_from_cache(nb, status, input, **kwargs):
     return nb_cache
 
 
+# cache implementation to use for 'cache: true' ('jupyter-cache' or 'native')
+def nb_cache_backend():
+    return os.getenv("QUARTO_JUPYTER_CACHE_BACKEND", "jupyter-cache")
+
+
+# write an executed notebook (still including the setup cell) to the cache
+def nb_cache_store(nb_cache, nb, input_path, options, kernel_deps=None):
+    if nb_cache_backend() == "native":
+        from cache import cache_max_bytes
+
+        nb_to_cell_cache(nb, nb_cache, options, kernel_deps)
+        freed = nb_cache.evict(cache_max_bytes())
+        if freed:
+            trace("evicted {0} bytes from the cache".format(freed))
+    else:
+        nb_write(nb, input_path)
+        with nb_cache_lock(nb_cache):
+            nb_cache.cache_notebook_file(path=Path(input_path), overwrite=True)
+
+
+# jupyter-cache doesn't coordinate processes that share a cache, so reads
+# and writes from quarto are serialized w/ a lock file in the cache dir
+def nb_cache_lock(nb_cache):
+    from cache import CacheLock
+
+    return CacheLock(os.path.join(nb_cache.path, "quarto.lock"))
+
+
+# state for a kernel that is persisted across executions. the server
+# uses one session per concurrent request; isolated sessions don't touch
+# process-wide state (working directory, environment) so that several
+# of them can execute at once. threaded sessions (used from several server
+# threads) do all of their kernel i/o on a thread of their own (see run)
+class KernelSession:
+    def __init__(self, isolated=False, threaded=False):
+        self.isolated = isolated
+        self.threaded = threaded
+        self.thread = None
+        self.client = None
+        # started ahead of time and not yet bound to a document
+        self.standby = False
+        self.kernel_deps = None
+        # the cells of the last execution (for selective re-execution)
+        self.dataflow = None
+        # fingerprint of the last setup cell executed in the kernel
+        self.setup_fingerprint = None
+        # journal of the current execution (resumed by the next one if the
+        # execution failed)
+        self.journal = None
+
+    @property
+    def input(self):
+        if self.client:
+            return self.client.resources["metadata"]["input"]
+        else:
+            return None
+
+    # call fn on the session's thread (or directly for sessions that aren't
+    # threaded). nbclient runs an event loop per thread, so this keeps the
+    # kernel client on one thread and loop for its lifetime, and the number
+    # of threads (and loops) bounded by the number of sessions
+    def run(self, fn, *args):
+        if not self.threaded or threading.current_thread() is self.thread:
+            return fn(*args)
+        if self.thread is None:
+            self.thread = SessionThread()
+        return self.thread.call(fn, *args)
+
+    # allow the kernel to be bound to another document (its state is
+    # reset by the setup cell)
+    def unbind(self):
+        if self.client:
+            self.standby = True
+        self.dataflow = None
+        self.setup_fingerprint = None
+
+    def close(self):
+        if self.client:
+            trace("shutting down kernel for " + str(self.input))
+            atexit.unregister(self.client._cleanup_kernel)
+            try:
+                self.run(self.client._cleanup_kernel)
+            except Exception as e:
+                trace("error shutting down kernel: " + str(e))
+            self.client = None
+        if self.thread:
+            self.thread.stop()
+            self.thread = None
+        if self.journal:
+            self.journal.abandon()
+            self.journal = None
+        self.kernel_deps = None
+        self.dataflow = None
+        self.setup_fingerprint = None
+
+
+# a thread that runs calls for a session. names are re-used (lowest free
+# slot first) as the event loop map of older jupyter_core versions is keyed
+# by thread name
+class SessionThread(threading.Thread):
+    slots = set()
+    slots_lock = threading.Lock()
+
+    def __init__(self):
+        with SessionThread.slots_lock:
+            self.slot = next(
+                i for i in range(len(self.slots) + 1) if i not in self.slots
+            )
+            SessionThread.slots.add(self.slot)
+        super().__init__(name="quarto-session-" + str(self.slot), daemon=True)
+        self.calls = queue.Queue()
+        self.start()
+
+    def call(self, fn, *args):
+        result = Future()
+        self.calls.put((fn, args, result))
+        return result.result()
+
+    def stop(self):
+        self.calls.put(None)
+
+    def run(self):
+        try:
+            while True:
+                call = self.calls.get()
+                if call is None:
+                    return
+                fn, args, result = call
+                try:
+                    result.set_result(fn(*args))
+                except BaseException as e:
+                    result.set_exception(e)
+        finally:
+            with SessionThread.slots_lock:
+                SessionThread.slots.discard(self.slot)
+
+
+# session used when executing without a concurrent server
+default_session = KernelSession()
+
+
+# the python command and supervisor of the first execution in this process.
+# a kernel can't be restarted w/ another python or supervisor, so a server
+# exits when they change (they are process-wide rather than per session)
+process_kernel_options = dict()
+
+
 # check if the kernel needs to be restarted
 # and records necessary state for the next execution
-#
-# TODO why is the state here set on the function?
 def check_for_kernel_restart(options):
-    # if this is a re-execution of a previously loaded kernel,
-    # make sure the underlying python version hasn't changed
-    python_cmd = options.get("python_cmd", None)
-    if python_cmd:
-        if hasattr(notebook_execute, "python_cmd"):
-            if notebook_execute.python_cmd != python_cmd:
-                return True
-        else:
-            notebook_execute.python_cmd = python_cmd
-
-    # if there is a supervisor_id then abort if it has changed
-    supervisor_pid = options.get("supervisor_pid", None)
-    if supervisor_pid:
-        if hasattr(notebook_execute, "supervisor_pid"):
-            if notebook_execute.supervisor_pid != supervisor_pid:
+    # if this is a re-execution of a previously loaded kernel, make sure the
+    # underlying python version hasn't changed. if there is a supervisor_id
+    # then abort if it has changed
+    for name in ("python_cmd", "supervisor_pid"):
+        value = options.get(name, None)
+        if value:
+            if process_kernel_options.setdefault(name, value) != value:
                 return True
-        else:
-            notebook_execute.supervisor_pid = supervisor_pid
+    return False
 
 
-# execute a notebook
-def notebook_execute(options, status):
+# execute a notebook. if a stream function is provided then cells are sent
+# to it as they complete (rather than the notebook being written to disk)
+def notebook_execute(options, status, session=default_session, stream=None):
     trace("inside notebook_execute")
     if check_for_kernel_restart(options):
         raise RestartKernel
 
-    # change working directory and strip dir off of paths
+    # change working directory and strip dir off of paths (isolated sessions
+    # use absolute paths instead as the working directory is process-wide)
     original_input = options["target"]["input"]
-    os.chdir(Path(original_input).parent)
+    input_dir = os.path.dirname(os.path.abspath(original_input))
     input = Path(original_input).name
+    input_path = os.path.join(input_dir, input)
+    if not session.isolated:
+        os.chdir(input_dir)
 
     quarto_kernel_setup_options = build_kernel_options(options)
     quarto_kernel_setup_options["input"] = input
+
+    # standby (or unbound) kernels weren't started in the input directory
+    if session.standby and not quarto_kernel_setup_options["run_path"]:
+        quarto_kernel_setup_options["run_path"] = input_dir
     allow_errors = quarto_kernel_setup_options["allow_errors"]
     quiet = quarto_kernel_setup_options["quiet"]
     resource_dir = quarto_kernel_setup_options["resource_dir"]
     eval = quarto_kernel_setup_options["eval"]
 
-    # set environment variables
-    set_env_vars(quarto_kernel_setup_options)
+    # set environment variables (isolated sessions pass them to the kernel)
+    if session.isolated:
+        kernel_env = dict(os.environ)
+        kernel_env.update(kernel_env_vars(quarto_kernel_setup_options))
+    else:
+        set_env_vars(quarto_kernel_setup_options)
+        kernel_env = None
 
-    # read the notebook
-    nb = nbformat.read(input, as_version=NB_FORMAT_VERSION)
+    # read the notebook (w/o the outputs that execution replaces)
+    nb = read_notebook(input_path, NB_FORMAT_VERSION)
 
     trace("notebook was read")
     # inject parameters if provided
@@ -217,10 +410,35 @@ def notebook_execute(options, status):
     setup_cell = nb_setup_cell(nb, quarto_kernel_setup_options)
     nb.cells.insert(0, setup_cell)
 
-    nb_cache = retrieve_nb_from_cache(nb, status, **quarto_kernel_setup_options)
+    nb_cache = retrieve_nb_from_cache(
+        nb, status, input_path, stream, **quarto_kernel_setup_options
+    )
     if nb_cache == True:
         return True  # True indicates notebook read from cache, and hence kernel can be persisted
 
+    # the journal of a failed execution of this input can be resumed (this
+    # session's kernel still holds the state of the journaled cells), others
+    # are abandoned. a complete journal is re-used w/o executing
+    resume_journal = None
+    if session.journal:
+        from journal import journal_path
+
+        session.journal.close()
+        if (
+            session.client
+            and not session.journal.error
+            and session.journal.path == journal_path(input_path)
+        ):
+            resume_journal = session.journal
+        else:
+            session.journal.abandon()
+        session.journal = None
+    if nb_journal_enabled() and quarto_kernel_setup_options["cache"] != "refresh":
+        if nb_from_journal(nb, input_path, stream, quarto_kernel_setup_options):
+            status("(Notebook read from journal)\n\n")
+            trace("(Notebook read from journal)")
+            return True
+
     # create resources for execution
     resources = dict(
         {
@@ -231,11 +449,13 @@ def notebook_execute(options, status):
     )
     if quarto_kernel_setup_options["run_path"]:
         resources["metadata"]["path"] = quarto_kernel_setup_options["run_path"]
+    elif session.isolated:
+        resources["metadata"]["path"] = input_dir
 
     trace("Will attempt to create notebook")
     # create NotebookClient
     trace("type of notebook: {0}".format(type(nb)))
-    client, created = notebook_init(nb, resources, allow_errors)
+    client, created = notebook_init(nb, resources, allow_errors, session, kernel_env)
 
     msg = client.kc.session.msg(
         "comm_open",
@@ -259,6 +479,7 @@ def notebook_execute(options, status):
     max_label_len = 0
 
     kernel_supports_daemonization = False
+    reloaded = None
 
     def handle_quarto_metadata(cell):
         def handle_meta_object(obj):
@@ -275,6 +496,57 @@ def notebook_execute(options, status):
         for output in cell.get("outputs", []):
             handle_meta_object(output.get("metadata", {}))
 
+    # find checkpointed cells and the checkpoint to resume from
+    cache_keys, checkpoints, resume_index, resume_entries = nb_checkpoints(
+        client.nb, nb_cache, quarto_kernel_setup_options
+    )
+
+    # in a live kernel, execute only the cells affected by changes since the
+    # last execution (w/o the setup cell, which resets the kernel)
+    dataflow = None if created else nb_dataflow_plan(session, client.nb, input_path)
+    session_dataflow = session.dataflow and session.dataflow["cells"]
+    session.dataflow = None
+    if dataflow is not None:
+        resume_index = 0
+
+    # a kernel that already ran the same setup cell only needs to be reset
+    setup_fingerprint = nb_setup_fingerprint(client.nb.cells[0])
+    reset_cell = None
+    if not created and setup_fingerprint == session.setup_fingerprint:
+        reset_cell = nb_reset_cell(
+            client.nb, resource_dir, quarto_kernel_setup_options["run_path"]
+        )
+    session.setup_fingerprint = None
+
+    # journal the cells as they complete (w/ their cache keys, so that the
+    # journal can be resumed or re-used if the render fails). execution
+    # resumes from a checkpoint saved among the cells journaled by a failed
+    # execution in this kernel, w/ their outputs taken from the journal
+    journal = None
+    journal_resume = False
+    if nb_journal_enabled() and not stream:
+        from journal import NotebookJournal
+
+        journal_keys = cache_keys or dict(
+            nb_cell_cache_keys(client.nb, quarto_kernel_setup_options)
+        )
+        if resume_journal and dataflow is None:
+            resume = nb_journal_resume(input_path, journal_keys, checkpoints, nb_cache)
+            if resume and resume[0] >= resume_index:
+                resume_index, resume_entries = resume
+                journal_resume = True
+        journal = session.journal = NotebookJournal(input_path)
+    elif resume_journal:
+        resume_journal.abandon()
+
+    # otherwise serve the outputs of unchanged cells that the cells which
+    # execute don't depend on from the cache
+    served_entries = dict()
+    if dataflow is None:
+        served_entries = nb_cache_serve_plan(
+            client.nb, nb_cache, cache_keys, quarto_kernel_setup_options, resume_index
+        )
+
     for cell in client.nb.cells:
         # compute total code cells (for progress)
         if cell.cell_type == "code":
@@ -292,7 +564,13 @@ def notebook_execute(options, status):
         padding = "." * (max_label_len - len(cell_label))
 
         # progress
-        progress = (not quiet) and cell.cell_type == "code" and index > 0
+        progress = (
+            (not quiet)
+            and cell.cell_type == "code"
+            and index > resume_index
+            and (dataflow is None or index in dataflow)
+            and index not in served_entries
+        )
         if progress:
             status(
                 "  Cell {0}/{1}: '{2}'{3}...".format(
@@ -300,40 +578,89 @@ def notebook_execute(options, status):
                 )
             )
 
-        # clear cell output
-        cell = cell_clear_output(cell)
-
-        # execute cell
-        trace("Executing cell {0}".format(index))
-
-        if cell.cell_type == "code":
-            cell = cell_execute(
-                client,
-                cell,
-                index,
-                current_code_cell,
-                eval,
-                index > 0,  # add_to_history
-            )
+        if 0 < index <= resume_index:
+            # the kernel state for this cell was restored from a checkpoint
+            # (w/ its outputs from the cache or the journal)
+            if journal_resume:
+                cell = cell_from_journal(cell, resume_entries[index])
+            elif index in resume_entries:
+                cell = cell_from_cache_entry(cell, resume_entries[index])
+            if cell.cell_type == "code":
+                cell.execution_count = current_code_cell
+        elif (
+            dataflow is not None and cell.cell_type == "code" and index not in dataflow
+        ):
+            # unaffected by changes (or the setup cell): re-use the outputs
+            cell.outputs = session_dataflow[index]["outputs"]
             cell.execution_count = current_code_cell
-        elif cell.cell_type == "markdown":
-            cell = cell_execute_inline(client, cell)
+        elif index in served_entries:
+            # unchanged and unaffected by the cells that execute: serve the
+            # cached outputs
+            cell = cell_from_cache_entry(cell, served_entries[index])
+            if cell.cell_type == "code":
+                cell.execution_count = current_code_cell
+        elif index == 0 and reset_cell is not None:
+            # the setup cell already ran in this kernel w/ the same options:
+            # reset the kernel and report dependencies as the setup cell does
+            trace("Resetting kernel w/o the setup cell")
+            reset = nb_execute_internal_cell(client, reset_cell)
+            if any(output.get("output_type") == "error" for output in reset.outputs):
+                raise RestartKernel
+            cell.outputs = nb_execute_internal_cell(
+                client, nb_dependencies_cell(client.nb, resource_dir)
+            ).outputs
+            cell.execution_count = current_code_cell
+        else:
+            # clear cell output
+            cell = cell_clear_output(cell)
+
+            # execute cell
+            trace("Executing cell {0}".format(index))
+
+            if cell.cell_type == "code":
+                cell = cell_execute(
+                    client,
+                    cell,
+                    index,
+                    current_code_cell,
+                    eval,
+                    index > 0,  # add_to_history
+                )
+                cell.execution_count = current_code_cell
+            elif cell.cell_type == "markdown":
+                cell = cell_execute_inline(client, cell)
 
-        trace("Executed cell {0}".format(index))
+            trace("Executed cell {0}".format(index))
 
         # if this was the setup cell, see if we need to exit b/c dependencies are out of date
         if index == 0:
             # confirm kernel_deps haven't changed (restart if they have)
-            if hasattr(notebook_execute, "kernel_deps"):
-                kernel_deps = nb_kernel_dependencies(cell)
-                if kernel_deps:
+            kernel_deps = nb_kernel_dependencies(
+                cell
+                if dataflow is None
+                else nb_execute_internal_cell(
+                    client, nb_dependencies_cell(client.nb, resource_dir)
+                ),
+                session.kernel_deps,
+            )
+            if kernel_deps:
+                if session.kernel_deps is not None:
                     kernel_supports_daemonization = True
-                    for path in kernel_deps.keys():
-                        if path in notebook_execute.kernel_deps.keys():
-                            if notebook_execute.kernel_deps[path] != kernel_deps[path]:
-                                raise RestartKernel
-                        else:
-                            notebook_execute.kernel_deps[path] = kernel_deps[path]
+                    if kernel_deps["changed"]:
+                        # reload changed modules in place if we can
+                        reloaded = nb_reload_modules(
+                            client,
+                            kernel_deps["changed"],
+                            nb_reload_dirs(input_dir, quarto_kernel_setup_options),
+                            resource_dir,
+                        )
+                        if reloaded is None:
+                            raise RestartKernel
+                        # the kernel state may refer to the old modules
+                        dataflow = None
+                session_record_kernel_dependencies(session, kernel_deps)
+
+            session.setup_fingerprint = setup_fingerprint
 
             trace("Handling quarto metadata")
             trace(json.dumps(cell, indent=2))
@@ -343,10 +670,51 @@ def notebook_execute(options, status):
             # we are done w/ setup (with no restarts) so it's safe to print 'Executing...'
             if not quiet:
                 status("\nExecuting '{0}'\n".format(input))
+                if reloaded:
+                    status(
+                        "  Reloaded changed modules: {0}\n".format(", ".join(reloaded))
+                    )
+                if dataflow is not None:
+                    status(
+                        "  Re-executing {0} of {1} cells affected by changes\n".format(
+                            len(dataflow), total_code_cells - 1
+                        )
+                    )
+                if served_entries:
+                    status(
+                        "  Serving {0} unchanged cells from the cache\n".format(
+                            len(served_entries)
+                        )
+                    )
+
+            # restore the checkpoint (executing from the beginning if we can't)
+            if resume_index > 0:
+                if nb_restore_checkpoint(
+                    client, nb_cache, checkpoints[resume_index], resource_dir
+                ):
+                    trace(
+                        "Resumed from checkpoint at cell {0}{1}".format(
+                            resume_index, " (w/ journal)" if journal_resume else ""
+                        )
+                    )
+                    if not quiet:
+                        status(
+                            "  Resuming from checkpoint at cell '{0}'\n".format(
+                                cell_labels[resume_index] or resume_index
+                            )
+                        )
+                else:
+                    trace("Unable to restore checkpoint, executing all cells")
+                    resume_index = 0
+                    journal_resume = False
 
         # assign cell
         client.nb.cells[index] = cell
 
+        # stream cell (w/o the setup cell and its execution count)
+        if stream and index > 0:
+            stream("cell", nb_stream_cell(index - 1, cell, 1))
+
         # increment current code cell
         if cell.cell_type == "code":
             current_code_cell += 1
@@ -356,51 +724,107 @@ def notebook_execute(options, status):
             status("Done\n")
             trace("Done")
 
+        # save a checkpoint after checkpointed cells (unless the kernel is
+        # missing the state of cells served from the cache)
+        if (
+            index in checkpoints
+            and index > resume_index
+            and not any(served <= index for served in served_entries)
+        ):
+            unsaved = nb_save_checkpoint(
+                client, nb_cache, cache_keys, index, session, resource_dir
+            )
+            if unsaved is None:
+                status("  Checkpoint not saved (error saving kernel state)\n")
+            elif unsaved:
+                status(
+                    "  Checkpoint not saved (unable to save {0})\n".format(
+                        ", ".join(unsaved)
+                    )
+                )
+
+        # journal the cell (w/o the setup cell). cells served from the cache
+        # are journaled w/o a key as their state isn't in the kernel
+        if journal and index > 0:
+            key = None if index in served_entries else journal_keys.get(index)
+            journal.append(index, key, cell)
+
     trace("Notebook execution complete")
 
     # set widgets metadata
     client.set_widgets_metadata()
+    if journal:
+        journal.finish(
+            client.nb.metadata, nb_kernel_environment(client, session, resource_dir)
+        )
 
-    # write to the cache
-    if nb_cache:
-        nb_write(client.nb, input)
-        nb_cache.cache_notebook_file(path=Path(input), overwrite=True)
-
-    # remove setup cell (then renumber execution_Count)
-    client.nb.cells.pop(0)
-    for index, cell in enumerate(client.nb.cells):
-        if cell.cell_type == "code":
-            cell.execution_count = cell.execution_count - 1
-
-    # re-write without setup cell
-    nb_write(client.nb, input)
-
-    # execute cleanup cell
-    cleanup_cell = nb_cleanup_cell(nb, resource_dir)
+    # record the cells for selective re-execution (the kernel state is kept
+    # rather than reset by the cleanup cell)
+    dependencies_cell = None
+    if nb_dataflow_enabled():
+        dependencies_cell = nb_dependencies_cell(nb, resource_dir)
+        if dependencies_cell:
+            session.dataflow = nb_dataflow_record(client.nb, input_path)
+
+    # execute cleanup cell (before writing to the cache, which records the
+    # kernel dependencies it reports)
+    cleanup_cell = dependencies_cell or nb_cleanup_cell(nb, resource_dir)
     if cleanup_cell:
         kernel_supports_daemonization = True
         nb.cells.append(cleanup_cell)
         try:
             client.execute_cell(
-                cell=cleanup_cell, cell_index=len(client.nb.cells) - 1, store_history=False
+                cell=cleanup_cell,
+                cell_index=len(client.nb.cells) - 1,
+                store_history=False,
             )
         except KeyError as e:
             # Same XEUS-based protocol violation as in cell_execute.
             # Cleanup failures are non-fatal: trace and continue so the
             # render still completes (kernel deps just won't be collected).
             if e.args == ("status",):
-                trace("cleanup cell failed with missing 'status' in execute_reply; kernel deps unavailable")
+                trace(
+                    "cleanup cell failed with missing 'status' in execute_reply; kernel deps unavailable"
+                )
             else:
                 raise
         nb.cells.pop()
 
         # record kernel deps after execution (picks up imports that occurred
         # witihn the notebook cells)
-        kernel_deps = nb_kernel_dependencies(cleanup_cell)
+        kernel_deps = nb_kernel_dependencies(cleanup_cell, session.kernel_deps)
         if kernel_deps:
-            notebook_execute.kernel_deps = kernel_deps
-        else:
-            notebook_execute.kernel_deps = {}
+            session_record_kernel_dependencies(session, kernel_deps)
+        elif session.kernel_deps is None:
+            session.kernel_deps = {}
+
+    # write to the cache
+    if nb_cache:
+        nb_cache_store(
+            nb_cache,
+            client.nb,
+            input_path,
+            quarto_kernel_setup_options,
+            session.kernel_deps,
+        )
+
+    # remove setup cell (then renumber execution_Count)
+    client.nb.cells.pop(0)
+    for cell in client.nb.cells:
+        if cell.cell_type == "code":
+            cell.execution_count = cell.execution_count - 1
+
+    # re-write without setup cell (or finish the stream). w/ a journal the
+    # cells are copied from it rather than encoded again
+    if stream:
+        stream("notebook", nb_stream_notebook(client.nb))
+    elif journal and not journal.error:
+        nb_write(client.nb, input_path, journal.cells_json())
+    else:
+        nb_write(client.nb, input_path)
+    if journal:
+        journal.remove()
+        session.journal = None
 
     # progress
     if not quiet:
@@ -410,59 +834,150 @@ def notebook_execute(options, status):
     return kernel_supports_daemonization
 
 
-def notebook_init(nb, resources, allow_errors):
+def notebook_init(nb, resources, allow_errors, session=default_session, env=None):
     created = False
-    if not hasattr(notebook_init, "client"):
+    if not session.client:
         trace("Creating NotebookClient")
-        # create notebook client
-        client = NotebookClient(nb, resources=resources)
-        client.allow_errors = allow_errors
-        client.record_timing = False
-        client.create_kernel_manager()
-        client.start_new_kernel()
-        client.start_new_kernel_client()
-
-        async def get_info():
-            i = client.kc.kernel_info()
-            if asyncio.isfuture(i):
-                return await i
-            else:
-                return i
-
-        info = run_sync(get_info)()
-
-        info_msg = client.wait_for_reply(info)
-        client.nb.metadata["language_info"] = info_msg["content"]["language_info"]
-        notebook_init.client = client
+        client = notebook_start_kernel(nb, resources, allow_errors, env)
+        session.client = client
         created = True
 
-        # cleanup kernel at process exit
-        atexit.register(client._cleanup_kernel)
+    elif session.standby:
+        trace("Using standby kernel")
+        # if the kernel has changed we need to force a restart
+        if nb.metadata.kernelspec.name != session.client.nb.metadata.kernelspec.name:
+            raise RestartKernel
+
+        # bind the kernel to this notebook (if the kernel wasn't previously
+        # bound to another notebook then we consider it newly created)
+        created = session.input is None
+        nb.metadata["language_info"] = session.client.nb.metadata["language_info"]
+        session.client.nb = nb
+        session.client.resources = resources
+        session.client.allow_errors = allow_errors
+        session.standby = False
 
     else:
         # if the kernel has changed we need to force a restart
-        if (
-            nb.metadata.kernelspec.name
-            != notebook_init.client.nb.metadata.kernelspec.name
-        ):
+        if nb.metadata.kernelspec.name != session.client.nb.metadata.kernelspec.name:
             raise RestartKernel
 
         # if the input file has changed we need to force a restart
         if (
             resources["metadata"]["input"]
-            != notebook_init.client.resources["metadata"]["input"]
+            != session.client.resources["metadata"]["input"]
         ):
             raise RestartKernel
 
         # set the new notebook, resources, etc.
-        notebook_init.client.nb = nb
-        notebook_init.client.allow_errors = allow_errors
+        session.client.nb = nb
+        session.client.allow_errors = allow_errors
+
+    return (session.client, created)
 
-    return (notebook_init.client, created)
 
+def notebook_start_kernel(nb, resources, allow_errors, env=None):
+    # create notebook client
+    client = NotebookClient(nb, resources=resources)
+    client.allow_errors = allow_errors
+    client.record_timing = False
+    client.create_kernel_manager()
+    if env is not None:
+        client.start_new_kernel(env=env)
+    else:
+        client.start_new_kernel()
+    client.start_new_kernel_client()
+
+    async def get_info():
+        i = client.kc.kernel_info()
+        if asyncio.isfuture(i):
+            return await i
+        else:
+            return i
+
+    info = run_sync(get_info)()
+
+    info_msg = client.wait_for_reply(info)
+    client.nb.metadata["language_info"] = info_msg["content"]["language_info"]
+
+    # cleanup kernel at process exit
+    atexit.register(client._cleanup_kernel)
+
+    return client
 
-def nb_write(nb, input):
-    nbformat.write(nb, input, version=NB_FORMAT_VERSION)
+
+# start a kernel ahead of time (not yet bound to a document) and run the
+# document independent warmup cell for its language (if there is one). only
+# languages w/ a setup cell are supported (as the setup cell is responsible
+# for changing to the document's directory)
+def notebook_start_standby(session, kernelspec, resource_dir):
+    nb = nbformat.versions[NB_FORMAT_VERSION].new_notebook()
+    nb.metadata.kernelspec = nbformat.from_dict(kernelspec)
+    resources = dict({"metadata": {"input": None}})
+    client = notebook_start_kernel(nb, resources, False)
+    session.client = client
+    session.standby = True
+    language = get_language_from_nb_metadata(client.nb.metadata)
+    if not os.path.isdir(os.path.join(resource_dir, "jupyter", "lang", language)):
+        raise Exception(f"Standby kernels are not supported for {language}")
+    warmup_cell = nb_language_cell("warmup", nb, resource_dir, False)
+    if warmup_cell:
+        trace("running warmup cell for standby kernel")
+        nb.cells.append(warmup_cell)
+        client.execute_cell(cell=warmup_cell, cell_index=0, store_history=False)
+        nb.cells.pop()
+    return session
+
+
+# write an intermediate notebook (read back by quarto and jupyter-cache,
+# never by people). this skips validation and the copy nbformat makes, and
+# writes compact json one cell at a time (rather than pretty printing the
+# whole notebook, including every base64 output, into one string). nb is
+# modified (multiline text is split into lines, as nbformat does). the json
+# of the cells can be provided as cells_json (e.g. from a journal)
+def nb_write(nb, input, cells_json=None):
+    from nbformat.v4.nbjson import BytesEncoder
+    from nbformat.v4.rwbase import split_lines, strip_transient
+
+    encoder = BytesEncoder(ensure_ascii=False, separators=(",", ":"))
+    if cells_json is None:
+        nb = split_lines(nb)
+        cells_json = (encoder.encode(cell) for cell in nb.cells)
+    nb = strip_transient(nb)
+    with open(input, "w", encoding="utf-8") as file:
+        file.write('{"cells":[')
+        for index, cell_json in enumerate(cells_json):
+            if index > 0:
+                file.write(",")
+            file.write(cell_json)
+        file.write("]")
+        for key, value in nb.items():
+            if key != "cells":
+                file.write("," + encoder.encode(key) + ":" + encoder.encode(value))
+        file.write("}\n")
+
+
+# send all of a notebook's cells and then its metadata to a stream
+def nb_stream(nb, stream):
+    for index, cell in enumerate(nb.cells):
+        stream("cell", nb_stream_cell(index, cell))
+    stream("notebook", nb_stream_notebook(nb))
+
+
+def nb_stream_cell(index, cell, execution_count_offset=0):
+    if cell.cell_type == "code" and cell.execution_count is not None:
+        cell = dict(cell)
+        cell["execution_count"] = cell["execution_count"] - execution_count_offset
+    return {"index": index, "cell": cell}
+
+
+def nb_stream_notebook(nb):
+    return {
+        "nbformat": nb.nbformat,
+        "nbformat_minor": nb.nbformat_minor,
+        "metadata": nb.metadata,
+        "cells": len(nb.cells),
+    }
 
 
 def nb_setup_cell(nb, options):
@@ -475,6 +990,22 @@ def nb_cleanup_cell(nb, resource_dir):
     return nb_language_cell("cleanup", nb, resource_dir, False)
 
 
+# resets the kernel as the setup cell does (when it has already run)
+def nb_reset_cell(nb, resource_dir, run_path=""):
+    return nb_language_cell("reset", nb, resource_dir, False, run_path=run_path)
+
+
+def nb_setup_fingerprint(setup_cell):
+    from cache import hash_text
+
+    return hash_text(setup_cell.source)
+
+
+# records kernel deps w/o resetting the kernel
+def nb_dependencies_cell(nb, resource_dir):
+    return nb_language_cell("dependencies", nb, resource_dir, False)
+
+
 def nb_language_cell(name, nb, resource_dir, allow_empty, **args):
     kernelspec = nb.metadata.kernelspec
     language = get_language_from_nb_metadata(nb.metadata)
@@ -518,33 +1049,616 @@ def nb_from_cache(nb, nb_cache, nb_meta=("kernelspec", "language_info", "widgets
         cache_record = nb_cache.match_cache_notebook(nb)
         trace("nb_from_cache get buncle")
         cache_bundle = nb_cache.get_cache_bundle(cache_record.pk)
-        cache_nb = cache_bundle.nb
-        nb = copy.deepcopy(nb)
-        # selected (execution-oriented) metadata
-        trace("nb_from_cache processing metadata")
-        if nb_meta is None:
-            nb.metadata = cache_nb.metadata
-        else:
-            for key in nb_meta:
-                if key in cache_nb.metadata:
-                    nb.metadata[key] = cache_nb.metadata[key]
-        # code cells
-        trace("nb_from_cache processing cells")
-        for idx in range(len(nb.cells)):
-            if nb.cells[idx].cell_type == "code":
-                cache_cell = cache_nb.cells.pop(0)
-                nb.cells[idx] = cache_cell
-        trace("nb_from_cache returning")
-        return nb
+        return nb_merge_cached(nb, cache_bundle.nb, nb_meta)
     except KeyError:
         return None
 
 
+# merge the code cells and metadata of a cached notebook into nb (in place,
+# nb isn't used after a cache hit). the cached notebook's code cells are in
+# the same order as nb's
+def nb_merge_cached(nb, cache_nb, nb_meta=("kernelspec", "language_info", "widgets")):
+    # selected (execution-oriented) metadata
+    trace("nb_from_cache processing metadata")
+    if nb_meta is None:
+        nb.metadata = cache_nb.metadata
+    else:
+        for key in nb_meta:
+            if key in cache_nb.metadata:
+                nb.metadata[key] = cache_nb.metadata[key]
+    # code cells
+    trace("nb_from_cache processing cells")
+    cache_cells = (cell for cell in cache_nb.cells if cell.cell_type == "code")
+    for idx, cell in enumerate(nb.cells):
+        if cell.cell_type == "code":
+            nb.cells[idx] = next(cache_cells)
+    trace("nb_from_cache returning")
+    return nb
+
+
+# the cells that the native cache stores as (index, key) pairs. code cells
+# are keyed by their source and the options that affect execution, chained
+# w/ the key of the code cell before them (the chain starts w/ the kernelspec
+# and execution options). markdown cells are only stored if they have inline
+# expressions and are keyed by their expressions (not their text, so edits
+# to markdown never invalidate the cache)
+def nb_cell_cache_keys(nb, options):
+    from cache import cell_cache_key, notebook_cache_key
+
+    language = get_language_from_nb_metadata(nb.metadata)
+    key = notebook_cache_key(nb.metadata.kernelspec.name, nb_cache_key_options(options))
+    keys = []
+    for index, cell in enumerate(nb.cells):
+        if cell.cell_type == "code":
+            key = cell_cache_key(
+                key,
+                nb_strip_yaml_lines(language, cell.source),
+                nb_cell_cache_key_options(language, cell),
+            )
+            keys.append((index, key))
+        elif cell.cell_type == "markdown":
+            expressions = nb_inline_expressions(language, cell.source)
+            if expressions:
+                keys.append(
+                    (
+                        index,
+                        cell_cache_key(key, "\n".join(expressions), dict(inline=True)),
+                    )
+                )
+    return keys
+
+
+# execution options that aren't reflected in the setup cell
+def nb_cache_key_options(options):
+    return dict(
+        eval=options["eval"],
+        error=options["allow_errors"],
+        params=options["params"],
+    )
+
+
+# cell options that affect execution (changes to the others, e.g. fig-cap,
+# don't invalidate cached outputs)
+KERNEL_CELL_OPTIONS = ("eval", "error")
+
+
+def nb_cell_cache_key_options(language, cell):
+    options = nb_cell_cache_options(language, cell)
+    if isinstance(options, dict):
+        return dict(
+            (name, options[name]) for name in KERNEL_CELL_OPTIONS if name in options
+        )
+    else:
+        return options
+
+
+# cell options for cache keys (invalid yaml is hashed as is rather than
+# reported, it is reported when the cell executes)
+def nb_cell_cache_options(language, cell):
+    yaml_lines = nb_cell_yaml_lines(language, cell.source)
+    try:
+        return parse_string("\n".join(yaml_lines)) or dict()
+    except Exception:
+        return yaml_lines
+
+
+# whether a cell has the 'checkpoint' option (cells w/ invalid options don't,
+# the error is reported when they execute)
+def nb_cell_checkpoint(language, cell):
+    options = nb_cell_cache_options(language, cell)
+    return isinstance(options, dict) and options.get("checkpoint") is True
+
+
+# satisfy a notebook (including its setup cell) from the native cache if all
+# of its cells are cached
+def nb_from_cell_cache(
+    nb, nb_cache, options, nb_meta=("kernelspec", "language_info", "widgets")
+):
+    from cache import environment_changed
+
+    trace("nb_from_cell_cache match")
+    keys = nb_cell_cache_keys(nb, options)
+    notebook = nb_cache.get_notebook(keys[-1][1])
+    if not notebook:
+        return None
+    # the outputs are stale if kernel dependencies changed (e.g. a package was
+    # upgraded) since they were cached
+    if environment_changed(notebook.get("environment")):
+        trace("nb_from_cell_cache environment changed")
+        return None
+    # the setup cell (index 0) isn't cached
+    cached = nb_cache.get_cells(key for _, key in keys[1:])
+    if any(key not in cached for _, key in keys[1:]):
+        return None
+    entries = [(index, cached[key]) for index, key in keys[1:]]
+
+    trace("nb_from_cell_cache processing cells")
+    for index, entry in entries:
+        cell_from_cache_entry(nb.cells[index], entry)
+    execution_count = 0
+    for cell in nb.cells[1:]:
+        if cell.cell_type == "code":
+            execution_count += 1
+            cell.execution_count = execution_count
+    for key in nb_meta:
+        if key in notebook["metadata"]:
+            nb.metadata[key] = nbformat.from_dict(notebook["metadata"][key])
+    return nb
+
+
+def nb_to_cell_cache(
+    nb,
+    nb_cache,
+    options,
+    kernel_deps=None,
+    nb_meta=("kernelspec", "language_info", "widgets"),
+):
+    from cache import environment_fingerprint
+
+    keys = nb_cell_cache_keys(nb, options)
+    environment = environment_fingerprint(kernel_deps) if kernel_deps else None
+    nb_cells_to_cell_cache(nb, nb_cache, keys[1:], environment)
+    metadata = dict((key, nb.metadata[key]) for key in nb_meta if key in nb.metadata)
+    entry = {"metadata": metadata}
+    if environment:
+        entry["environment"] = environment
+    nb_cache.put_notebook(keys[-1][1], entry)
+
+
+def nb_cells_to_cell_cache(nb, nb_cache, keys, environment=None):
+    entries = []
+    for index, key in keys:
+        cell = nb.cells[index]
+        if cell.cell_type == "code":
+            entry = {"outputs": cell.outputs}
+        else:
+            entry = {"user_expressions": cell.metadata.get("user_expressions", [])}
+        entries.append((key, entry))
+    nb_cache.put_cells(entries, environment)
+
+
+def cell_from_cache_entry(cell, entry):
+    if cell.cell_type == "code":
+        cell.outputs = nbformat.from_dict(entry["outputs"])
+    else:
+        cell.metadata["user_expressions"] = nbformat.from_dict(
+            entry["user_expressions"]
+        )
+    return cell
+
+
+# cells w/ the 'checkpoint' option save the kernel namespace after they
+# execute (native cache only). returns the cache keys (index => key), the
+# checkpointed cells (index => key) and the index of the latest checkpoint
+# that execution can resume from along w/ the cache entries of the cells
+# before it (0 if execution starts from the beginning). checkpoints taken in
+# an environment that has changed since can't be resumed from
+def nb_checkpoints(nb, nb_cache, options):
+    from cache import environment_checker
+
+    if not nb_cache or nb_cache_backend() != "native":
+        return dict(), dict(), 0, dict()
+    language = get_language_from_nb_metadata(nb.metadata)
+    keys = dict(nb_cell_cache_keys(nb, options))
+    checkpoints = dict(
+        (index, key)
+        for index, key in keys.items()
+        if index > 0
+        and nb.cells[index].cell_type == "code"
+        and nb_cell_checkpoint(language, nb.cells[index])
+    )
+    if options["cache"] != "refresh":
+        changed = environment_checker()
+        for index in sorted(checkpoints.keys(), reverse=True):
+            if not nb_cache.has_checkpoint(checkpoints[index]):
+                continue
+            if changed(nb_cache.checkpoint_environment(checkpoints[index])):
+                trace("checkpoint environment changed at cell {0}".format(index))
+                continue
+            resume_keys = dict(
+                (cell_index, key)
+                for cell_index, key in keys.items()
+                if 0 < cell_index <= index
+            )
+            cached = nb_cache.get_cells(resume_keys.values())
+            if all(
+                key in cached and not changed(cached[key]["environment"])
+                for key in resume_keys.values()
+            ):
+                entries = dict(
+                    (cell_index, cached[key]) for cell_index, key in resume_keys.items()
+                )
+                return keys, checkpoints, index, entries
+    return keys, checkpoints, 0, dict()
+
+
+# save a checkpoint for the cell at index (and the cache entries of the cells
+# up to and including it so that we can resume from it), w/ the fingerprint
+# of the kernel's environment so far
+def nb_save_checkpoint(client, nb_cache, keys, index, session, resource_dir):
+    key = keys[index]
+    checkpoint_cell = nb_checkpoint_cell(
+        client.nb, "checkpoint", nb_cache.checkpoint_path(key), resource_dir
+    )
+    if not checkpoint_cell:
+        trace("checkpoints not supported for this kernel")
+        return []
+    environment = nb_kernel_environment(client, session, resource_dir)
+    nb_cells_to_cell_cache(
+        client.nb,
+        nb_cache,
+        [(i, k) for i, k in keys.items() if 0 < i <= index],
+        environment,
+    )
+    cell = nb_execute_internal_cell(client, checkpoint_cell)
+    unsaved = nb_internal_cell_result(cell)
+    if unsaved == []:
+        nb_cache.put_checkpoint(key, environment)
+    return unsaved
+
+
+# the fingerprint of the kernel's environment as of now: the dependencies
+# reported by the setup cell along w/ those the cells executed since have
+# imported (for kernels that report them w/o a reset)
+def nb_kernel_environment(client, session, resource_dir):
+    from cache import environment_fingerprint
+
+    dependencies_cell = nb_dependencies_cell(client.nb, resource_dir)
+    if dependencies_cell and session.kernel_deps is not None:
+        kernel_deps = nb_kernel_dependencies(
+            nb_execute_internal_cell(client, dependencies_cell), session.kernel_deps
+        )
+        if kernel_deps:
+            session_record_kernel_dependencies(session, kernel_deps)
+    if not session.kernel_deps:
+        return None
+    return environment_fingerprint(session.kernel_deps)
+
+
+# restore the checkpoint of the cell w/ the given cache key into the kernel.
+# a checkpoint that can't be restored (e.g. a truncated file) is removed from
+# the cache (the kernel namespace is only updated once everything is loaded)
+def nb_restore_checkpoint(client, nb_cache, key, resource_dir):
+    restore_cell = nb_checkpoint_cell(
+        client.nb, "restore", nb_cache.checkpoint_path(key), resource_dir
+    )
+    if not restore_cell:
+        return False
+    cell = nb_execute_internal_cell(client, restore_cell)
+    if nb_internal_cell_result(cell) != []:
+        nb_cache.remove_checkpoint(key)
+        return False
+    nb_cache.touch_checkpoint(key)
+    return True
+
+
+def nb_checkpoint_cell(nb, name, path, resource_dir):
+    path = base64.b64encode(path.encode("utf-8")).decode("utf-8")
+    return nb_language_cell(name, nb, resource_dir, False, path=path)
+
+
+# internal cells print their result as json (the checkpoint cells print the
+# names they couldn't save or restore). None if the cell failed altogether
+def nb_internal_cell_result(cell):
+    for output in cell.outputs:
+        if output.get("output_type") == "error":
+            trace("internal cell error: " + output.get("evalue", ""))
+            return None
+        if output.get("name") == "stdout" and output.get("output_type") == "stream":
+            return json.loads(output.text)
+    return None
+
+
+# execute a cell that isn't part of the notebook. errors don't abort the
+# render (they are left in the cell's outputs for the caller to handle)
+def nb_execute_internal_cell(client, cell):
+    from nbclient.exceptions import CellExecutionError
+
+    client.nb.cells.append(cell)
+    try:
+        return client.execute_cell(
+            cell=cell, cell_index=len(client.nb.cells) - 1, store_history=False
+        )
+    except CellExecutionError:
+        return cell
+    finally:
+        client.nb.cells.pop()
+
+
+# reload changed modules in place rather than restarting the kernel (python
+# only, QUARTO_JUPYTER_RELOAD=1). only modules under the document or project
+# directory are reloaded (changes to installed packages restart the kernel),
+# along w/ the modules there that refer to them. returns the names of the
+# reloaded modules, or None if the kernel needs to be restarted
+def nb_reload_modules(client, changed, dirs, resource_dir):
+    from cache import installed_package
+
+    if os.getenv("QUARTO_JUPYTER_RELOAD", "") in ("", "0", "false"):
+        return None
+    for path in changed.keys():
+        if installed_package(path) or not any(path_in_dir(path, dir) for dir in dirs):
+            trace("kernel dependency outside of the project changed: " + path)
+            return None
+    reload_cell = nb_language_cell(
+        "reload",
+        client.nb,
+        resource_dir,
+        False,
+        paths=nb_encode_json(list(changed.keys())),
+        dirs=nb_encode_json(dirs),
+    )
+    if not reload_cell:
+        return None
+    result = nb_internal_cell_result(nb_execute_internal_cell(client, reload_cell))
+    if not isinstance(result, dict) or "error" in result:
+        trace("unable to reload modules: " + str(result and result.get("error")))
+        return None
+    trace("reloaded modules: " + ", ".join(result["reloaded"]))
+    return result["reloaded"]
+
+
+# the directories whose modules can be reloaded
+def nb_reload_dirs(input_dir, options):
+    dirs = [input_dir]
+    for dir in [options["run_path"], os.getenv("QUARTO_PROJECT_ROOT", "")]:
+        if dir and dir not in dirs:
+            dirs.append(dir)
+    return [os.path.abspath(dir) for dir in dirs]
+
+
+def path_in_dir(path, dir):
+    path = os.path.normcase(os.path.abspath(path))
+    dir = os.path.normcase(os.path.abspath(dir))
+    return path.startswith(dir.rstrip(os.sep) + os.sep)
+
+
+def nb_encode_json(value):
+    return base64.b64encode(json.dumps(value).encode("utf-8")).decode("utf-8")
+
+
+# journal cells to disk as they complete (QUARTO_JUPYTER_JOURNAL=1)
+def nb_journal_enabled():
+    return os.getenv("QUARTO_JUPYTER_JOURNAL", "") not in ("", "0", "false")
+
+
+# take the outputs from the complete journal of a render that failed after
+# executing every cell (if its cache keys match the notebook's cells and the
+# kernel environment it was executed in hasn't changed), then write (or
+# stream) the notebook and remove the journal
+def nb_from_journal(
+    nb, input_path, stream, options, nb_meta=("kernelspec", "language_info", "widgets")
+):
+    from cache import environment_changed
+    from journal import read_journal, journal_path
+
+    journal = read_journal(input_path)
+    if not journal or journal[1] is None:
+        return False
+    entries, metadata, environment = journal
+    if environment_changed(environment):
+        trace("journal environment changed")
+        return False
+    keys = dict(nb_cell_cache_keys(nb, options))
+    if set(entries.keys()) != set(range(1, len(nb.cells))) or any(
+        entries.get(index, (None,))[0] != key
+        for index, key in keys.items()
+        if index > 0
+    ):
+        trace("journal doesn't match the notebook")
+        return False
+
+    nb.cells.pop(0)
+    for index, cell in enumerate(nb.cells):
+        cell_from_journal(cell, entries[index + 1][1])
+    for key in nb_meta:
+        if key in metadata:
+            nb.metadata[key] = metadata[key]
+    if stream:
+        nb_stream(nb, stream)
+    else:
+        nb_write(nb, input_path)
+    os.remove(journal_path(input_path))
+    return True
+
+
+# the cells journaled by a failed execution, which execution can resume
+# after from the latest checkpoint (native cache) saved among them: the
+# kernel is reset and the checkpoint restored, so nothing the cells after
+# it (e.g. the one that failed) did is left. none of the journaled cells may
+# have changed (their cache keys chain the sources of the cells before them)
+# and neither may the checkpoint's environment. returns the index of the
+# checkpointed cell and the cells up to it (index => cell), or None
+def nb_journal_resume(input_path, keys, checkpoints, nb_cache):
+    from cache import environment_changed
+    from journal import read_journal
+
+    journal = read_journal(input_path)
+    if not journal or not checkpoints:
+        return None
+    entries = journal[0]
+    if set(entries.keys()) != set(range(1, len(entries) + 1)):
+        return None
+    if any(key != (keys.get(index) or "") for index, (key, _) in entries.items()):
+        trace("journal doesn't match the notebook")
+        return None
+    for index in sorted(checkpoints.keys(), reverse=True):
+        key = checkpoints[index]
+        if (
+            index in entries
+            and nb_cache.has_checkpoint(key)
+            and not environment_changed(nb_cache.checkpoint_environment(key))
+        ):
+            return index, dict(
+                (cell_index, cell)
+                for cell_index, (_, cell) in entries.items()
+                if cell_index <= index
+            )
+    return None
+
+
+def cell_from_journal(cell, journal_cell):
+    if cell.cell_type == "code":
+        cell.outputs = journal_cell.outputs
+        cell.execution_count = journal_cell.execution_count
+    elif "user_expressions" in journal_cell.metadata:
+        cell.metadata["user_expressions"] = journal_cell.metadata["user_expressions"]
+    return cell
+
+
+# selective re-execution of changed cells (and the cells they affect) in
+# live kernels (python only)
+def nb_dataflow_enabled():
+    return os.getenv("QUARTO_JUPYTER_DATAFLOW", "") not in ("", "0", "false")
+
+
+def nb_dataflow_record(nb, input_path):
+    from dataflow import cell_names
+
+    language = get_language_from_nb_metadata(nb.metadata)
+    cells = []
+    for cell in nb.cells:
+        names = None
+        if cell.cell_type == "code":
+            names = cell_names(nb_strip_yaml_lines(language, cell.source))
+        cells.append(
+            dict(
+                type=cell.cell_type,
+                source=cell.source,
+                names=names,
+                outputs=cell.get("outputs", None),
+            )
+        )
+    return dict(input=input_path, cells=cells)
+
+
+# the indexes of the cells to execute or None to execute all of them (the
+# notebook's cells or setup changed, or they can't all be analysed)
+def nb_dataflow_plan(session, nb, input_path):
+    from dataflow import cell_names, dataflow_cells
+
+    record = session.dataflow
+    if not nb_dataflow_enabled() or not record or record["input"] != input_path:
+        return None
+    language = get_language_from_nb_metadata(nb.metadata)
+    if language != "python" or len(record["cells"]) != len(nb.cells):
+        return None
+    # the setup cell reflects the execution options
+    if record["cells"][0]["source"] != nb.cells[0].source:
+        return None
+    cells = []
+    dirty = set()
+    for index, cell in enumerate(nb.cells):
+        previous = record["cells"][index]
+        if cell.cell_type != previous["type"]:
+            return None
+        if index == 0 or cell.cell_type != "code":
+            cells.append((set(), set(), set(), set()))
+            continue
+        names = cell_names(nb_strip_yaml_lines(language, cell.source))
+        if names is None or previous["names"] is None:
+            return None
+        if cell.source != previous["source"]:
+            dirty.add(index)
+            # names the previous version of the cell defined are affected too
+            names = tuple(map(set.union, names, previous["names"]))
+        cells.append(names)
+    trace("dataflow changed cells: " + str(sorted(dirty)))
+    return dataflow_cells(cells, dirty)
+
+
+# serve the cached outputs of unchanged cells (native cache) w/o executing
+# them, when the cells that execute don't need the kernel state they build:
+# the cells after the last one that isn't cached (e.g. after a markdown cell
+# whose inline expressions changed), or w/ QUARTO_JUPYTER_DATAFLOW=1 (python
+# only) every cell that no cell which executes reads or writes what it
+# writes (cells that do are executed as in a live kernel, see
+# dataflow_cells). cells cached in an environment that has changed since are
+# treated as changed. returns the cache entries of the cells to serve after
+# the cells resumed from a checkpoint (index => entry)
+def nb_cache_serve_plan(nb, nb_cache, keys, options, resume_index):
+    from cache import environment_checker
+
+    if not keys or options["cache"] == "refresh":
+        return dict()
+    changed = environment_checker()
+    cached = dict(
+        (key, entry)
+        for key, entry in nb_cache.get_cells(
+            key for index, key in keys.items() if index > resume_index
+        ).items()
+        if not changed(entry["environment"])
+    )
+    missing = [
+        index
+        for index, key in keys.items()
+        if index > resume_index and key not in cached
+    ]
+    # (a complete chain that wasn't served is stale)
+    if not missing:
+        return dict()
+    execute = nb_cache_serve_dataflow(nb, keys, missing)
+    if execute is None:
+        execute = set(range(max(missing) + 1))
+    trace("cache serve plan executes cells: " + str(sorted(execute)))
+    return dict(
+        (index, cached[key])
+        for index, key in keys.items()
+        if index > resume_index and index not in execute
+    )
+
+
+# the cells to execute for the given changed cells (see dataflow_cells), or
+# None w/o QUARTO_JUPYTER_DATAFLOW=1 or if the cells can't all be analysed
+def nb_cache_serve_dataflow(nb, keys, changed):
+    from dataflow import cell_names, dataflow_cells
+
+    language = get_language_from_nb_metadata(nb.metadata)
+    if not nb_dataflow_enabled() or language != "python":
+        return None
+    cells = []
+    for index, cell in enumerate(nb.cells):
+        source = None
+        if index > 0 and cell.cell_type == "code":
+            source = nb_strip_yaml_lines(language, cell.source)
+        elif index in keys:
+            source = "\n".join(nb_inline_expressions(language, cell.source))
+        names = (set(), set(), set(), set()) if source is None else cell_names(source)
+        if names is None:
+            return None
+        cells.append(names)
+    return dataflow_cells(cells, set(changed))
+
+
 # This function is only called on setup cells
-def nb_kernel_dependencies(setup_cell):
-    for index, output in enumerate(setup_cell.outputs):
+# the kernel dependencies reported by a setup (or cleanup) cell: the modules
+# imported since the last report ('deps', path => mtime) and the previously
+# reported modules that have changed since ('changed', path => mtime or None
+# if removed). custom setup cells may instead report all of the kernel's
+# modules, which are then compared w/ the ones we already know of
+def nb_kernel_dependencies(setup_cell, known=None):
+    for output in setup_cell.outputs:
         if output.name == "stdout" and output.output_type == "stream":
-            return json.loads(output.text)
+            report = json.loads(output.text)
+            if isinstance(report.get("deps"), dict) and "changed" in report:
+                return report
+            known = known or {}
+            changed = dict(
+                (path, mtime)
+                for path, mtime in report.items()
+                if known.get(path, mtime) != mtime
+            )
+            return dict(deps=report, changed=changed)
+
+
+def session_record_kernel_dependencies(session, kernel_deps):
+    if session.kernel_deps is None:
+        session.kernel_deps = dict()
+    session.kernel_deps.update(kernel_deps["deps"])
+    for path, mtime in kernel_deps["changed"].items():
+        if mtime is None:
+            session.kernel_deps.pop(path, None)
+        else:
+            session.kernel_deps[path] = mtime
 
 
 def cell_execute(client, cell, index, execution_count, eval_default, store_history):
@@ -584,12 +1698,14 @@ def cell_execute(client, cell, index, execution_count, eval_default, store_histo
             # execute_reply on error, violating the Jupyter protocol.
             # Record the error in the cell outputs rather than crashing.
             if e.args == ("status",):
-                cell.outputs.append(nbformat.v4.new_output(
-                    output_type="error",
-                    ename="KernelProtocolError",
-                    evalue="Kernel returned execute_reply without status field",
-                    traceback=[],
-                ))
+                cell.outputs.append(
+                    nbformat.v4.new_output(
+                        output_type="error",
+                        ename="KernelProtocolError",
+                        evalue="Kernel returned execute_reply without status field",
+                        traceback=[],
+                    )
+                )
             else:
                 raise
         cell.source = source
@@ -649,10 +1765,7 @@ def cell_execute_inline(client, cell):
 
     # find expressions in source
     language = get_language_from_nb_metadata(client.nb.metadata)
-    source = "".join(cell.source)
-    expressions = re.findall(
-        rf"(?:^|[^`])`{{{language}}}[ \t]([^`]+)`", source, re.MULTILINE
-    )
+    expressions = nb_inline_expressions(language, cell.source)
     if len(expressions):
         # send and wait for 'execute' kernel message w/ user_expressions
         kc = client.kc
@@ -690,6 +1803,11 @@ def cell_execute_inline(client, cell):
     return cell
 
 
+def nb_inline_expressions(language, source):
+    source = "".join(source)
+    return re.findall(rf"(?:^|[^`])`{{{language}}}[ \t]([^`]+)`", source, re.MULTILINE)
+
+
 def cell_clear_output(cell):
     remove_metadata = ["collapsed", "scrolled"]
     if cell.cell_type == "code":
@@ -703,6 +1821,7 @@ def cell_clear_output(cell):
 
 def nb_parameterize(nb, params):
     # verify papermill import
+    papermill_translate = papermill_translators()
     if not papermill_translate:
         raise ImportError(
             "The papermill package is required for processing --execute-params"
@@ -798,9 +1917,13 @@ def find_first_tagged_cell_index(nb, tag):
 
 
 def nb_strip_yaml_options(client, source):
-    yaml_lines = nb_cell_yaml_lines(
+    return nb_strip_yaml_lines(
         get_language_from_nb_metadata(client.nb.metadata), source
     )
+
+
+def nb_strip_yaml_lines(language, source):
+    yaml_lines = nb_cell_yaml_lines(language, source)
     num_yaml_lines = len(yaml_lines)
     if num_yaml_lines > 0:
         return "\n".join(source.splitlines()[num_yaml_lines:])
@@ -899,7 +2022,7 @@ def nb_language_comment_chars(lang):
         haskell="--",
         dot="//",
         apl="⍝",
-        q = "/",
+        q="/",
         ocaml=["(*", "*)"],
     )
     if lang in langs:
@@ -0,0 +1,343 @@
+# pyright: reportMissingImports=false
+
+import os
+import sys
+import threading
+
+from log import trace
+from notebook import KernelSession, default_session, notebook_start_standby
+from watch import DependencyWatcher, watch_available
+
+# optional import of psutil for measuring kernel memory usage
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# least recently used cache of the kernel sessions kept alive by the server.
+# sessions are keyed by input and kernelspec so that
+# switching back to a recently rendered document re-uses its kernel. idle
+# sessions are evicted when there are more than max_sessions or when the
+# kernels together use more than max_rss bytes of memory (0 for no limit).
+# if a resource_dir is provided (and inotify is available) the dependencies
+# of idle sessions are watched and their kernels are restarted in the
+# background when they change. sessions are only isolated if requests are
+# concurrent (otherwise the default session is used while it is free)
+class KernelSessionCache:
+    def __init__(
+        self, max_sessions, max_rss=0, standby=None, resource_dir=None, isolated=False
+    ):
+        self.max_sessions = max(max_sessions, 1)
+        self.max_rss = max_rss
+        self.standby = standby
+        self.isolated = isolated
+        self.lock = threading.Lock()
+        # (key, session) pairs, least recently used first
+        self.idle = []
+        self.busy = []
+        self.resource_dir = resource_dir
+        self.watcher = None
+        if resource_dir and watch_available():
+            try:
+                self.watcher = DependencyWatcher(self.dependency_changed)
+            except OSError as e:
+                trace("unable to watch kernel dependencies: " + str(e))
+
+    def acquire(self, options):
+        key = session_key(options)
+        evicted = []
+        with self.lock:
+            match = next((entry for entry in self.idle if entry[0] == key), None)
+            if match:
+                trace("re-using kernel session for " + str(key[0]))
+                self.idle.remove(match)
+            else:
+                # make room for the new session
+                while (
+                    self.idle and len(self.idle) + len(self.busy) >= self.max_sessions
+                ):
+                    evicted.append(self.idle.pop(0))
+        self.unwatch(evicted + ([match] if match else []))
+        close_sessions(evicted)
+
+        # use a standby kernel for new sessions if we can
+        if not match:
+            session = None
+            if self.standby:
+                session = self.standby.take(options.get("kernelspec", None))
+            if session:
+                session.isolated = self.isolated
+            with self.lock:
+                match = (key, session or self.new_session())
+                self.busy.append(match)
+        else:
+            with self.lock:
+                self.busy.append(match)
+        return match[1]
+
+    # a session w/o a kernel (call w/ lock held)
+    def new_session(self):
+        if self.isolated or any(s is default_session for _, s in self.idle + self.busy):
+            return KernelSession(isolated=self.isolated, threaded=self.isolated)
+        return default_session
+
+    def release(self, session):
+        with self.lock:
+            entry = self.remove_entry(self.busy, session)
+            idle = entry and session.client
+            if idle:
+                self.idle.append(entry)
+            evicted = self.evict()
+        if idle and self.watcher and session.kernel_deps:
+            self.watcher.watch(session, watch_paths(session.kernel_deps))
+        # sessions whose kernel failed to start aren't kept (but may still
+        # have a thread to stop)
+        if entry and not idle:
+            session.close()
+        self.unwatch(evicted)
+        close_sessions(evicted)
+
+    # re-use a busy session's kernel for another input (if the kernelspec
+    # matches)
+    def rebind(self, session, options):
+        key = session_key(options)
+        with self.lock:
+            entry = self.remove_entry(self.busy, session)
+            if not entry:
+                return False
+            if entry[0][1:] != key[1:] or not session.client:
+                self.busy.append(entry)
+                return False
+            self.busy.append((key, session))
+        if entry[0] != key:
+            trace("re-using kernel session for " + str(key[0]))
+            session.unbind()
+        return True
+
+    def discard(self, session):
+        with self.lock:
+            self.remove_entry(self.busy, session)
+            self.remove_entry(self.idle, session)
+        self.unwatch([(None, session)])
+        session.close()
+
+    def close(self):
+        with self.lock:
+            entries = self.idle + self.busy
+            self.idle = []
+            self.busy = []
+        if self.watcher:
+            self.watcher.close()
+        close_sessions(entries)
+        if self.standby:
+            self.standby.close()
+
+    # a dependency of a session's kernel changed (called by the watcher):
+    # restart the kernel in the background if the session is idle (busy
+    # sessions find out when their setup cell reports the change)
+    def dependency_changed(self, session, path):
+        with self.lock:
+            entry = next((entry for entry in self.idle if entry[1] is session), None)
+        if entry:
+            threading.Thread(target=self.restart, args=(entry,), daemon=True).start()
+
+    # replace an idle session w/ a new kernel (on standby for the same key).
+    # if the session is acquired while the new kernel starts then the new
+    # kernel is discarded (the request restarts the kernel itself)
+    def restart(self, entry):
+        key, session = entry
+        trace("restarting kernel for " + str(key[0]) + " (dependencies changed)")
+        replacement = KernelSession(isolated=True, threaded=True)
+        try:
+            kernelspec = session.client.nb.metadata.kernelspec
+            replacement.run(
+                notebook_start_standby, replacement, kernelspec, self.resource_dir
+            )
+            replacement.isolated = self.isolated
+        except Exception as e:
+            trace("error restarting kernel: " + str(e))
+            replacement.close()
+            replacement = None
+        with self.lock:
+            index = next(
+                (i for i, entry in enumerate(self.idle) if entry[1] is session), None
+            )
+            if index is not None:
+                if replacement:
+                    self.idle[index] = (key, replacement)
+                else:
+                    self.idle.pop(index)
+        if index is not None:
+            session.close()
+        elif replacement:
+            replacement.close()
+
+    def unwatch(self, entries):
+        if self.watcher:
+            for _, session in entries:
+                self.watcher.unwatch(session)
+
+    # remove idle sessions (least recently used first) until we are within
+    # our limits. the most recently used session is always kept
+    def evict(self):
+        evicted = []
+        while (
+            len(self.idle) > 1 and len(self.idle) + len(self.busy) > self.max_sessions
+        ):
+            evicted.append(self.idle.pop(0))
+        if self.max_rss > 0 and len(self.idle) > 1:
+            rss = dict((id(s), kernel_rss(s)) for (_, s) in self.idle + self.busy)
+            while len(self.idle) > 1 and sum(rss.values()) > self.max_rss:
+                entry = self.idle.pop(0)
+                trace("kernel memory limit exceeded")
+                rss.pop(id(entry[1]))
+                evicted.append(entry)
+        return evicted
+
+    def remove_entry(self, entries, session):
+        entry = next((entry for entry in entries if entry[1] is session), None)
+        if entry:
+            entries.remove(entry)
+        return entry
+
+
+# kernels started ahead of time (count per kernelspec) so that a new session
+# can take a ready kernel rather than waiting for one to start. each kernel
+# that is taken is replaced in the background (standby sessions are threaded
+# as they are started and used on different threads)
+class KernelStandbyPool:
+    def __init__(self, count, resource_dir):
+        self.count = count
+        self.resource_dir = resource_dir
+        self.condition = threading.Condition()
+        # kernelspec name => dict(kernelspec, ready sessions, number starting)
+        self.pools = dict()
+        self.closed = False
+
+    def prepare(self, kernelspec):
+        name = kernelspec_name(kernelspec)
+        if not name:
+            return
+        with self.condition:
+            if name not in self.pools:
+                self.pools[name] = dict(
+                    kernelspec=kernelspec, ready=[], starting=0, failed=False
+                )
+            self.fill(self.pools[name])
+
+    def take(self, kernelspec):
+        self.prepare(kernelspec)
+        name = kernelspec_name(kernelspec)
+        if not name:
+            return None
+        with self.condition:
+            pool = self.pools[name]
+            # wait for a kernel that is already starting
+            while not pool["ready"] and pool["starting"] > 0 and not self.closed:
+                self.condition.wait()
+            if not pool["ready"]:
+                return None
+            trace("using standby kernel (" + name + ")")
+            session = pool["ready"].pop(0)
+            self.fill(pool)
+            return session
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            sessions = [s for pool in self.pools.values() for s in pool["ready"]]
+            for pool in self.pools.values():
+                pool["ready"] = []
+            self.condition.notify_all()
+        for session in sessions:
+            session.close()
+
+    # start kernels until the pool is full (call with lock held)
+    def fill(self, pool):
+        while (
+            not (self.closed or pool["failed"])
+            and len(pool["ready"]) + pool["starting"] < self.count
+        ):
+            pool["starting"] += 1
+            threading.Thread(target=self.start, args=(pool,), daemon=True).start()
+
+    def start(self, pool):
+        session = KernelSession(isolated=True, threaded=True)
+        try:
+            trace(
+                "starting standby kernel (" + kernelspec_name(pool["kernelspec"]) + ")"
+            )
+            session.run(
+                notebook_start_standby, session, pool["kernelspec"], self.resource_dir
+            )
+        except Exception as e:
+            # don't keep trying for kernels that can't be started on standby
+            trace("error starting standby kernel: " + str(e))
+            with self.condition:
+                pool["failed"] = True
+            session.close()
+            session = None
+        with self.condition:
+            pool["starting"] -= 1
+            if session and not self.closed:
+                pool["ready"].append(session)
+                session = None
+            self.condition.notify_all()
+        # pool closed while we were starting
+        if session:
+            session.close()
+
+
+def kernelspec_name(kernelspec):
+    return (kernelspec or {}).get("name", None)
+
+
+def session_key(options):
+    input = options["target"]["input"]
+    kernelspec = options.get("kernelspec", None)
+    return (input, kernelspec_name(kernelspec))
+
+
+# the kernel dependencies to watch (changes to modules that can be reloaded
+# in place don't require a restart)
+def watch_paths(kernel_deps):
+    from cache import installed_package
+
+    if os.getenv("QUARTO_JUPYTER_RELOAD", "") in ("", "0", "false"):
+        return list(kernel_deps.keys())
+    return [path for path in kernel_deps.keys() if installed_package(path)]
+
+
+def close_sessions(entries):
+    for key, session in entries:
+        trace("evicting kernel session for " + str(key[0]))
+        session.close()
+
+
+# resident memory of a session's kernel process (0 if it can't be determined)
+def kernel_rss(session):
+    pid = kernel_pid(session)
+    if pid is None:
+        return 0
+    try:
+        if psutil:
+            return psutil.Process(pid).memory_info().rss
+        elif sys.platform.startswith("linux"):
+            with open(f"/proc/{pid}/statm", "r") as file:
+                pages = int(file.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    return 0
+
+
+def kernel_pid(session):
+    km = session.client.km if session.client else None
+    if km is None:
+        return None
+    provisioner = getattr(km, "provisioner", None)
+    if provisioner is not None:
+        return getattr(provisioner, "pid", None)
+    kernel = getattr(km, "kernel", None)
+    return getattr(kernel, "pid", None)
@@ -0,0 +1,179 @@
+# pyright: reportMissingImports=false
+
+import os
+import sys
+import select
+import struct
+import threading
+
+from log import trace
+
+# inotify (linux only) through ctypes
+try:
+    import ctypes
+    import ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    if hasattr(libc, "inotify_init1"):
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    else:
+        libc = None
+except Exception:
+    libc = None
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ONLYDIR = 0x01000000
+IN_IGNORED = 0x00008000
+
+# changes to a file (or a package directory) that invalidate a kernel
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def watch_available():
+    return libc is not None and sys.platform.startswith("linux")
+
+
+# watches the kernel dependencies (module paths) of sessions w/ inotify and
+# calls on_change(key, path) from a background thread when one of them
+# changes (once, after which the key is no longer watched). modules that
+# aren't installed are watched by their name in their directory, installed
+# packages (and the standard library) by the name of their top level module
+# in the directory they are installed in (which is also where the package
+# metadata that an upgrade replaces lives)
+class DependencyWatcher:
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        # directory => watch descriptor, watch descriptor => directory
+        self.wds = dict()
+        self.dirs = dict()
+        # key => (directory => names)
+        self.keys = dict()
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def watch(self, key, paths):
+        targets = dict()
+        for path in paths:
+            dir, name = watch_target(path)
+            targets.setdefault(dir, set()).add(name)
+        with self.lock:
+            self.remove_key(key)
+            for dir in list(targets.keys()):
+                if dir not in self.wds:
+                    wd = libc.inotify_add_watch(self.fd, os.fsencode(dir), WATCH_MASK)
+                    if wd < 0:
+                        del targets[dir]
+                        continue
+                    self.wds[dir] = wd
+                    self.dirs[wd] = dir
+            self.keys[key] = targets
+        trace("watching {0} kernel dependency directories".format(len(targets)))
+
+    def unwatch(self, key):
+        with self.lock:
+            self.remove_key(key)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.keys = dict()
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+    # remove a key and the watches no other key needs (call w/ lock held)
+    def remove_key(self, key):
+        targets = self.keys.pop(key, None)
+        if not targets:
+            return
+        for dir in targets.keys():
+            if not any(dir in other for other in self.keys.values()):
+                wd = self.wds.pop(dir, None)
+                if wd is not None:
+                    self.dirs.pop(wd, None)
+                    libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self):
+        while not self.closed:
+            try:
+                readable, _, _ = select.select([self.fd], [], [], 1)
+                if not readable:
+                    continue
+                data = os.read(self.fd, 64 * 1024)
+            except (OSError, ValueError):
+                if self.closed:
+                    return
+                continue
+            changed = []
+            with self.lock:
+                offset = 0
+                while offset + EVENT_HEADER.size <= len(data):
+                    wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                    offset += EVENT_HEADER.size
+                    name = data[offset : offset + length].rstrip(b"\0")
+                    offset += length
+                    if mask & IN_IGNORED or wd not in self.dirs:
+                        continue
+                    dir = self.dirs[wd]
+                    name = os.fsdecode(name)
+                    for key, targets in list(self.keys.items()):
+                        if watch_match(targets.get(dir, ()), name):
+                            changed.append((key, os.path.join(dir, name)))
+                            self.remove_key(key)
+            for key, path in changed:
+                trace("kernel dependency changed: " + path)
+                try:
+                    self.on_change(key, path)
+                except Exception as e:
+                    trace("error handling kernel dependency change: " + str(e))
+
+
+# the directory and name to watch for a module path
+def watch_target(path):
+    from cache import INSTALLED_PACKAGE, installed_package
+
+    root = installed_package(path)
+    if root is None:
+        return os.path.dirname(path), os.path.basename(path)
+    parent = os.path.dirname(root) if INSTALLED_PACKAGE.match(path) else root
+    return parent, os.path.relpath(path, parent).split(os.sep)[0]
+
+
+# does a changed name match one of the watched names? (package metadata
+# directories, e.g. pandas-2.2.0.dist-info, match the package's module)
+def watch_match(names, name):
+    if name in names:
+        return True
+    stem = name.split("-")[0].lower()
+    return "-" in name and any(
+        watched.split(".")[0].lower() == stem for watched in names
+    )
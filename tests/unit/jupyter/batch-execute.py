@@ -0,0 +1,81 @@
+# Batches (the execute server's 'batch' command): several notebooks are
+# executed in order, re-using the kernel of the previous notebook when its
+# kernelspec matches, and each is reported as it completes. W/ streamed
+# cells, the messages are tagged w/ the index of their notebook.
+#
+# Usage: python batch-execute.py
+
+import os
+import sys
+import tempfile
+
+from notebook_fixtures import (
+    ExecuteServer,
+    execute_options,
+    message_data,
+    read_notebook,
+    stdout,
+    write_notebook,
+)
+
+CELLS = [
+    "import os\nprint(os.getpid())",
+    ("markdown", "Some text."),
+    "print(1 + 1)",
+    "x = 1",
+]
+
+
+def batch_options(inputs):
+    options = execute_options(inputs[0])
+    del options["target"]
+    options["targets"] = [{"input": input} for input in inputs]
+    return options
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        inputs = [os.path.join(dir, name) for name in ["a.ipynb", "b.ipynb"]]
+        server = ExecuteServer(dir)
+        try:
+            # each notebook is written and reported as it completes
+            for input in inputs:
+                write_notebook(input, CELLS)
+            messages = server.request("batch", batch_options(inputs))
+            documents = message_data(messages, "document")
+            assert [doc["status"] for doc in documents] == ["ok", "ok"], messages
+            assert [doc["input"] for doc in documents] == inputs, documents
+            pids = []
+            for input in inputs:
+                nb = read_notebook(input)
+                assert stdout(nb.cells[2]) == "2\n", nb.cells[2]
+                pids.append(stdout(nb.cells[0]))
+            assert pids[0] == pids[1], "kernel not re-used for the next notebook"
+
+            # a failed notebook is reported and the batch continues
+            write_notebook(inputs[0], CELLS[:3] + ["raise ValueError('failed')"])
+            write_notebook(inputs[1], CELLS)
+            messages = server.request("batch", batch_options(inputs))
+            documents = message_data(messages, "document")
+            assert [doc["status"] for doc in documents] == ["error", "ok"], messages
+            assert "failed" in documents[0]["error"], documents[0]
+
+            # streamed cells are tagged w/ their notebook
+            for input in inputs:
+                write_notebook(input, CELLS)
+            options = batch_options(inputs)
+            options["stream-cells"] = True
+            messages = server.request("batch", options)
+            cells = message_data(messages, "cell")
+            assert [(cell["document"], cell["index"]) for cell in cells] == [
+                (document, index) for document in [0, 1] for index in range(4)
+            ], cells
+            notebooks = message_data(messages, "notebook")
+            assert [nb["document"] for nb in notebooks] == [0, 1], notebooks
+        finally:
+            server.close()
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+/*
+ * batch-execute.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// executing several notebooks w/ one execute server request (see
+// batch-execute.py)
+pythonScriptTest(
+  "jupyter execute server runs batches of notebooks",
+  "batch-execute.py",
+);
@@ -0,0 +1,78 @@
+# Changed inline expressions (native cache): when only the expressions of a
+# markdown cell changed, the code cells after it are served from the cache
+# and only the cells before it execute again (to rebuild the kernel state
+# the expressions are evaluated in).
+#
+# Usage: python cache-inline.py
+
+import os
+import sys
+import tempfile
+
+os.environ["QUARTO_JUPYTER_CACHE_BACKEND"] = "native"
+
+from notebook_fixtures import (
+    Status,
+    cell_stdout,
+    execute_options,
+    read_notebook,
+    write_notebook,
+)
+from notebook import KernelSession, notebook_execute
+
+CELLS = [
+    "open('runs.txt', 'a').write('a')\nx = 2",
+    ("markdown", "x is `{python} x`."),
+    "open('runs.txt', 'a').write('b')\nprint(x * 10)",
+]
+
+
+def render(input, cells):
+    write_notebook(input, cells)
+    status = Status()
+    session = KernelSession()
+    try:
+        notebook_execute(execute_options(input, cache=True), status, session)
+    finally:
+        session.close()
+    return status.text(), read_notebook(input)
+
+
+def runs(dir):
+    with open(os.path.join(dir, "runs.txt")) as file:
+        return file.read()
+
+
+def inline_results(nb):
+    return [
+        [expression["result"] for expression in cell.metadata["user_expressions"]]
+        for cell in nb.cells
+        if "user_expressions" in cell.metadata
+    ]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "inline.ipynb")
+
+        _, nb = render(input, CELLS)
+        assert cell_stdout(nb) == ["", "20\n"], cell_stdout(nb)
+        assert runs(dir) == "ab"
+
+        # the changed expression is evaluated and the cell after it served
+        changed = ("markdown", "x squared is `{python} x * x`.")
+        text, nb = render(input, [CELLS[0], changed, CELLS[2]])
+        assert "Serving 1 unchanged cells" in text, text
+        assert cell_stdout(nb) == ["", "20\n"], cell_stdout(nb)
+        assert "4" in str(inline_results(nb)), inline_results(nb)
+        assert runs(dir) == "aba", "served cell executed again"
+
+        # and the notebook is cached w/ it
+        text, nb = render(input, [CELLS[0], changed, CELLS[2]])
+        assert "Notebook read from cache" in text, text
+        assert runs(dir) == "aba"
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
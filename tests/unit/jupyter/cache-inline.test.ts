@@ -0,0 +1,14 @@
+/*
+ * cache-inline.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// serving the cells after changed inline expressions from the native cache
+// (see cache-inline.py)
+pythonScriptTest(
+  "jupyter cache serves the cells after changed inline expressions",
+  "cache-inline.py",
+);
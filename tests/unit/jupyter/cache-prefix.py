@@ -0,0 +1,107 @@
+# Serving cached prefixes (native cache w/ QUARTO_JUPYTER_DATAFLOW=1): after
+# an edit, the unchanged cells that the edited cells don't depend on
+# take their outputs from the cache rather than executing again, while the
+# ones they do depend on execute. Cells cached before a module the kernel
+# imported changed aren't served. Changed inline expressions only execute the
+# cells they depend on.
+#
+# Usage: python cache-prefix.py
+
+import os
+import sys
+import tempfile
+
+os.environ["QUARTO_JUPYTER_CACHE_BACKEND"] = "native"
+os.environ["QUARTO_JUPYTER_DATAFLOW"] = "1"
+
+from notebook_fixtures import (
+    Status,
+    cell_stdout,
+    execute_options,
+    read_notebook,
+    write_notebook,
+)
+from notebook import KernelSession, notebook_execute
+
+CELLS = [
+    "open('runs.txt', 'a').write('a')\na = 1",
+    "print(a)",
+    "open('runs.txt', 'a').write('c')\nc = 5",
+    "print(c * 2)",
+]
+
+
+def render(input, cells):
+    write_notebook(input, cells)
+    status = Status()
+    session = KernelSession()
+    try:
+        notebook_execute(execute_options(input, cache=True), status, session)
+    finally:
+        session.close()
+    return status.text(), read_notebook(input)
+
+
+# write a module (w/ a later modification time than its previous version)
+def write_module(dir, name, source):
+    path = os.path.join(dir, name + ".py")
+    mtime = os.path.getmtime(path) + 10 if os.path.exists(path) else None
+    with open(path, "w") as file:
+        file.write(source)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+
+def runs(dir):
+    with open(os.path.join(dir, "runs.txt")) as file:
+        return file.read()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "prefix.ipynb")
+
+        _, nb = render(input, CELLS)
+        assert cell_stdout(nb) == ["", "1\n", "", "10\n"], cell_stdout(nb)
+        assert runs(dir) == "ac"
+
+        # the cells the edited cell doesn't depend on are served
+        text, nb = render(input, CELLS[:3] + ["print(c * 3)"])
+        assert "Serving 2 unchanged cells" in text, text
+        assert cell_stdout(nb) == ["", "1\n", "", "15\n"], cell_stdout(nb)
+        assert [cell.execution_count for cell in nb.cells] == [1, 2, 3, 4]
+        assert runs(dir) == "acc", "served cells executed again"
+
+        # the ones it does depend on execute
+        text, nb = render(input, CELLS[:3] + ["print(a + c)"])
+        assert "Serving" not in text, text
+        assert cell_stdout(nb) == ["", "1\n", "", "6\n"], cell_stdout(nb)
+        assert runs(dir) == "accac", "cells weren't executed again"
+
+        # a changed inline expression only executes the cells it depends on
+        # (the code cells are cached by the renders above)
+        input = os.path.join(dir, "inline.ipynb")
+        text, nb = render(input, CELLS + [("markdown", "c is `{python} c`.")])
+        assert "Serving 2 unchanged cells" in text, text
+        assert runs(dir) == "accacc", runs(dir)
+        text, nb = render(input, CELLS + [("markdown", "c is `{python} c + 1`.")])
+        assert "Serving 2 unchanged cells" in text, text
+        assert cell_stdout(nb) == ["", "1\n", "", "10\n"], cell_stdout(nb)
+        assert "6" in str(nb.cells[-1].metadata["user_expressions"])
+        assert runs(dir) == "accaccc", "served cells executed again"
+
+        # cells cached before a module changed aren't served
+        input = os.path.join(dir, "environment.ipynb")
+        write_module(dir, "helper", "A = 1\n")
+        cells = ["import helper\na = helper.A", "print(a)", "c = 5"]
+        _, nb = render(input, cells + ["print(c * 2)"])
+        assert cell_stdout(nb) == ["", "1\n", "", "10\n"], cell_stdout(nb)
+        write_module(dir, "helper", "A = 2\n")
+        text, nb = render(input, cells + ["print(c * 3)"])
+        assert "Serving" not in text, text
+        assert cell_stdout(nb) == ["", "2\n", "", "15\n"], cell_stdout(nb)
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+/*
+ * cache-prefix.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// serving the outputs of unchanged leading cells from the native cache
+// (see cache-prefix.py)
+pythonScriptTest(
+  "jupyter cache serves unchanged cells that edited cells don't depend on",
+  "cache-prefix.py",
+);
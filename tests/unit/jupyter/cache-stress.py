@@ -0,0 +1,120 @@
+# Multi-process stress test for the native Jupyter cache (cache.py): worker
+# processes share one cache directory, concurrently writing, reading, and
+# evicting (with a size limit small enough to force constant eviction).
+# Every entry that is read must be complete and correct (w/ the environment
+# of one of the workers), and afterwards the database and blob store must be
+# consistent.
+#
+# Usage: python cache-stress.py [--workers 8] [--iterations 50]
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "..",
+        "src",
+        "resources",
+        "jupyter",
+    ),
+)
+
+from cache import CellCache
+
+KEYS = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(64)]
+
+
+def entry(key):
+    return {"outputs": [{"output_type": "stream", "name": "stdout", "text": key * 200}]}
+
+
+def environment(seed):
+    return {"paths": ["/env/" + str(seed)], "hash": str(seed)}
+
+
+def worker(dir, iterations, seed, workers, max_bytes):
+    rng = random.Random(seed)
+    cache = CellCache(dir)
+    environments = [environment(seed) for seed in range(workers)]
+    for _ in range(iterations):
+        keys = rng.sample(KEYS, 6)
+        cache.put_cells([(key, entry(key)) for key in keys], environment(seed))
+        cache.put_notebook(keys[-1], {"metadata": {"key": keys[-1]}})
+
+        lookup = rng.sample(KEYS, 12)
+        for key, value in cache.get_cells(lookup).items():
+            assert key in lookup, "unexpected key"
+            assert value.pop("environment") in environments, "missing environment"
+            assert value == entry(key), "corrupt entry for " + key
+        for key in lookup:
+            notebook = cache.get_notebook(key)
+            assert notebook is None or notebook["metadata"]["key"] == key
+
+        cache.record_lookup(rng.random() < 0.5)
+        cache.evict(max_bytes)
+    cache.close()
+
+
+def check(dir, workers, iterations):
+    db = sqlite3.connect(os.path.join(dir, "cells.db"))
+    assert db.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    blobs = dict(db.execute("SELECT blob, size FROM blobs"))
+    environments = set(id for (id,) in db.execute("SELECT id FROM environments"))
+    for key, blob, environment in db.execute(
+        "SELECT key, blob, environment FROM cells"
+    ):
+        assert blob in blobs, "cell without blob record"
+        assert environment in environments, "cell without environment record"
+        path = os.path.join(dir, "blobs", blob[:2], blob + ".json")
+        assert os.path.getsize(path) == blobs[blob], "blob missing or wrong size"
+    for root, _, files in os.walk(os.path.join(dir, "blobs")):
+        for file in files:
+            assert not file.endswith(".tmp"), "leftover temporary file"
+    stats = dict(db.execute("SELECT name, value FROM stats"))
+    lookups = stats.get("hits", 0) + stats.get("misses", 0)
+    assert lookups == workers * iterations, "lost statistics updates"
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as dir:
+        # room for about a third of the keys
+        max_bytes = len(KEYS) // 3 * len(KEYS[0]) * 200
+        processes = [
+            context.Process(
+                target=worker,
+                args=(dir, args.iterations, seed, args.workers, max_bytes),
+            )
+            for seed in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        failed = [p.exitcode for p in processes if p.exitcode != 0]
+        if failed:
+            sys.exit(f"{len(failed)} worker(s) failed")
+        stats = check(dir, args.workers, args.iterations)
+    print(
+        f"ok ({args.workers} workers, {args.iterations} iterations, {stats.get('evictions', 0)} evictions)"
+    )
+
+
+if __name__ == "__main__":
+    main()
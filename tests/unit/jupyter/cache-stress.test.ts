@@ -0,0 +1,15 @@
+/*
+ * cache-stress.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// several processes sharing one native jupyter cache directory (see
+// cache-stress.py for the checks made)
+pythonScriptTest(
+  "jupyter cache is safe to share between processes",
+  "cache-stress.py",
+  ["--workers", "8", "--iterations", "40"],
+);
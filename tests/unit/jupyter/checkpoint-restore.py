@@ -0,0 +1,120 @@
+# Kernel checkpoints (native cache): a render resumes from the checkpoint of
+# an unchanged cell, and a checkpoint that can't be restored (here a
+# truncated pickle) is treated as a cache miss: it is removed from the cache
+# and every cell is executed again, as is a checkpoint taken before a module
+# the kernel imported changed. Cells whose options aren't a mapping are
+# executed w/o a checkpoint.
+#
+# Usage: python checkpoint-restore.py
+
+import os
+import sys
+import pickle
+import tempfile
+
+os.environ["QUARTO_JUPYTER_CACHE_BACKEND"] = "native"
+
+from notebook_fixtures import (
+    Status,
+    cell_stdout,
+    execute_options,
+    read_notebook,
+    write_notebook,
+)
+from notebook import KernelSession, notebook_execute
+
+CELLS = [
+    "with open('runs.txt', 'a') as f:\n    f.write('x')\ndel f\nx = 20",
+    "#| checkpoint: true\ny = x + 1",
+    "print(y * 2)",
+]
+
+
+def render(input, cells):
+    write_notebook(input, cells)
+    status = Status()
+    session = KernelSession()
+    try:
+        notebook_execute(execute_options(input, cache=True), status, session)
+    finally:
+        session.close()
+    return status.text(), read_notebook(input)
+
+
+# write a module (w/ a later modification time than its previous version)
+def write_module(dir, name, source):
+    path = os.path.join(dir, name + ".py")
+    mtime = os.path.getmtime(path) + 10 if os.path.exists(path) else None
+    with open(path, "w") as file:
+        file.write(source)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+
+def runs(dir):
+    with open(os.path.join(dir, "runs.txt")) as file:
+        return len(file.read())
+
+
+def checkpoints(dir):
+    from cache import CellCache
+
+    cache = CellCache(os.path.join(dir, ".jupyter_cache"))
+    try:
+        rows = cache.db.execute("SELECT key FROM checkpoints").fetchall()
+        return [cache.checkpoint_path(key) for (key,) in rows]
+    finally:
+        cache.close()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "checkpoint.ipynb")
+
+        # the first render saves a checkpoint after the second cell
+        _, nb = render(input, CELLS)
+        assert cell_stdout(nb) == ["", "", "42\n"], cell_stdout(nb)
+        saved = checkpoints(dir)
+        assert len(saved) == 1 and os.path.exists(saved[0]), "checkpoint not saved"
+        assert runs(dir) == 1
+
+        # a change after the checkpoint resumes from it
+        text, nb = render(input, CELLS[:2] + ["print(y * 3)"])
+        assert "Resuming from checkpoint" in text, text
+        assert cell_stdout(nb) == ["", "", "63\n"], cell_stdout(nb)
+        assert runs(dir) == 1, "cells before the checkpoint executed again"
+
+        # a truncated checkpoint is a cache miss (all cells execute again)
+        with open(saved[0], "r+b") as file:
+            file.truncate(os.path.getsize(saved[0]) // 2)
+        text, nb = render(input, CELLS[:2] + ["print(y * 4)"])
+        assert "Resuming from checkpoint" not in text, text
+        assert cell_stdout(nb) == ["", "", "84\n"], cell_stdout(nb)
+        assert runs(dir) == 2, "cells before the checkpoint weren't executed again"
+
+        # and the checkpoint is saved again
+        saved = checkpoints(dir)
+        assert len(saved) == 1, "checkpoint not saved"
+        with open(saved[0], "rb") as file:
+            pickle.load(file)
+
+        # a checkpoint from before a module changed isn't resumed from
+        input = os.path.join(dir, "environment.ipynb")
+        write_module(dir, "helper", "X = 1\n")
+        cells = ["import helper\nx = helper.X", "#| checkpoint: true\ny = x + 1"]
+        _, nb = render(input, cells + ["print(y)"])
+        assert cell_stdout(nb) == ["", "", "2\n"], cell_stdout(nb)
+        write_module(dir, "helper", "X = 2\n")
+        text, nb = render(input, cells + ["print(y * 2)"])
+        assert "Resuming from checkpoint" not in text, text
+        assert cell_stdout(nb) == ["", "", "6\n"], cell_stdout(nb)
+
+        # options that aren't a mapping aren't checkpoints
+        input = os.path.join(dir, "options.ipynb")
+        _, nb = render(input, ["#| echo\nprint(1)", "print(2)"])
+        assert cell_stdout(nb) == ["1\n", "2\n"], cell_stdout(nb)
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
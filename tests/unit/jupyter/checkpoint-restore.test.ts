@@ -0,0 +1,14 @@
+/*
+ * checkpoint-restore.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// resuming from kernel checkpoints, and re-executing every cell when a
+// checkpoint can't be restored (see checkpoint-restore.py)
+pythonScriptTest(
+  "jupyter checkpoints that can't be restored are cache misses",
+  "checkpoint-restore.py",
+);
@@ -0,0 +1,157 @@
+# Selective re-execution (dataflow.py and nb_dataflow_plan): the names each
+# cell reads and writes, the cells that execute when some of them change,
+# and the conservative fallback to executing every cell.
+#
+# Usage: python dataflow-plan.py
+
+import os
+import unittest
+
+os.environ["QUARTO_JUPYTER_DATAFLOW"] = "1"
+
+import nbformat
+from notebook_fixtures import KERNELSPEC
+from dataflow import cell_names, dataflow_cells
+from notebook import KernelSession, nb_dataflow_plan, nb_dataflow_record
+
+INPUT = "/project/dataflow.ipynb"
+
+
+# a notebook (w/ a setup cell) from cell sources, ("markdown", text) for
+# markdown cells
+def make_notebook(cells, setup="# setup"):
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = dict(KERNELSPEC)
+    nb.cells.append(nbformat.v4.new_code_cell(setup))
+    for cell in cells:
+        if isinstance(cell, tuple):
+            nb.cells.append(nbformat.v4.new_markdown_cell(cell[1]))
+        else:
+            nb.cells.append(nbformat.v4.new_code_cell(cell))
+    return nb
+
+
+# the cells (indexes w/o the setup cell) to execute after editing cells
+def plan(before, after, **kwargs):
+    session = KernelSession()
+    session.dataflow = nb_dataflow_record(make_notebook(before), INPUT)
+    execute = nb_dataflow_plan(session, make_notebook(after, **kwargs), INPUT)
+    return None if execute is None else sorted(index - 1 for index in execute)
+
+
+class CellNamesTest(unittest.TestCase):
+    def names(self, source):
+        uses, defs, imports, calls = cell_names(source)
+        return dict(uses=uses, defs=defs, imports=imports, calls=calls)
+
+    def test_defs_and_uses(self):
+        names = self.names("x = y + 1\nprint(x)")
+        self.assertEqual(names["defs"], {"x"})
+        self.assertEqual(names["uses"], {"x", "y", "print"})
+
+    def test_function_locals(self):
+        names = self.names("def f(a):\n    b = a + c\n    return b\n")
+        self.assertEqual(names["defs"], {"f"})
+        self.assertIn("c", names["uses"])
+        self.assertNotIn("b", names["defs"])
+
+    def test_attribute_and_subscript_stores(self):
+        names = self.names("df.x = 1\nconfig['key'] = 2\ntotal += 3")
+        self.assertEqual(names["defs"], {"df", "config", "total"})
+        self.assertTrue({"df", "config", "total"} <= names["uses"])
+
+    def test_method_calls(self):
+        names = self.names("items.append(1)\ndef f():\n    other.clear()\n")
+        self.assertEqual(names["calls"], {"items"})
+        self.assertTrue({"items", "other"} <= names["uses"])
+
+    def test_global(self):
+        names = self.names("def f():\n    global g\n    g = 1\n")
+        self.assertEqual(names["defs"], {"f", "g"})
+
+    def test_del(self):
+        self.assertEqual(self.names("del x")["defs"], {"x"})
+
+    def test_imports(self):
+        names = self.names("import numpy as np\nimport os.path\nfrom math import pi")
+        self.assertEqual(names["imports"], {"np", "os", "pi"})
+        self.assertEqual(names["defs"], set())
+
+    def test_opaque_cells(self):
+        for source in [
+            "%matplotlib inline",
+            "!ls",
+            "len?",
+            "from math import *",
+            "exec('x = 1')",
+            "eval('x')",
+            "globals()['x'] = 1",
+            "x = (",
+        ]:
+            self.assertIsNone(cell_names(source), source)
+
+
+class DataflowCellsTest(unittest.TestCase):
+    def test_later_readers(self):
+        cells = [cell_names(s) for s in ["a = 1", "b = a + 1", "c = 5", "print(b)"]]
+        self.assertEqual(dataflow_cells(cells, {0}), {0, 1, 3})
+
+    def test_earlier_writers(self):
+        # the cell that builds a value executes again before it is mutated
+        cells = [cell_names(s) for s in ["a = []", "a.append(1)", "print(a)"]]
+        self.assertEqual(dataflow_cells(cells, {1}), {0, 1, 2})
+
+    def test_unrelated_cells(self):
+        cells = [cell_names(s) for s in ["import os", "x = os.getcwd()", "y = 2"]]
+        self.assertEqual(dataflow_cells(cells, {1}), {0, 1})
+
+
+class DataflowPlanTest(unittest.TestCase):
+    CELLS = [
+        "a = 1",
+        "b = a + 1",
+        "c = 5",
+        ("markdown", "text"),
+        "print(b)",
+        "print(c)",
+    ]
+
+    def test_unchanged(self):
+        self.assertEqual(plan(self.CELLS, self.CELLS), [])
+
+    def test_changed_cell(self):
+        after = ["a = 2"] + self.CELLS[1:]
+        self.assertEqual(plan(self.CELLS, after), [0, 1, 4])
+
+    def test_removed_name(self):
+        # readers of a name the previous version of a cell defined execute
+        # again too
+        after = self.CELLS[:2] + ["d = 5"] + self.CELLS[3:]
+        self.assertEqual(plan(self.CELLS, after), [2, 5])
+
+    def test_attribute_mutation(self):
+        before = ["obj = make()", "obj.size = 1", "print(obj.size)", "z = 1"]
+        after = ["obj = make()", "obj.size = 2", "print(obj.size)", "z = 1"]
+        self.assertEqual(plan(before, after), [0, 1, 2])
+
+    def test_global_and_del(self):
+        before = ["def f():\n    global g\n    g = 1", "f()", "print(g)", "del g"]
+        after = ["def f():\n    global g\n    g = 2"] + before[1:]
+        self.assertEqual(plan(before, after), [0, 1, 2, 3])
+
+    def test_fallback(self):
+        # anything that can't be analysed executes every cell
+        self.assertIsNone(plan(self.CELLS, self.CELLS + ["x = 1"]))
+        self.assertIsNone(plan(self.CELLS, ["%time a = 1"] + self.CELLS[1:]))
+        self.assertIsNone(plan(self.CELLS, self.CELLS, setup="# other setup"))
+        self.assertIsNone(plan(self.CELLS, [("markdown", "a = 1")] + self.CELLS[1:]))
+
+    def test_other_input(self):
+        session = KernelSession()
+        session.dataflow = nb_dataflow_record(make_notebook(self.CELLS), INPUT)
+        other = "/project/other.ipynb"
+        self.assertIsNone(nb_dataflow_plan(session, make_notebook(self.CELLS), other))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,14 @@
+/*
+ * dataflow-plan.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// the cells that selective re-execution runs after edits (see
+// dataflow-plan.py)
+pythonScriptTest(
+  "jupyter dataflow plans re-execute affected cells",
+  "dataflow-plan.py",
+);
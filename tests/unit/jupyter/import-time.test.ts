@@ -0,0 +1,61 @@
+/*
+ * import-time.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { unitTest } from "../../test.ts";
+import { assert } from "testing/asserts";
+import { execProcess } from "../../../src/core/process.ts";
+import { pythonExec } from "../../../src/core/jupyter/exec.ts";
+import { resourcePath } from "../../../src/core/resources.ts";
+
+// cumulative import time budgets (in microseconds) for the modules that
+// every jupyter.py invocation imports. these are generous on purpose: the
+// test is meant to catch new eager imports, not to benchmark the machine
+const kJupyterBudget = 150000;
+const kNotebookBudget = 1500000;
+
+// parse `python -X importtime` output into module => cumulative time
+async function importTimes(module: string) {
+  const python = await pythonExec();
+  const result = await execProcess({
+    cmd: python[0],
+    args: [...python.slice(1), "-X", "importtime", "-c", `import ${module}`],
+    cwd: resourcePath("jupyter"),
+    stderr: "piped",
+  });
+  assert(result.success, result.stderr);
+  const times = new Map<string, number>();
+  for (const line of (result.stderr || "").split("\n")) {
+    const match = line.match(/^import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(.*)$/);
+    if (match) {
+      times.set(match[2].trim(), Number(match[1]));
+    }
+  }
+  return times;
+}
+
+unitTest("jupyter.py defers notebook execution imports", async () => {
+  const times = await importTimes("jupyter");
+  for (const module of ["notebook", "nbformat", "nbclient", "yaml"]) {
+    assert(!times.has(module), `jupyter.py eagerly imports ${module}`);
+  }
+  const total = times.get("jupyter") || 0;
+  assert(
+    total < kJupyterBudget,
+    `jupyter.py import time ${total}us exceeds budget of ${kJupyterBudget}us`,
+  );
+});
+
+unitTest("notebook.py defers optional subsystem imports", async () => {
+  const times = await importTimes("notebook");
+  for (const module of ["papermill", "jupyter_cache", "sqlalchemy"]) {
+    assert(!times.has(module), `notebook.py eagerly imports ${module}`);
+  }
+  const total = times.get("notebook") || 0;
+  assert(
+    total < kNotebookBudget,
+    `notebook.py import time ${total}us exceeds budget of ${kNotebookBudget}us`,
+  );
+});
@@ -0,0 +1,160 @@
+# The execute server's kernel sessions (sessions.py): idle sessions are
+# re-used by input and kernelspec and evicted least recently used first (by
+# count or kernel memory), busy sessions can be rebound to another input w/
+# the same kernelspec, and the default session is only shared when requests
+# aren't concurrent. Kernels are stood in for by clients that record their
+# shutdown.
+#
+# Usage: python kernel-sessions.py
+
+import unittest
+
+from notebook_fixtures import KERNELSPEC
+import sessions
+from sessions import KernelSessionCache
+from notebook import default_session
+
+
+class KernelClient:
+    def __init__(self, input):
+        self.resources = {"metadata": {"input": input}}
+        self.km = None
+        self.closed = False
+
+    def _cleanup_kernel(self):
+        self.closed = True
+
+
+def options(input, kernelspec=KERNELSPEC):
+    return {"target": {"input": input}, "kernelspec": dict(kernelspec)}
+
+
+class KernelSessionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.kernel_rss = sessions.kernel_rss
+        self.clients = []
+
+    def tearDown(self):
+        sessions.kernel_rss = self.kernel_rss
+        default_session.close()
+
+    # acquire a session for an input, starting its 'kernel' if need be
+    def acquire(self, cache, input, **kwargs):
+        session = cache.acquire(options(input, **kwargs))
+        if not session.client:
+            session.client = KernelClient(input)
+            self.clients.append(session.client)
+        return session
+
+    def render(self, cache, input, **kwargs):
+        session = self.acquire(cache, input, **kwargs)
+        cache.release(session)
+        return session
+
+    def idle_inputs(self, cache):
+        return [key[0] for key, _ in cache.idle]
+
+    def test_reuse(self):
+        cache = KernelSessionCache(2)
+        session = self.render(cache, "a.ipynb")
+        self.assertIs(session, default_session)
+        client = session.client
+        self.assertIs(self.render(cache, "a.ipynb").client, client)
+        self.assertFalse(client.closed)
+
+    def test_least_recently_used(self):
+        cache = KernelSessionCache(2)
+        a = self.render(cache, "a.ipynb").client
+        b = self.render(cache, "b.ipynb").client
+        self.render(cache, "a.ipynb")
+        c = self.render(cache, "c.ipynb").client
+        self.assertEqual(self.idle_inputs(cache), ["a.ipynb", "c.ipynb"])
+        self.assertTrue(b.closed)
+        self.assertFalse(a.closed or c.closed)
+
+    def test_kernelspec_key(self):
+        cache = KernelSessionCache(2)
+        python = self.render(cache, "a.ipynb")
+        other = self.render(cache, "a.ipynb", kernelspec=dict(KERNELSPEC, name="py2"))
+        self.assertIsNot(python.client, other.client)
+        self.assertEqual(len(cache.idle), 2)
+
+    def test_default_session(self):
+        # concurrent requests get sessions of their own
+        cache = KernelSessionCache(2)
+        a = self.acquire(cache, "a.ipynb")
+        b = self.acquire(cache, "b.ipynb")
+        self.assertIs(a, default_session)
+        self.assertIsNot(b, default_session)
+        self.assertFalse(b.isolated)
+
+        isolated = KernelSessionCache(2, isolated=True)
+        session = self.acquire(isolated, "c.ipynb")
+        self.assertIsNot(session, default_session)
+        self.assertTrue(session.isolated)
+        isolated.close()
+        cache.close()
+
+    def test_memory_limit(self):
+        # idle sessions are evicted until the kernels fit (the most recently
+        # used one is always kept)
+        def kernel_rss(session):
+            return 600
+
+        sessions.kernel_rss = kernel_rss
+        cache = KernelSessionCache(4, max_rss=1000)
+        self.render(cache, "a.ipynb")
+        self.render(cache, "b.ipynb")
+        self.assertEqual(self.idle_inputs(cache), ["b.ipynb"])
+
+    def test_rebind(self):
+        cache = KernelSessionCache(2)
+        session = self.acquire(cache, "a.ipynb")
+        client = session.client
+        session.setup_fingerprint = "setup"
+        self.assertTrue(cache.rebind(session, options("b.ipynb")))
+        self.assertIs(session.client, client)
+        self.assertTrue(session.standby)
+        self.assertIsNone(session.setup_fingerprint)
+        cache.release(session)
+        self.assertEqual(self.idle_inputs(cache), ["b.ipynb"])
+
+    def test_rebind_kernelspec(self):
+        cache = KernelSessionCache(2)
+        session = self.acquire(cache, "a.ipynb")
+        other = options("b.ipynb", kernelspec=dict(KERNELSPEC, name="py2"))
+        self.assertFalse(cache.rebind(session, other))
+        cache.release(session)
+        self.assertEqual(self.idle_inputs(cache), ["a.ipynb"])
+
+    def test_release_without_kernel(self):
+        # sessions whose kernel failed to start aren't kept
+        cache = KernelSessionCache(2)
+        session = cache.acquire(options("a.ipynb"))
+        cache.release(session)
+        self.assertEqual(cache.idle, [])
+
+        # and their threads are stopped
+        isolated = KernelSessionCache(2, isolated=True)
+        session = isolated.acquire(options("b.ipynb"))
+        session.run(lambda: None)
+        thread = session.thread
+        isolated.release(session)
+        self.assertIsNone(session.thread)
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+    def test_discard_and_close(self):
+        cache = KernelSessionCache(2)
+        session = self.acquire(cache, "a.ipynb")
+        client = session.client
+        cache.discard(session)
+        self.assertTrue(client.closed)
+        self.assertIsNone(session.client)
+        self.render(cache, "b.ipynb")
+        cache.close()
+        self.assertTrue(all(client.closed for client in self.clients))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,14 @@
+/*
+ * kernel-sessions.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// re-use, eviction and rebinding of the execute server's kernel sessions
+// (see kernel-sessions.py)
+pythonScriptTest(
+  "jupyter kernel sessions are cached least recently used first",
+  "kernel-sessions.py",
+);
@@ -0,0 +1,76 @@
+# Reloading changed local modules (QUARTO_JUPYTER_RELOAD=1): a module next
+# to the document that changes between renders in the same kernel session
+# is reloaded in place (along w/ the local modules that hold values from
+# it) rather than the kernel being restarted, unless it can't be reloaded.
+#
+# Usage: python module-reload.py
+
+import os
+import sys
+import tempfile
+
+os.environ["QUARTO_JUPYTER_RELOAD"] = "1"
+
+from notebook_fixtures import (
+    Status,
+    cell_stdout,
+    execute_options,
+    read_notebook,
+    write_notebook,
+)
+from notebook import KernelSession, RestartKernel, notebook_execute
+
+CELLS = ["import total\nprint(total.TOTAL)"]
+
+
+def render(session, input):
+    write_notebook(input, CELLS)
+    status = Status()
+    notebook_execute(execute_options(input), status, session)
+    return status.text(), read_notebook(input)
+
+
+# write a module (w/ a later modification time than its previous version)
+def write_module(dir, name, source):
+    path = os.path.join(dir, name + ".py")
+    mtime = os.path.getmtime(path) + 10 if os.path.exists(path) else None
+    with open(path, "w") as file:
+        file.write(source)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "reload.ipynb")
+        write_module(dir, "helper", "VALUE = 1\n")
+        write_module(dir, "total", "from helper import VALUE\nTOTAL = VALUE * 10\n")
+
+        session = KernelSession()
+        try:
+            _, nb = render(session, input)
+            assert cell_stdout(nb) == ["10\n"], cell_stdout(nb)
+            client = session.client
+
+            # the changed module and the module that refers to it are reloaded
+            write_module(dir, "helper", "VALUE = 2\n")
+            text, nb = render(session, input)
+            assert "Reloaded changed modules: helper, total" in text, text
+            assert cell_stdout(nb) == ["20\n"], cell_stdout(nb)
+            assert session.client is client, "kernel restarted"
+
+            # a module that can't be reloaded restarts the kernel
+            write_module(dir, "helper", "VALUE = (\n")
+            try:
+                render(session, input)
+            except RestartKernel:
+                pass
+            else:
+                raise AssertionError("kernel not restarted")
+        finally:
+            session.close()
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
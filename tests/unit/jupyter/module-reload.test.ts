@@ -0,0 +1,13 @@
+/*
+ * module-reload.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// reloading changed local modules in a live kernel (see module-reload.py)
+pythonScriptTest(
+  "jupyter reloads changed local modules in place",
+  "module-reload.py",
+);
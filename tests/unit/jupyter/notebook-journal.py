@@ -0,0 +1,166 @@
+# Notebook journals (QUARTO_JUPYTER_JOURNAL=1): a render that fails part way
+# through resumes in the same kernel session from a checkpoint (native cache)
+# saved among its journaled cells, w/ the kernel reset first, unless a
+# journaled cell changed. A render that fails after its journal is complete
+# re-uses the journal unless the kernel environment changed. Journals are
+# kept out of the input's directory and removed once the render succeeds (or
+# the kernel shuts down, if they aren't complete).
+#
+# Usage: python notebook-journal.py
+
+import os
+import sys
+import tempfile
+
+os.environ["QUARTO_JUPYTER_JOURNAL"] = "1"
+os.environ["QUARTO_JUPYTER_CACHE_BACKEND"] = "native"
+
+from notebook_fixtures import (
+    Status,
+    cell_stdout,
+    execute_options,
+    read_notebook,
+    write_notebook,
+)
+from nbclient.exceptions import CellExecutionError
+import notebook
+from notebook import KernelSession, notebook_execute
+from journal import journal_path
+
+# (the failing cell leaves a value behind that a resumed render must not see)
+CELLS = [
+    "with open('runs.txt', 'a') as f:\n    f.write('x')\ndel f\na = 1",
+    ("markdown", "Some text."),
+    "#| checkpoint: true\nb = a + 1\nprint(b)",
+    "b = 100\nraise ValueError('failed')",
+]
+
+
+def render(session, input, cells, cache=True):
+    write_notebook(input, cells)
+    status = Status()
+    notebook_execute(execute_options(input, cache), status, session)
+    return status.text(), read_notebook(input)
+
+
+def render_failure(session, input, cells, cache=True):
+    try:
+        render(session, input, cells, cache)
+    except CellExecutionError:
+        assert os.path.exists(journal_path(input)), "journal not written"
+        return
+    raise AssertionError("render didn't fail")
+
+
+# render w/ a failure writing the notebook (after the journal is complete)
+def render_write_failure(input, cells):
+    def nb_write(nb, input, cells_json=None):
+        raise OSError("unable to write")
+
+    session = KernelSession()
+    write = notebook.nb_write
+    notebook.nb_write = nb_write
+    try:
+        render(session, input, cells, cache=False)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("render didn't fail")
+    finally:
+        notebook.nb_write = write
+        session.close()
+    assert os.path.exists(journal_path(input)), "complete journal not kept"
+
+
+# write a module (w/ a later modification time than its previous version)
+def write_module(dir, name, source):
+    path = os.path.join(dir, name + ".py")
+    mtime = os.path.getmtime(path) + 10 if os.path.exists(path) else None
+    with open(path, "w") as file:
+        file.write(source)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+
+def runs(dir):
+    with open(os.path.join(dir, "runs.txt")) as file:
+        return len(file.read())
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        os.environ["JUPYTER_RUNTIME_DIR"] = os.path.join(dir, "runtime")
+        input = os.path.join(dir, "journal.ipynb")
+        fixed = CELLS[:3] + ["print(b * 10)"]
+
+        session = KernelSession()
+        try:
+            # a fixed cell resumes from the journaled checkpoint (w/o what
+            # the failed cell left in the kernel)
+            render_failure(session, input, CELLS)
+            text, nb = render(session, input, fixed)
+            assert "Resuming from checkpoint" in text, text
+            assert cell_stdout(nb) == ["", "2\n", "20\n"], cell_stdout(nb)
+            assert runs(dir) == 1, "journaled cells executed again"
+            assert not os.path.exists(journal_path(input)), "journal not removed"
+
+            # a changed journaled cell executes every cell again
+            render_failure(session, input, CELLS)
+            changed = "#| checkpoint: true\nb = a + 2\nprint(b)"
+            text, nb = render(session, input, CELLS[:2] + [changed, fixed[3]])
+            assert "Resuming" not in text, text
+            assert cell_stdout(nb) == ["", "3\n", "30\n"], cell_stdout(nb)
+            assert runs(dir) == 2, "cells weren't executed again"
+
+            # w/o a checkpoint (or the cache) every cell executes again
+            render_failure(session, input, CELLS, cache=False)
+            text, nb = render(session, input, fixed, cache=False)
+            assert "Resuming" not in text, text
+            assert cell_stdout(nb) == ["", "2\n", "20\n"], cell_stdout(nb)
+            assert runs(dir) == 4, "cells weren't executed again"
+
+            # a partial journal is removed w/ its kernel
+            render_failure(session, input, CELLS)
+        finally:
+            session.close()
+        assert not os.path.exists(journal_path(input)), "journal not removed"
+
+        # a complete journal is re-used (by another kernel session)
+        input = os.path.join(dir, "complete.ipynb")
+        write_module(dir, "helper", "X = 1\n")
+        cells = ["import helper\nprint(helper.X)"]
+        render_write_failure(input, cells)
+        session = KernelSession()
+        try:
+            text, nb = render(session, input, cells, cache=False)
+        finally:
+            session.close()
+        assert "Notebook read from journal" in text, text
+        assert cell_stdout(nb) == ["1\n"], cell_stdout(nb)
+        assert not os.path.exists(journal_path(input)), "journal not removed"
+
+        # unless a module the kernel imported changed
+        render_write_failure(input, cells)
+        write_module(dir, "helper", "X = 2\n")
+        session = KernelSession()
+        try:
+            text, nb = render(session, input, cells, cache=False)
+        finally:
+            session.close()
+        assert "Notebook read from journal" not in text, text
+        assert cell_stdout(nb) == ["2\n"], cell_stdout(nb)
+
+        # (and nothing is left next to the input but the cache)
+        assert sorted(os.listdir(dir)) == [
+            ".jupyter_cache",
+            "complete.ipynb",
+            "helper.py",
+            "journal.ipynb",
+            "runs.txt",
+            "runtime",
+        ], os.listdir(dir)
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
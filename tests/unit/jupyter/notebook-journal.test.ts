@@ -0,0 +1,14 @@
+/*
+ * notebook-journal.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// resuming a failed render after its journaled cells, and keeping journals
+// out of the input's directory (see notebook-journal.py)
+pythonScriptTest(
+  "jupyter renders resume from their journal",
+  "notebook-journal.py",
+);
@@ -0,0 +1,61 @@
+# Reading notebooks to execute them (nbreader.py): the reader matches
+# nbformat.read w/o the outputs and execution counts of code cells, however
+# the file is split into chunks, and reports malformed json.
+#
+# Usage: python notebook-read.py
+
+import os
+import tempfile
+import unittest
+
+import nbformat
+from notebook_fixtures import output_notebook
+import nbreader
+from nbreader import read_notebook
+
+
+# the notebook as nbformat reads it, w/o outputs or execution counts
+def without_outputs(nb):
+    for cell in nb.cells:
+        if cell.cell_type == "code":
+            cell.outputs = []
+            cell.execution_count = None
+    return nb
+
+
+class NotebookReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "read.ipynb")
+        self.chunk_size = nbreader.CHUNK_SIZE
+
+    def tearDown(self):
+        nbreader.CHUNK_SIZE = self.chunk_size
+        self.dir.cleanup()
+
+    def test_matches_nbformat(self):
+        nbformat.write(output_notebook(), self.path)
+        expected = without_outputs(nbformat.read(self.path, as_version=4))
+        # (small chunks split strings, escapes and primitives)
+        for chunk_size in [1, 2, 3, 7, 64, nbreader.CHUNK_SIZE]:
+            nbreader.CHUNK_SIZE = chunk_size
+            self.assertEqual(read_notebook(self.path, 4), expected, chunk_size)
+
+    def test_compact_json(self):
+        nb = output_notebook()
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(nbformat.writes(nb, indent=None, separators=(",", ":")))
+        nbreader.CHUNK_SIZE = 5
+        expected = without_outputs(nbformat.read(self.path, as_version=4))
+        self.assertEqual(read_notebook(self.path, 4), expected)
+
+    def test_invalid_json(self):
+        for text in ['{"cells": [', '{"cells": []} x', '{"cells" []}', ""]:
+            with open(self.path, "w", encoding="utf-8") as file:
+                file.write(text)
+            with self.assertRaises(ValueError, msg=text):
+                read_notebook(self.path, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,13 @@
+/*
+ * notebook-read.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// reading notebooks w/o their outputs (see notebook-read.py)
+pythonScriptTest(
+  "jupyter notebooks are read as nbformat reads them",
+  "notebook-read.py",
+);
@@ -0,0 +1,51 @@
+# Writing executed notebooks (nb_write): the compact writer reads back as
+# the same notebook as nbformat.write, including when the cells are written
+# from json encoded elsewhere (e.g. by a journal).
+#
+# Usage: python notebook-write.py
+
+import os
+import copy
+import json
+import tempfile
+import unittest
+
+import nbformat
+from nbformat.v4.rwbase import split_lines
+from notebook_fixtures import output_notebook
+from notebook import nb_write
+
+
+class NotebookWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_matches_nbformat(self):
+        expected_path = os.path.join(self.dir.name, "expected.ipynb")
+        path = os.path.join(self.dir.name, "written.ipynb")
+        nb = output_notebook()
+        nbformat.write(copy.deepcopy(nb), expected_path)
+        nb_write(nb, path)
+        self.assertEqual(
+            nbformat.read(path, as_version=4),
+            nbformat.read(expected_path, as_version=4),
+        )
+        # (one line of compact json)
+        with open(path, encoding="utf-8") as file:
+            self.assertEqual(len(file.read().splitlines()), 1)
+
+    def test_cells_json(self):
+        # cells can be written from json encoded elsewhere (e.g. a journal)
+        path = os.path.join(self.dir.name, "written.ipynb")
+        nb = output_notebook()
+        cells = copy.deepcopy(nb.cells)
+        cells_json = [json.dumps(cell) for cell in split_lines(copy.deepcopy(nb)).cells]
+        nb_write(nb, path, cells_json)
+        self.assertEqual(nbformat.read(path, as_version=4).cells, cells)
+
+
+if __name__ == "__main__":
+    unittest.main()
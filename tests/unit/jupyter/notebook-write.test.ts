@@ -0,0 +1,13 @@
+/*
+ * notebook-write.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// writing notebooks as compact json (see notebook-write.py)
+pythonScriptTest(
+  "jupyter notebooks are written as nbformat writes them",
+  "notebook-write.py",
+);
@@ -0,0 +1,159 @@
+# Shared setup for the Jupyter tests that execute notebooks (run by the
+# *.test.ts wrappers in this directory w/ the python that quarto uses): the
+# Quarto Jupyter modules are put on the path, and notebooks and execution
+# options are built as quarto would pass them to notebook_execute.
+
+import os
+import sys
+
+import nbformat
+
+RESOURCE_DIR = os.path.abspath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "src", "resources"
+    )
+)
+sys.path.insert(0, os.path.join(RESOURCE_DIR, "jupyter"))
+
+KERNELSPEC = {"name": "python3", "language": "python", "display_name": "Python 3"}
+
+
+# write a python notebook. cells are code sources, or ("markdown", text)
+def write_notebook(path, cells):
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = dict(KERNELSPEC)
+    for cell in cells:
+        if isinstance(cell, tuple):
+            nb.cells.append(nbformat.v4.new_markdown_cell(cell[1]))
+        else:
+            nb.cells.append(nbformat.v4.new_code_cell(cell))
+    nbformat.write(nb, path)
+
+
+# a notebook w/ outputs that exercise notebook reading and writing: escapes,
+# nested containers, brackets and quotes in strings, non-ascii text and
+# primitives
+def output_notebook():
+    nb = nbformat.v4.new_notebook()
+    nb.metadata.kernelspec = dict(KERNELSPEC)
+    nb.metadata["quarto"] = {"n": 1.5e3, "ok": True, "none": None, "list": []}
+    nb.cells.append(nbformat.v4.new_markdown_cell('# Title\n\nSome "quoted" {text}'))
+    cell = nbformat.v4.new_code_cell("x = [1, {'a': 2}]\nprint(x)", execution_count=1)
+    cell.outputs = [
+        nbformat.v4.new_output("stream", name="stdout", text="[1, {'a': 2}]\n"),
+        nbformat.v4.new_output(
+            "execute_result",
+            data={
+                "text/plain": 'a "quoted" \\ string ]}',
+                "application/json": {"nested": [[1, 2], {"k": "é中"}]},
+            },
+            execution_count=1,
+        ),
+        nbformat.v4.new_output(
+            "display_data", data={"image/png": "iVBORw0KGgo=" * 200}
+        ),
+    ]
+    nb.cells.append(cell)
+    nb.cells.append(nbformat.v4.new_code_cell("", execution_count=None))
+    nb.cells.append(nbformat.v4.new_raw_cell("raw \\ text\twith tab"))
+    return nb
+
+
+def read_notebook(path):
+    return nbformat.read(path, as_version=4)
+
+
+# the execution options for a notebook (cache is the 'execute: cache' option)
+def execute_options(input, cache=False):
+    return {
+        "target": {"input": input},
+        "resourceDir": RESOURCE_DIR,
+        "kernelspec": dict(KERNELSPEC),
+        "quiet": False,
+        "format": {
+            "execute": {
+                "eval": True,
+                "error": False,
+                "fig-width": 7,
+                "fig-height": 5,
+                "fig-format": "png",
+                "fig-dpi": 96,
+                "ipynb-shell-interactivity": None,
+                "plotly-connected": True,
+                "cache": cache,
+            },
+            "metadata": {},
+            "identifier": {"base-format": "html"},
+        },
+    }
+
+
+# collects the status messages of an execution
+class Status:
+    def __init__(self):
+        self.messages = []
+
+    def __call__(self, msg):
+        self.messages.append(msg)
+
+    def text(self):
+        return "".join(self.messages)
+
+
+# the stdout of the code cells of an executed notebook
+def cell_stdout(nb):
+    return [
+        "".join(
+            output.get("text", "")
+            for output in cell.outputs
+            if output.get("output_type") == "stream" and output.get("name") == "stdout"
+        )
+        for cell in nb.cells
+        if cell.cell_type == "code"
+    ]
+
+
+# an execute server (jupyter.py) listening on a unix domain socket in dir,
+# which handles requests on a thread until it is closed
+class ExecuteServer:
+    def __init__(self, dir):
+        import threading
+        from jupyter import execute_server
+
+        self.transport = os.path.join(dir, "server.sock")
+        self.server = execute_server(
+            {"type": "unix", "transport": self.transport, "timeout": 300}
+        )
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while not self.server.exit_pending:
+            self.server.handle_request()
+
+    # send a request and collect the messages sent back
+    def request(self, command, options):
+        import json
+        import socket
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(self.transport)
+            request = {"secret": "", "command": command, "options": options}
+            conn.sendall(bytearray(json.dumps(request) + "\n", "utf-8"))
+            return [json.loads(str(line, "utf-8")) for line in conn.makefile("rb")]
+
+    def close(self):
+        self.request("abort", {})
+        self.thread.join()
+        self.server.server_close()
+        self.server.sessions.close()
+
+
+# the data of the messages of a type
+def message_data(messages, type):
+    return [message["data"] for message in messages if message["type"] == type]
+
+
+# the stdout of a cell (as sent or written)
+def stdout(cell):
+    return "".join(output.get("text", "") for output in cell.get("outputs", []))
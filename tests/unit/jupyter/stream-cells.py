@@ -0,0 +1,61 @@
+# Streamed cells (the 'stream-cells' option of the execute server): the
+# executed cells are sent back over the socket as they complete, followed
+# by the notebook's metadata, rather than the notebook being written.
+#
+# Usage: python stream-cells.py
+
+import os
+import sys
+import tempfile
+
+from notebook_fixtures import (
+    ExecuteServer,
+    execute_options,
+    message_data,
+    read_notebook,
+    stdout,
+    write_notebook,
+)
+
+CELLS = [
+    "x = 1",
+    ("markdown", "Some text."),
+    "print(x + 1)",
+]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "stream.ipynb")
+        write_notebook(input, CELLS)
+        server = ExecuteServer(dir)
+        try:
+            options = execute_options(input)
+            options["stream-cells"] = True
+            messages = server.request("execute", options)
+        finally:
+            server.close()
+
+        # the cells in order (w/o the setup cell, counted from 1)
+        cells = message_data(messages, "cell")
+        assert [cell["index"] for cell in cells] == [0, 1, 2], cells
+        assert cells[0]["cell"]["execution_count"] == 1, cells[0]
+        assert cells[2]["cell"]["execution_count"] == 2, cells[2]
+        assert stdout(cells[2]["cell"]) == "2\n", cells[2]
+
+        # then the notebook
+        types = [message["type"] for message in messages]
+        assert types.index("notebook") > max(
+            i for i, type in enumerate(types) if type == "cell"
+        ), types
+        (nb,) = message_data(messages, "notebook")
+        assert nb["cells"] == 3 and "language_info" in nb["metadata"], nb
+
+        # which isn't written
+        nb = read_notebook(input)
+        assert stdout(nb.cells[2]) == "", "streamed notebook written"
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+/*
+ * stream-cells.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// executed cells streamed back over the execute server socket (see
+// stream-cells.py)
+pythonScriptTest(
+  "jupyter execute server streams executed cells",
+  "stream-cells.py",
+);
@@ -0,0 +1,41 @@
+/*
+ * utils.ts
+ *
+ * Test utilities for the Jupyter unit tests
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { unitTest } from "../../test.ts";
+import { assert } from "testing/asserts";
+import { execProcess } from "../../../src/core/process.ts";
+import { pythonExec } from "../../../src/core/jupyter/exec.ts";
+import { fromFileUrl } from "../../../src/deno_ral/path.ts";
+
+/**
+ * Register a unit test that runs one of the Python test scripts in this
+ * directory with the Python that Quarto uses for Jupyter. The scripts make
+ * their own checks and exit with an error (reported as the failure) if any
+ * of them fail.
+ *
+ * @param name - The name of the test
+ * @param script - The script's file name (relative to this directory)
+ * @param args - Arguments for the script
+ */
+export function pythonScriptTest(
+  name: string,
+  script: string,
+  args: string[] = [],
+) {
+  unitTest(name, async () => {
+    const python = await pythonExec();
+    const path = fromFileUrl(new URL(script, import.meta.url));
+    const result = await execProcess({
+      cmd: python[0],
+      args: [...python.slice(1), path, ...args],
+      stdout: "piped",
+      stderr: "piped",
+    });
+    assert(result.success, result.stderr);
+  });
+}
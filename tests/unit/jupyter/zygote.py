@@ -0,0 +1,126 @@
+# The zygote (QUARTO_JUPYTER_ZYGOTE): an 'execute' that finds no zygote
+# starts one and executes the notebook itself, later executions are
+# forwarded to the zygote, which forks a child for each of them, and the
+# zygote exits when it has been idle for its timeout or its socket is
+# removed.
+#
+# Usage: python zygote.py
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+from notebook_fixtures import (
+    RESOURCE_DIR,
+    cell_stdout,
+    execute_options,
+    read_notebook,
+    write_notebook,
+)
+
+JUPYTER = os.path.join(RESOURCE_DIR, "jupyter", "jupyter.py")
+
+# the pid of the process that executes the notebook (the kernel's parent)
+# and of that process's parent
+CELLS = [
+    "import os, subprocess\n"
+    "ppid = os.getppid()\n"
+    "out = subprocess.check_output(['ps', '-o', 'ppid=', '-p', str(ppid)])\n"
+    "print(ppid, int(out))",
+]
+
+
+def options(input, log):
+    options = execute_options(input)
+    options.update({"log": log, "debug": False, "quiet": True})
+    return options
+
+
+# execute a notebook w/ a oneshot 'execute' (as quarto does)
+def execute(input, log, env, cells=CELLS):
+    write_notebook(input, cells)
+    request = json.dumps({"command": "execute", "options": options(input, log)})
+    process = subprocess.Popen(
+        [sys.executable, JUPYTER],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+    )
+    _, stderr = process.communicate(request.encode("utf-8"))
+    return process.returncode, str(stderr, "utf-8"), process.pid
+
+
+# the pid that ran the notebook and its parent
+def executor(input):
+    return [int(pid) for pid in cell_stdout(read_notebook(input))[0].split()]
+
+
+def running(pid):
+    result = subprocess.run(["ps", "-o", "stat=", "-p", str(pid)], capture_output=True)
+    stat = str(result.stdout, "utf-8").strip()
+    return stat != "" and not stat.startswith("Z")
+
+
+def wait_for(condition, timeout=60):
+    start = time.monotonic()
+    while not condition():
+        if time.monotonic() - start > timeout:
+            raise AssertionError("timed out")
+        time.sleep(0.1)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as dir:
+        input = os.path.join(dir, "zygote.ipynb")
+        log = os.path.join(dir, "jupyter.log")
+        transport = os.path.join(dir, "zygote.sock")
+        env = dict(os.environ, QUARTO_JUPYTER_ZYGOTE=transport)
+
+        # w/o a zygote the notebook is executed directly (and one is started)
+        code, stderr, pid = execute(input, log, env)
+        assert code == 0, stderr
+        assert executor(input)[0] == pid, "not executed by the client"
+        wait_for(lambda: os.path.exists(transport))
+
+        # then executions are forwarded to the zygote, which forks for each
+        code, stderr, pid = execute(input, log, env)
+        assert code == 0, stderr
+        child, zygote = executor(input)
+        assert child not in (pid, zygote), "not executed by a forked child"
+        code, stderr, _ = execute(input, log, env)
+        assert code == 0, stderr
+        other_child, other_zygote = executor(input)
+        assert other_zygote == zygote and other_child != child
+
+        # errors are reported by the client
+        code, stderr, _ = execute(input, log, env, ["raise ValueError('failed')"])
+        assert code == 1 and "failed" in stderr, (code, stderr)
+
+        # the zygote exits when its socket is removed
+        os.remove(transport)
+        wait_for(lambda: not running(zygote))
+
+        # or when it has been idle for its timeout
+        zygote_options = dict(options(input, log), transport=transport, timeout=2)
+        process = subprocess.Popen(
+            [sys.executable, JUPYTER, "zygote"],
+            env=dict(env, QUARTO_JUPYTER_OPTIONS=json.dumps(zygote_options)),
+        )
+        try:
+            wait_for(lambda: os.path.exists(transport))
+            code, stderr, _ = execute(input, log, env)
+            assert code == 0, stderr
+            assert executor(input)[1] == process.pid, "not forwarded"
+            process.wait(timeout=30)
+            assert not os.path.exists(transport), "socket not removed"
+        finally:
+            if process.poll() is None:
+                process.kill()
+    print("ok")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+/*
+ * zygote.test.ts
+ *
+ * Copyright (C) 2026 Posit Software, PBC
+ */
+
+import { pythonScriptTest } from "./utils.ts";
+
+// forwarding oneshot executions to a zygote process (see zygote.py)
+pythonScriptTest("jupyter zygote executes forwarded notebooks", "zygote.py");